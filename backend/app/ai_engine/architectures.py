@@ -0,0 +1,96 @@
+from tensorflow.keras import Sequential, layers
+
+# Model architectures selectable with `train_model --architecture`.
+#
+#   baseline   original 3-conv CNN with a Flatten -> Dense(512) head (~44M params,
+#              almost all of them in the dense layer)
+#   gap        same conv stack, global-average-pooling head (~0.1M params)
+#   mobilenet  depthwise-separable blocks trained from scratch with a GAP head
+#              (~0.8M params, a fraction of the baseline FLOPs)
+#
+# All of them take (224, 224, 3) inputs in [0, 1] and end in a softmax, so any of
+# them can be served by inference.py unchanged.
+
+ARCHITECTURES = ("baseline", "gap", "mobilenet")
+DEFAULT_ARCHITECTURE = "baseline"
+
+
+def _baseline(num_classes, input_shape):
+    return Sequential([
+        layers.Conv2D(32, (3, 3), activation='relu', input_shape=input_shape),
+        layers.MaxPooling2D(2, 2),
+
+        layers.Conv2D(64, (3, 3), activation='relu'),
+        layers.MaxPooling2D(2, 2),
+
+        layers.Conv2D(128, (3, 3), activation='relu'),
+        layers.MaxPooling2D(2, 2),
+
+        layers.Flatten(),
+        layers.Dense(512, activation='relu'),
+        layers.Dropout(0.5),
+        layers.Dense(num_classes, activation='softmax')
+    ], name="baseline")
+
+
+def _gap(num_classes, input_shape):
+    # The dense head sees a 128-d pooled vector instead of a 26x26x128 feature map
+    return Sequential([
+        layers.Conv2D(32, (3, 3), activation='relu', input_shape=input_shape),
+        layers.MaxPooling2D(2, 2),
+
+        layers.Conv2D(64, (3, 3), activation='relu'),
+        layers.MaxPooling2D(2, 2),
+
+        layers.Conv2D(128, (3, 3), activation='relu'),
+        layers.MaxPooling2D(2, 2),
+
+        layers.GlobalAveragePooling2D(),
+        layers.Dropout(0.3),
+        layers.Dense(num_classes, activation='softmax')
+    ], name="gap")
+
+
+def _separable_block(filters, stride):
+    # Depthwise 3x3 + pointwise 1x1, each followed by BN + ReLU6 (MobileNet v1 block)
+    return [
+        layers.DepthwiseConv2D((3, 3), strides=stride, padding='same', use_bias=False),
+        layers.BatchNormalization(),
+        layers.ReLU(6.0),
+        layers.Conv2D(filters, (1, 1), use_bias=False),
+        layers.BatchNormalization(),
+        layers.ReLU(6.0),
+    ]
+
+
+def _mobilenet(num_classes, input_shape, width=1.0):
+    def f(n):
+        return max(8, int(n * width))
+
+    stack = [
+        layers.Conv2D(f(32), (3, 3), strides=2, padding='same', use_bias=False, input_shape=input_shape),
+        layers.BatchNormalization(),
+        layers.ReLU(6.0),
+    ]
+    # (filters, stride): 112 -> 56 -> 28 -> 14 -> 7
+    for filters, stride in [(64, 1), (128, 2), (128, 1), (256, 2), (256, 1), (512, 2), (512, 1), (512, 2)]:
+        stack += _separable_block(f(filters), stride)
+    stack += [
+        layers.GlobalAveragePooling2D(),
+        layers.Dropout(0.2),
+        layers.Dense(num_classes, activation='softmax'),
+    ]
+    return Sequential(stack, name="mobilenet")
+
+
+_BUILDERS = {
+    "baseline": _baseline,
+    "gap": _gap,
+    "mobilenet": _mobilenet,
+}
+
+
+def build_model(architecture, num_classes, input_shape=(224, 224, 3)):
+    if architecture not in _BUILDERS:
+        raise ValueError(f"Unknown architecture {architecture!r} (expected one of {', '.join(ARCHITECTURES)})")
+    return _BUILDERS[architecture](num_classes, input_shape)
@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+# CPU inference auto-tuner. Sweeps TensorFlow intra/inter-op threads (TFLite
+# interpreter threads for .tflite models), batch size and backend on this host,
+# and writes the best setting to inference_tuning.json, which inference.py
+# applies at startup. Run from the backend directory, telling it how many API
+# (or model server) processes will share the machine:
+#
+#     python -m app.ai_engine.autotune --processes 4
+#
+# Every configuration runs in fresh processes (TF thread pools can only be set
+# before TensorFlow starts), `--processes` of them at once, so the numbers include
+# the contention between workers. "Best" is the highest total throughput whose
+# p99 batch latency stays within --max-p99-ms (lowest p99 if none does).
+# Environment variables still override the file per deployment:
+#     INFERENCE_BACKEND, TF_INTRA_OP_THREADS, TF_INTER_OP_THREADS, TFLITE_THREADS,
+#     INFERENCE_MAX_BATCH_SIZE
+
+TUNING_FILE = "inference_tuning.json"
+TUNING_VERSION = 1
+BATCH_SIZES = (1, 4, 8, 16)
+INTER_OP_THREADS = (1, 2)
+MAX_P99_MS = 250.0
+DURATION_S = 5.0
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def load_tuning(path):
+    # Settings from a previous autotune run, or {} if there is none (or it is unreadable)
+    try:
+        with open(path) as f:
+            tuning = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Ignoring inference tuning file {path}: {e}")
+        return {}
+    if tuning.get("version") != TUNING_VERSION:
+        print(f"Ignoring inference tuning file {path}: unsupported version {tuning.get('version')}")
+        return {}
+    if tuning.get("host", {}).get("cpus") != os.cpu_count():
+        print(f"Inference tuning in {path} was measured on {tuning['host'].get('cpus')} CPUs, "
+              f"this host has {os.cpu_count()}; consider re-running app.ai_engine.autotune.")
+    return tuning
+
+
+def thread_counts(processes, cpus=None):
+    # 1, 2, 4, ... up to this process's share of the cores (and the share itself)
+    share = max(1, (cpus or os.cpu_count() or 1) // processes)
+    counts = {share}
+    n = 1
+    while n < share:
+        counts.add(n)
+        n *= 2
+    return sorted(counts)
+
+
+def candidates(backends, processes, batch_sizes=BATCH_SIZES, inter_op=INTER_OP_THREADS):
+    configs = []
+    for backend in backends:
+        for threads in thread_counts(processes):
+            for batch_size in batch_sizes:
+                if backend == "keras":
+                    for inter in inter_op:
+                        configs.append({"backend": backend, "intra_op_threads": threads,
+                                        "inter_op_threads": inter, "max_batch_size": batch_size})
+                else:
+                    configs.append({"backend": backend, "tflite_threads": threads, "max_batch_size": batch_size})
+    return configs
+
+
+def run_child(config, model_path, duration):
+    # One worker process: load, warm up, report ready, wait for "go" on stdin
+    # (so all workers measure at the same time), then run batches for `duration`
+    from .backends import configure_threads, create_backend
+
+    if config["backend"] == "keras":
+        configure_threads(config["intra_op_threads"], config["inter_op_threads"])
+    batch_size = config["max_batch_size"]
+    backend = create_backend(config["backend"], model_path, [batch_size], img_size=224,
+                             num_threads=config.get("tflite_threads"))
+    batch = np.random.default_rng(0).random((batch_size, 224, 224, 3), dtype=np.float32)
+    for _ in range(3):
+        backend.predict(batch)
+
+    print("ready", flush=True)
+    sys.stdin.readline()
+    latencies = []
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        t = time.perf_counter()
+        backend.predict(batch)
+        latencies.append((time.perf_counter() - t) * 1000)
+    elapsed = time.perf_counter() - started
+    return {"images": len(latencies) * batch_size, "seconds": elapsed, "latencies_ms": latencies}
+
+
+def measure(config, model_path, processes, duration):
+    # Aggregate throughput and p50/p99 batch latency of `processes` concurrent workers
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-m", "app.ai_engine.autotune", "--child", json.dumps([config, model_path]),
+             "--duration", str(duration)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, cwd=BACKEND_DIR,
+        )
+        for _ in range(processes)
+    ]
+    try:
+        for worker in workers:
+            line = last = ""
+            while line.strip() != "ready":
+                if line.strip():
+                    last = line.strip()
+                line = worker.stdout.readline()
+                if not line:
+                    raise RuntimeError(last or "worker exited")
+        for worker in workers:
+            worker.stdin.write("go\n")
+            worker.stdin.flush()
+        results = []
+        for worker in workers:
+            out, _ = worker.communicate()
+            lines = out.strip().splitlines()
+            if worker.returncode != 0 or not lines:
+                raise RuntimeError(lines[-1] if lines else f"worker exited with {worker.returncode}")
+            results.append(json.loads(lines[-1]))
+    finally:
+        for worker in workers:
+            if worker.poll() is None:
+                worker.kill()
+
+    latencies = np.concatenate([r["latencies_ms"] for r in results])
+    return {
+        "img_per_s": round(sum(r["images"] / r["seconds"] for r in results), 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+    }
+
+
+def best(results, max_p99_ms=MAX_P99_MS):
+    within = [r for r in results if r["measured"]["p99_ms"] <= max_p99_ms]
+    if within:
+        return max(within, key=lambda r: r["measured"]["img_per_s"])
+    return min(results, key=lambda r: r["measured"]["p99_ms"])
+
+
+def tune(model_paths, processes=1, batch_sizes=BATCH_SIZES, max_p99_ms=MAX_P99_MS, duration=DURATION_S,
+         output=None):
+    results = []
+    configs = candidates(list(model_paths), processes, batch_sizes)
+    print(f"Measuring {len(configs)} configurations, {processes} process(es) each, {duration:g}s per run.")
+    print(f"{'backend':<8} {'intra':>5} {'inter':>5} {'batch':>5} {'img/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for config in configs:
+        threads = config.get("intra_op_threads", config.get("tflite_threads"))
+        try:
+            measured = measure(config, model_paths[config["backend"]], processes, duration)
+        except Exception as e:
+            print(f"{config['backend']:<8} {threads:>5} {config.get('inter_op_threads', '-'):>5} "
+                  f"{config['max_batch_size']:>5} failed: {e}")
+            continue
+        results.append({**config, "measured": measured})
+        print(f"{config['backend']:<8} {threads:>5} {config.get('inter_op_threads', '-'):>5} "
+              f"{config['max_batch_size']:>5} {measured['img_per_s']:9.1f} {measured['p50_ms']:8.2f} "
+              f"{measured['p99_ms']:8.2f}")
+    if not results:
+        raise SystemExit("No configuration could be measured.")
+
+    chosen = best(results, max_p99_ms)
+    tuning = {
+        "version": TUNING_VERSION,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "host": {"cpus": os.cpu_count(), "processes": processes},
+        "max_p99_ms": max_p99_ms,
+        **chosen,
+    }
+    if output:
+        with open(f"{output}.tmp", "w") as f:
+            json.dump(tuning, f, indent=2)
+        os.replace(f"{output}.tmp", output)
+    return tuning
+
+
+def main():
+    from .backends import default_model_path
+
+    engine_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Find the fastest CPU inference settings for this host")
+    parser.add_argument("--processes", type=int, default=1, help="API/model server processes sharing this host")
+    parser.add_argument("--keras-model", default=default_model_path("keras", engine_dir))
+    parser.add_argument("--tflite-model", default=default_model_path("tflite", engine_dir))
+    parser.add_argument("--batch-sizes", default=",".join(map(str, BATCH_SIZES)))
+    parser.add_argument("--max-p99-ms", type=float, default=MAX_P99_MS, help="Latency budget per batch")
+    parser.add_argument("--duration", type=float, default=DURATION_S, help="Seconds measured per configuration")
+    parser.add_argument("--output", default=os.getenv("INFERENCE_TUNING_PATH") or os.path.join(engine_dir, TUNING_FILE))
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        config, model_path = json.loads(args.child)
+        print(json.dumps(run_child(config, model_path, args.duration)))
+        return
+
+    model_paths = {name: path for name, path in (("keras", args.keras_model), ("tflite", args.tflite_model))
+                   if os.path.exists(path)}
+    if not model_paths:
+        raise SystemExit(f"No model found at {args.keras_model} or {args.tflite_model}")
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    tuning = tune(model_paths, args.processes, batch_sizes, args.max_p99_ms, args.duration, args.output)
+    threads = tuning.get("intra_op_threads", tuning.get("tflite_threads"))
+    print(f"\nBest: {tuning['backend']} backend, {threads} thread(s)"
+          f"{', inter-op %d' % tuning['inter_op_threads'] if 'inter_op_threads' in tuning else ''}, "
+          f"batch {tuning['max_batch_size']}: {tuning['measured']['img_per_s']} img/s, "
+          f"p99 {tuning['measured']['p99_ms']} ms. Saved to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
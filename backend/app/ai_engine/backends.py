@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+# Inference backends. Each one loads a model file and exposes
+# predict(batch) -> (N, num_classes) float32 probabilities for a
+# (N, 224, 224, 3) float32 batch in [0, 1], so inference.py doesn't care
+# which runtime is underneath.
+#
+#     INFERENCE_BACKEND=keras   .h5 through tf.keras (default)
+#     INFERENCE_BACKEND=tflite  .tflite through the TFLite interpreter (XNNPACK on CPU)
+
+# TensorFlow is imported on first model load, so importing this module -- and
+# app.main -- stays fast for DB-only tasks and remote-inference workers
+tf = None
+_threads_configured = False
+
+
+def import_tf():
+    global tf
+    if tf is None:
+        started = time.perf_counter()
+        import tensorflow
+        tf = tensorflow
+        print(f"TensorFlow imported in {time.perf_counter() - started:.2f}s.")
+    return tf
+
+
+def configure_threads(intra_op=0, inter_op=0):
+    # TensorFlow's intra-op (within one op) and inter-op (independent ops) thread
+    # pools; 0 keeps TensorFlow's default of one thread per core. Only takes
+    # effect before TensorFlow runs its first op, so it is applied once.
+    global _threads_configured
+    if _threads_configured or not (intra_op or inter_op):
+        return
+    _threads_configured = True
+    config = import_tf().config.threading
+    try:
+        if intra_op:
+            config.set_intra_op_parallelism_threads(intra_op)
+        if inter_op:
+            config.set_inter_op_parallelism_threads(inter_op)
+        print(f"TensorFlow threads: intra-op {intra_op or 'default'}, inter-op {inter_op or 'default'}.")
+    except RuntimeError as e:
+        print(f"Could not set TensorFlow threads (already initialized): {e}")
+
+
+def bucket_for(n, buckets):
+    for size in buckets:
+        if size >= n:
+            return size
+    return buckets[-1]
+
+
+def run_bucketed(batch, buckets, run_fn):
+    # Split into chunks of the largest bucket and zero-pad each chunk up to the
+    # nearest bucket, so run_fn only ever sees the fixed shapes it was built for
+    outputs = []
+    for start in range(0, len(batch), buckets[-1]):
+        chunk = batch[start:start + buckets[-1]]
+        n = len(chunk)
+        size = bucket_for(n, buckets)
+        if size != n:
+            padded = np.zeros((size,) + chunk.shape[1:], dtype=np.float32)
+            padded[:n] = chunk
+            chunk = padded
+        outputs.append(run_fn(size, chunk)[:n])
+    return np.concatenate(outputs) if len(outputs) > 1 else outputs[0]
+
+
+class KerasBackend:
+    """
+    A Keras model file run through one traced tf.function per batch-size bucket.
+    With compiled=False it falls back to plain model.predict.
+    """
+
+    name = "keras"
+    extension = ".h5"
+
+    def __init__(self, model_path, buckets, img_size=224, compiled=True, **options):
+        self.model_path = model_path
+        self.buckets = sorted(buckets)
+        self.img_size = img_size
+        self.model = import_tf().keras.models.load_model(model_path)
+        self.compiled = self.compile(self.buckets) if compiled else {}
+
+    def compile(self, buckets):
+        # Trace + warm one concrete function per bucket so the first real request
+        # doesn't pay for graph tracing
+        tf = import_tf()
+        model = self.model
+        compiled = {}
+        for size in buckets:
+            spec = tf.TensorSpec((size, self.img_size, self.img_size, 3), tf.float32)
+            fn = tf.function(lambda x: model(x, training=False), input_signature=[spec])
+            fn(tf.zeros(spec.shape, tf.float32))
+            compiled[size] = fn
+        return compiled
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        compiled = self.compiled
+        if not compiled:
+            return self.model.predict(batch, verbose=0)
+        return run_bucketed(batch, self.buckets, lambda size, chunk: compiled[size](chunk).numpy())
+
+    def info(self):
+        return {"backend": self.name, "buckets": sorted(self.compiled)}
+
+
+def _interpreter_class():
+    # The standalone tflite-runtime wheel is ~5 MB and doesn't pull in TensorFlow;
+    # fall back to the interpreter bundled with TensorFlow
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        return import_tf().lite.Interpreter
+
+
+class TFLiteBackend:
+    """
+    A .tflite model run through the TFLite interpreter.
+
+    The interpreter applies the XNNPACK delegate to float (and int8) models on
+    CPU by default; `num_threads` sets its thread pool. One interpreter is
+    allocated per batch-size bucket and guarded by a lock, since an interpreter
+    is not safe to invoke from several threads at once. Quantized inputs and
+    outputs are converted with the scale/zero point stored in the model.
+    """
+
+    name = "tflite"
+    extension = ".tflite"
+
+    def __init__(self, model_path, buckets, img_size=224, num_threads=None, **options):
+        self.model_path = model_path
+        self.buckets = sorted(buckets)
+        self.img_size = img_size
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self._interpreter_cls = _interpreter_class()
+        self._slots = {size: self._allocate(size) for size in self.buckets}
+
+    def _allocate(self, size):
+        interpreter = self._interpreter_cls(model_path=self.model_path, num_threads=self.num_threads)
+        input_detail = interpreter.get_input_details()[0]
+        interpreter.resize_tensor_input(input_detail["index"], [size, self.img_size, self.img_size, 3])
+        interpreter.allocate_tensors()
+        input_detail = interpreter.get_input_details()[0]
+        output_detail = interpreter.get_output_details()[0]
+        # Warm up so XNNPACK packs the weights now rather than on the first request
+        interpreter.set_tensor(input_detail["index"], np.zeros(input_detail["shape"], dtype=input_detail["dtype"]))
+        interpreter.invoke()
+        return interpreter, input_detail, output_detail, threading.Lock()
+
+    @staticmethod
+    def _quantize(values, detail):
+        dtype = np.dtype(detail["dtype"])
+        if dtype == np.float32:
+            return values
+        scale, zero_point = detail["quantization"]
+        info = np.iinfo(dtype)
+        return np.clip(np.round(values / scale + zero_point), info.min, info.max).astype(dtype)
+
+    @staticmethod
+    def _dequantize(values, detail):
+        if np.dtype(detail["dtype"]) == np.float32:
+            return values
+        scale, zero_point = detail["quantization"]
+        return (values.astype(np.float32) - zero_point) * scale
+
+    def _invoke(self, size, chunk):
+        interpreter, input_detail, output_detail, lock = self._slots[size]
+        with lock:
+            interpreter.set_tensor(input_detail["index"], self._quantize(chunk, input_detail))
+            interpreter.invoke()
+            # get_tensor copies, so the result is safe to use after the lock is released
+            outputs = interpreter.get_tensor(output_detail["index"])
+        return self._dequantize(outputs, output_detail)
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        return run_bucketed(batch, self.buckets, self._invoke)
+
+    def info(self):
+        _, input_detail, _, _ = self._slots[self.buckets[0]]
+        return {
+            "backend": self.name,
+            "buckets": self.buckets,
+            "num_threads": self.num_threads,
+            "input_dtype": np.dtype(input_detail["dtype"]).name,
+        }
+
+
+BACKENDS = {
+    KerasBackend.name: KerasBackend,
+    TFLiteBackend.name: TFLiteBackend,
+}
+
+
+def default_model_path(name, directory):
+    return os.path.join(directory, f"crop_disease_model{BACKENDS[name].extension}")
+
+
+def create_backend(name, model_path, buckets, img_size=224, **options):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {name!r} (expected one of {', '.join(BACKENDS)})")
+    return BACKENDS[name](model_path, buckets, img_size=img_size, **options)
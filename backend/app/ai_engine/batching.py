@@ -0,0 +1,176 @@
+import threading
+import queue
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Collects single-image tensors from concurrent requests and runs them
+    through the model as one batch.
+
+    A batch is flushed when it reaches `max_batch_size` or when the oldest
+    queued image has waited `max_wait_ms`, whichever comes first.
+
+    With `wait_for_expected`, callers announce themselves with expect() before
+    preprocessing and pass expected=True to submit(). A batch then only waits
+    while such announced callers are still on their way, so a lone request is
+    run at once instead of sitting out max_wait_ms for company that never comes.
+
+    Each submit() may carry a `key`, e.g. the model snapshot the request took.
+    Rows with different keys are never mixed. A flush runs
+    `predict_fn(batch, key)` once per key, so during a model hot swap every
+    request is still scored by the model it started with.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=8, max_wait_ms=10, wait_for_expected=False):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.wait_for_expected = wait_for_expected
+        self._expected = 0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._buffer = None
+
+        # Stats
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._max_queue_depth = 0
+        self._total_queue_wait = 0.0
+        self._total_batch_time = 0.0
+        self._batch_size_hist = {}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._closed = False
+                self._thread = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+                self._thread.start()
+
+    def expect(self):
+        # A submit() is on its way: the caller is still preprocessing its image
+        with self._lock:
+            self._expected += 1
+
+    def cancel(self):
+        # An expected submit() that will not happen after all
+        with self._lock:
+            self._expected -= 1
+
+    def submit(self, tensor, key=None, expected=False):
+        # Returns a Future resolved with this image's output row.
+        # expected: this call fulfils an earlier expect()
+        if self._closed:
+            raise RuntimeError("Batcher is closed")
+        self.start()
+        future = Future()
+        self._queue.put((tensor, future, time.monotonic(), key))
+        if expected:
+            self.cancel()
+        depth = self._queue.qsize()
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+        return future
+
+    def predict(self, tensor, key=None, timeout=None):
+        return self.submit(tensor, key).result(timeout=timeout)
+
+    def close(self, timeout=None):
+        # Stop accepting work; everything already queued is still processed
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _run(self):
+        max_wait = self.max_wait_ms / 1000.0
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = item[2] + max_wait
+            while len(batch) < self.max_batch_size:
+                if self.wait_for_expected and self._expected <= 0 and self._queue.empty():
+                    break  # nobody else is on the way
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        item = self._queue.get(timeout=remaining)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            # Same key (by identity), in arrival order
+            groups = []
+            for item in batch:
+                for group in groups:
+                    if group[0][3] is item[3]:
+                        group.append(item)
+                        break
+                else:
+                    groups.append([item])
+            for group in groups:
+                self._process(group)
+
+    def _batch_buffer(self, tensor):
+        # Reused (max_batch_size, ...) buffer so each flush doesn't allocate a new batch
+        if self._buffer is None or self._buffer.shape[1:] != tensor.shape or self._buffer.dtype != tensor.dtype:
+            self._buffer = np.empty((self.max_batch_size,) + tensor.shape, dtype=tensor.dtype)
+        return self._buffer
+
+    def _process(self, batch):
+        started = time.monotonic()
+        try:
+            buffer = self._batch_buffer(batch[0][0])
+            for i, (tensor, _, _, _) in enumerate(batch):
+                buffer[i] = tensor
+            key = batch[0][3]
+            outputs = self.predict_fn(buffer[:len(batch)]) if key is None else self.predict_fn(buffer[:len(batch)], key)
+        except Exception as e:
+            self._errors += 1
+            for _, future, _, _ in batch:
+                future.set_exception(e)
+            return
+
+        for i, (_, future, queued_at, _) in enumerate(batch):
+            self._total_queue_wait += started - queued_at
+            future.set_result(outputs[i])
+
+        size = len(batch)
+        self._batches += 1
+        self._items += size
+        self._total_batch_time += time.monotonic() - started
+        self._batch_size_hist[size] = self._batch_size_hist.get(size, 0) + 1
+
+    def stats(self):
+        batches = self._batches or 1
+        items = self._items or 1
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queue_depth": self._queue.qsize(),
+            "expected": self._expected,
+            "max_queue_depth": self._max_queue_depth,
+            "batches": self._batches,
+            "images": self._items,
+            "errors": self._errors,
+            "avg_batch_size": round(self._items / batches, 2),
+            "avg_queue_wait_ms": round(self._total_queue_wait / items * 1000, 2),
+            "avg_batch_time_ms": round(self._total_batch_time / batches * 1000, 2),
+            "batch_size_histogram": dict(sorted(self._batch_size_hist.items())),
+        }
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """
+    Prediction results keyed by (image content hash, model version).
+
+    Memory tier is an LRU of `max_entries`; if `disk_dir` is set, results are
+    also written there as JSON so they survive restarts and are shared by all
+    workers on the host. Concurrent lookups of the same key are coalesced so
+    only one caller runs the inference.
+    """
+
+    def __init__(self, max_entries=1024, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def get_or_compute(self, image_hash, model_version, compute):
+        key = (image_hash, model_version)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(self._entries[key])
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return dict(future.result())
+
+        try:
+            value = self._disk_get(key)
+            if value is not None:
+                with self._lock:
+                    self.disk_hits += 1
+            else:
+                with self._lock:
+                    self.misses += 1
+                value = compute()
+                self._disk_put(key, value)
+            self._put(key, value)
+            future.set_result(value)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return dict(value)
+
+    def get(self, image_hash, model_version):
+        # Plain lookup (no coalescing) for callers that batch their own misses
+        key = (image_hash, model_version)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(self._entries[key])
+        value = self._disk_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._put(key, value)
+        return dict(value)
+
+    def put(self, image_hash, model_version, value):
+        key = (image_hash, model_version)
+        self._disk_put(key, value)
+        self._put(key, value)
+
+    def invalidate(self, versions):
+        # Drop everything cached for the given (replaced) model versions, in
+        # memory and on disk. Other versions, e.g. crop sub-models that are
+        # still served, keep their entries.
+        versions = set(versions)
+        if not versions:
+            return
+        with self._lock:
+            for key in [key for key in self._entries if key[1] in versions]:
+                del self._entries[key]
+            self.invalidations += 1
+        if self.disk_dir:
+            for version in versions:
+                shutil.rmtree(os.path.join(self.disk_dir, version), ignore_errors=True)
+
+    def _put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _disk_path(self, key):
+        image_hash, model_version = key
+        return os.path.join(self.disk_dir, model_version, image_hash[:2], f"{image_hash}.json")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _disk_put(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers never see a partial file
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Prediction cache write failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "disk_enabled": bool(self.disk_dir),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "invalidations": self.invalidations,
+                "hit_rate": round((self.hits + self.disk_hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,130 @@
+import json
+import os
+import pickle
+import random
+import shutil
+
+import numpy as np
+import tensorflow as tf
+
+# Epoch-level checkpointing for train_model, so a crashed or preempted run
+# resumes where it stopped instead of from epoch 0.
+#
+# <directory>/
+#     ckpt-<epoch>.*         model weights, optimizer state, epoch counter and the
+#                            TF global RNG (tf.train.Checkpoint, last 2 kept)
+#     training_state.pkl     epoch, early-stopping state, Python/NumPy RNG state
+#     best.h5                best model so far by validation loss
+#
+# The training state is written after the checkpoint it points at, so a crash
+# between the two resumes from the previous (complete) epoch.
+
+STATE_FILE = "training_state.pkl"
+BEST_MODEL_FILE = "best.h5"
+
+
+class ResumableTraining(tf.keras.callbacks.Callback):
+    """
+    Checkpoints every epoch, keeps the best model by `monitor`, and stops
+    early after `patience` epochs without an improvement of at least
+    `min_delta`. All of this state survives a restart: call restore() before
+    model.fit and pass the returned epoch as initial_epoch.
+    """
+
+    def __init__(self, directory, model, run_config=None, monitor="val_loss", patience=3, min_delta=1e-3,
+                 max_to_keep=2):
+        super().__init__()
+        self.directory = directory
+        self.run_config = run_config or {}
+        self.monitor = monitor
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best = np.inf
+        self.best_epoch = None
+        self.wait = 0
+        self.stopped = False
+
+        os.makedirs(directory, exist_ok=True)
+        self._epoch = tf.Variable(0, dtype=tf.int64, trainable=False, name="epoch")
+        self._checkpoint = tf.train.Checkpoint(
+            model=model, optimizer=model.optimizer, epoch=self._epoch, rng=tf.random.get_global_generator()
+        )
+        self._manager = tf.train.CheckpointManager(self._checkpoint, directory, max_to_keep=max_to_keep)
+
+    @property
+    def best_model_path(self):
+        return os.path.join(self.directory, BEST_MODEL_FILE)
+
+    def restore(self):
+        # Returns the epoch to continue from (0 for a fresh run)
+        state_path = os.path.join(self.directory, STATE_FILE)
+        if not os.path.exists(state_path):
+            return 0
+        with open(state_path, "rb") as f:
+            state = pickle.load(f)
+        if state.get("run_config") != self.run_config:
+            raise RuntimeError(
+                f"Checkpoints in {self.directory} belong to a different run ({state.get('run_config')}); "
+                "use another --checkpoint-dir or --fresh"
+            )
+
+        # Optimizer slots are created lazily, so their values are restored on first use
+        self._checkpoint.restore(state["checkpoint"])
+        random.setstate(state["python_rng"])
+        np.random.set_state(state["numpy_rng"])
+        self.best = state["best"]
+        self.best_epoch = state["best_epoch"]
+        self.wait = state["wait"]
+        self.stopped = state["stopped"]
+        print(f"Resumed from {state['checkpoint']} (epoch {state['epoch']}, best {self.monitor} "
+              f"{self.best:.4f} at epoch {self.best_epoch})")
+        return state["epoch"]
+
+    def on_epoch_end(self, epoch, logs=None):
+        current = (logs or {}).get(self.monitor)
+        if current is not None:
+            if current < self.best - self.min_delta:
+                self.best, self.best_epoch, self.wait = float(current), epoch + 1, 0
+                tmp_path = f"{self.best_model_path}.tmp.h5"
+                self.model.save(tmp_path)
+                os.replace(tmp_path, self.best_model_path)
+            else:
+                self.wait += 1
+                if self.wait >= self.patience:
+                    print(f"\nEarly stopping: {self.monitor} has not improved for {self.wait} epochs "
+                          f"(best {self.best:.4f} at epoch {self.best_epoch}).")
+                    self.stopped = True
+                    self.model.stop_training = True
+
+        self._epoch.assign(epoch + 1)
+        path = self._manager.save(checkpoint_number=epoch + 1)
+        self._write_state({
+            "run_config": self.run_config,
+            "epoch": epoch + 1,
+            "checkpoint": path,
+            "best": self.best,
+            "best_epoch": self.best_epoch,
+            "wait": self.wait,
+            "stopped": self.stopped,
+            "python_rng": random.getstate(),
+            "numpy_rng": np.random.get_state(),
+        })
+
+    def _write_state(self, state):
+        path = os.path.join(self.directory, STATE_FILE)
+        with open(f"{path}.tmp", "wb") as f:
+            pickle.dump(state, f)
+        os.replace(f"{path}.tmp", path)
+
+    def export_best(self, save_path, class_indices):
+        # Final artefact: the best model (or the last one if no epoch reported
+        # `monitor`) with its class_indices.json in the same directory
+        directory = os.path.dirname(os.path.abspath(save_path))
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.best_model_path):
+            shutil.copyfile(self.best_model_path, f"{save_path}.tmp.h5")
+        else:
+            self.model.save(f"{save_path}.tmp.h5")
+        os.replace(f"{save_path}.tmp.h5", save_path)
+        with open(os.path.join(directory, "class_indices.json"), "w") as f:
+            json.dump(class_indices, f)
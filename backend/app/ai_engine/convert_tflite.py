@@ -0,0 +1,157 @@
+import argparse
+import os
+
+import numpy as np
+
+from .backends import KerasBackend, TFLiteBackend, import_tf
+
+# Convert the trained Keras model to TFLite for INFERENCE_BACKEND=tflite.
+# Run from the backend directory:
+#
+#     python -m app.ai_engine.convert_tflite
+#     python -m app.ai_engine.convert_tflite --model path/to/model.h5 --output path/to/model.tflite
+#
+# The converted model is checked against the Keras model before the command
+# reports success: on the --calibration-dir images when given, otherwise on
+# random inputs. It warns when top-1 agreement is below --min-agreement
+# (default per quantization mode, see MIN_AGREEMENT).
+#
+# Quantized variants (about 4x smaller):
+#     --quantization dynamic                      int8 weights, float activations
+#     --quantization int8 --calibration-dir DIR   int8 weights and activations,
+#                                                 calibrated on images from DIR
+
+AI_ENGINE_DIR = os.path.dirname(__file__)
+DEFAULT_INPUT = os.path.join(AI_ENGINE_DIR, "crop_disease_model.h5")
+DEFAULT_OUTPUT = os.path.join(AI_ENGINE_DIR, "crop_disease_model.tflite")
+QUANTIZATION_MODES = ("none", "dynamic", "int8")
+# Expected top-1 agreement with the Keras model on real images; quantized
+# models legitimately flip a few near-tie predictions
+MIN_AGREEMENT = {"none": 0.99, "dynamic": 0.98, "int8": 0.95}
+
+
+def convert(keras_model, output_path, quantization="none", representative_data=None):
+    # Batch dimension is left dynamic; TFLiteBackend resizes it per bucket.
+    # representative_data: callable returning an iterable of (1, 224, 224, 3)
+    # float32 batches, required for full-integer quantization.
+    tf = import_tf()
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    if quantization == "dynamic":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif quantization == "int8":
+        if representative_data is None:
+            raise ValueError("Full-integer quantization needs representative data")
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([batch] for batch in representative_data())
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    elif quantization != "none":
+        raise ValueError(f"Unknown quantization {quantization!r}")
+    tflite_model = converter.convert()
+
+    # Write then rename so a running server never loads a half-written file
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(tflite_model)
+    os.replace(tmp_path, output_path)
+    return len(tflite_model)
+
+
+def images_from_dir(directory, limit=200):
+    # Calibration batches from a folder of images (e.g. the PlantVillage dataset),
+    # preprocessed exactly like uploads
+    from .inference import preprocess_image
+
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files
+                     if name.lower().endswith((".jpg", ".jpeg", ".png")))
+    paths.sort()
+    step = max(1, len(paths) // limit)  # spread the sample across all classes
+
+    def generate():
+        for path in paths[::step][:limit]:
+            yield preprocess_image(path)
+
+    return generate
+
+
+def _chunks(batches, size):
+    # Regroup an iterable of (1, H, W, 3) batches into (size, H, W, 3) ones
+    rows = []
+    for batch in batches:
+        rows.append(batch)
+        if len(rows) == size:
+            yield np.concatenate(rows)
+            rows = []
+    if rows:
+        yield np.concatenate(rows)
+
+
+def compare(keras_path, tflite_path, samples=16, img_size=224, images=None):
+    # Max absolute difference and top-1 agreement, on `images` (a callable like
+    # the one images_from_dir returns) or, without them, on `samples` random
+    # inputs. Random noise says little about a quantized model's accuracy.
+    keras_backend = KerasBackend(keras_path, [samples], img_size=img_size, compiled=False)
+    tflite_backend = TFLiteBackend(tflite_path, [samples], img_size=img_size)
+    if images is None:
+        batches = [np.random.default_rng(0).random((samples, img_size, img_size, 3), dtype=np.float32)]
+    else:
+        batches = _chunks(images(), samples)
+
+    count, agreed, max_abs_diff = 0, 0, 0.0
+    for batch in batches:
+        expected = keras_backend.predict(batch)
+        actual = tflite_backend.predict(batch)
+        count += len(batch)
+        agreed += int(np.sum(expected.argmax(axis=1) == actual.argmax(axis=1)))
+        max_abs_diff = max(max_abs_diff, float(np.max(np.abs(expected - actual))))
+    return {
+        "inputs": "random" if images is None else "images",
+        "samples": count,
+        "max_abs_diff": max_abs_diff,
+        "top1_agreement": agreed / count if count else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the Keras disease model to TFLite")
+    parser.add_argument("--model", default=DEFAULT_INPUT, help="Keras .h5 model to convert")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Where to write the .tflite model")
+    parser.add_argument("--quantization", choices=QUANTIZATION_MODES, default="none")
+    parser.add_argument("--calibration-dir",
+                        help="Images used to calibrate --quantization int8 and to check the converted model")
+    parser.add_argument("--min-agreement", type=float,
+                        help="Warn when top-1 agreement with the Keras model is below this "
+                             "(default: 0.99, or 0.98 for dynamic and 0.95 for int8)")
+    parser.add_argument("--skip-check", action="store_true", help="Don't compare outputs against the Keras model")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        raise SystemExit(f"Model not found at {args.model}")
+
+    representative_data = None
+    if args.quantization == "int8":
+        if not args.calibration_dir:
+            raise SystemExit("--quantization int8 needs --calibration-dir")
+        representative_data = images_from_dir(args.calibration_dir)
+
+    keras_model = import_tf().keras.models.load_model(args.model)
+    size = convert(keras_model, args.output, args.quantization, representative_data)
+    print(f"Wrote {args.output} ({size / 1e6:.1f} MB, Keras file {os.path.getsize(args.model) / 1e6:.1f} MB)")
+
+    if not args.skip_check:
+        images = images_from_dir(args.calibration_dir) if args.calibration_dir else None
+        report = compare(args.model, args.output, images=images)
+        inputs = "calibration images" if images is not None else "random inputs"
+        print(f"On {report['samples']} {inputs}: max abs difference {report['max_abs_diff']:.2e}, "
+              f"top-1 agreement {report['top1_agreement']:.1%}")
+        min_agreement = args.min_agreement if args.min_agreement is not None else MIN_AGREEMENT[args.quantization]
+        if report["top1_agreement"] < min_agreement:
+            print(f"WARNING: the TFLite model agrees with the Keras model on fewer than {min_agreement:.0%} "
+                  f"of the {inputs}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# Dataset file listing shared by the tf.data pipeline and pack_dataset.
+# Split and labels match ImageDataGenerator.flow_from_directory(validation_split=0.2):
+#   - classes are the sorted sub-directory names, class i = i-th name
+#   - within each class, files are walked in sorted order and the first 20%
+#     go to validation, the rest to training
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".ppm", ".tif", ".tiff")
+
+
+def class_files(class_dir):
+    # Same walk order as Keras' DirectoryIterator
+    files = []
+    for root, _, names in sorted(os.walk(class_dir), key=lambda entry: entry[0]):
+        for name in sorted(names):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                files.append(os.path.join(root, name))
+    return files
+
+
+def crop_classes(directory, crop):
+    # Class directories of one crop: "tomato" -> ["Tomato_Bacterial_spot", ...]
+    return sorted(
+        name for name in os.listdir(directory)
+        if os.path.isdir(os.path.join(directory, name)) and re.split(r"[^0-9a-z]+", name.lower())[0] == crop
+    )
+
+
+def list_split(directory, validation_split=0.2, classes=None):
+    # (train_paths, train_labels), (val_paths, val_labels), class_indices.
+    # `classes` restricts (and orders) the class directories, like the
+    # flow_from_directory argument of the same name. Class directories are
+    # listed concurrently: on network/cold storage the walk, not the CPU, is
+    # the bottleneck.
+    if classes is None:
+        classes = sorted(
+            name for name in os.listdir(directory)
+            if os.path.isdir(os.path.join(directory, name))
+        )
+    with ThreadPoolExecutor(max_workers=min(16, len(classes) or 1)) as pool:
+        per_class = list(pool.map(class_files, [os.path.join(directory, name) for name in classes]))
+
+    train, val = ([], []), ([], [])
+    for label, files in enumerate(per_class):
+        cut = int(validation_split * len(files))
+        for subset, chunk in ((val, files[:cut]), (train, files[cut:])):
+            subset[0].extend(chunk)
+            subset[1].extend([label] * len(chunk))
+    return train, val, {name: i for i, name in enumerate(classes)}
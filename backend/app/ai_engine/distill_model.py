@@ -0,0 +1,229 @@
+import tensorflow as tf
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+from .architectures import ARCHITECTURES, build_model
+from .cache import file_hash
+from .checkpointing import ResumableTraining
+from . import train_model as training
+
+# Knowledge distillation: train a compact student (e.g. mobilenet) to match an
+# existing .h5 teacher. Same dataset layout, split and class indices as
+# train_model; run from the backend directory:
+#
+#     python -m app.ai_engine.distill_model --teacher plant_disease_model.h5 --architecture mobilenet
+#
+# The student is trained on
+#     alpha * CE(labels, student) + (1 - alpha) * T^2 * KL(teacher_T || student_T)
+# where x_T is softmax(log(x) / T): both models end in a softmax, so their
+# log-probabilities stand in for logits. The result is a plain .h5 (plus
+# class_indices.json) that inference.py, convert_tflite and the registry take
+# like any other model.
+
+STUDENT_ARCHITECTURE = "mobilenet"
+SAVE_PATH = "plant_disease_student.h5"
+TEMPERATURE = 4.0
+ALPHA = 0.1  # weight of the hard-label loss; the rest goes to matching the teacher
+EPSILON = 1e-7
+
+
+def distillation_loss(num_classes, temperature=TEMPERATURE, alpha=ALPHA):
+    # y_true is [one-hot labels | teacher probabilities] (see with_teacher_targets)
+    def loss(y_true, y_pred):
+        labels, teacher_probs = y_true[:, :num_classes], y_true[:, num_classes:]
+        hard = tf.keras.losses.categorical_crossentropy(labels, y_pred)
+        soft_teacher = tf.nn.softmax(tf.math.log(teacher_probs + EPSILON) / temperature)
+        soft_student = tf.nn.softmax(tf.math.log(y_pred + EPSILON) / temperature)
+        soft = tf.keras.losses.kl_divergence(soft_teacher, soft_student)
+        return alpha * hard + (1 - alpha) * temperature ** 2 * soft
+    return loss
+
+
+def _metrics(num_classes):
+    def accuracy(y_true, y_pred):
+        return tf.keras.metrics.categorical_accuracy(y_true[:, :num_classes], y_pred)
+
+    def teacher_agreement(y_true, y_pred):
+        return tf.keras.metrics.categorical_accuracy(y_true[:, num_classes:], y_pred)
+
+    return [accuracy, teacher_agreement]
+
+
+class _TeacherTargets(tf.keras.utils.Sequence):
+    # ImageDataGenerator iterator whose labels are extended with the teacher's
+    # probabilities for the same (augmented) batch
+    def __init__(self, iterator, teacher):
+        super().__init__()
+        self.iterator = iterator
+        self.teacher = teacher
+
+    def __len__(self):
+        return len(self.iterator)
+
+    def __getitem__(self, index):
+        images, labels = self.iterator[index]
+        return images, np.concatenate([labels, self.teacher.predict_on_batch(images)], axis=1)
+
+    def on_epoch_end(self):
+        self.iterator.on_epoch_end()
+
+
+def with_teacher_targets(data, teacher):
+    if isinstance(data, tf.data.Dataset):
+        return data.map(
+            lambda images, labels: (images, tf.concat([labels, teacher(images, training=False)], axis=1)),
+            num_parallel_calls=tf.data.AUTOTUNE,
+        ).prefetch(tf.data.AUTOTUNE)
+    return _TeacherTargets(data, teacher)
+
+
+def _teacher_classes(teacher_path):
+    path = os.path.join(os.path.dirname(os.path.abspath(teacher_path)), "class_indices.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def distill_report(teacher, student, teacher_path, save_path, architecture):
+    # Size, parameters, single-image CPU latency, validation accuracy and top-1
+    # agreement with the teacher, for both models on the same validation images
+    validation = training._validation_batches()
+    labels, teacher_preds, student_preds = [], [], []
+    for step in range(len(validation)):
+        images, batch_labels = validation[step]
+        labels.append(batch_labels.argmax(axis=1))
+        teacher_preds.append(teacher.predict(images, verbose=0).argmax(axis=1))
+        student_preds.append(student.predict(images, verbose=0).argmax(axis=1))
+    labels = np.concatenate(labels)
+    teacher_preds = np.concatenate(teacher_preds)
+    student_preds = np.concatenate(student_preds)
+
+    report = []
+    for role, model, path, preds in (("teacher", teacher, teacher_path, teacher_preds),
+                                     ("student", student, save_path, student_preds)):
+        report.append({
+            "role": role,
+            "architecture": architecture if role == "student" else None,
+            "params": int(model.count_params()),
+            "path": path,
+            "size_mb": round(os.path.getsize(path) / 1e6, 2),
+            "val_accuracy": round(float(np.mean(preds == labels)), 4),
+            "teacher_agreement": round(float(np.mean(preds == teacher_preds)), 4),
+            "latency_ms": round(training._latency_ms(lambda x, m=model: m(x, training=False)), 2),
+        })
+
+    teacher_row, student_row = report
+    print(f"\n{'model':<8} {'params':>12} {'size MB':>8} {'val acc':>8} {'agree':>7} {'CPU ms/img':>11}")
+    for row in report:
+        print(f"{row['role']:<8} {row['params']:12,} {row['size_mb']:8.2f} {row['val_accuracy']:8.2%} "
+              f"{row['teacher_agreement']:7.2%} {row['latency_ms']:11.2f}")
+    print(f"Student is {teacher_row['size_mb'] / max(student_row['size_mb'], 0.01):.1f}x smaller and "
+          f"{teacher_row['latency_ms'] / max(student_row['latency_ms'], 1e-3):.1f}x faster per image.")
+
+    base, _ = os.path.splitext(save_path)
+    report_path = f"{base}_report.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Distillation report saved to {report_path}")
+    return report
+
+
+def distill(teacher_path, architecture=STUDENT_ARCHITECTURE, temperature=TEMPERATURE, alpha=ALPHA,
+            pipeline="generator", cache_dir=None, packed_dir=training.PACKED_DIR, save_path=SAVE_PATH,
+            checkpoint_dir=None, resume=True, epochs=training.EPOCHS, patience=training.PATIENCE):
+    if not os.path.exists(training.DATASET_DIR):
+        print(f"Dataset not found at {training.DATASET_DIR}. Please download PlantVillage dataset.")
+        return
+    if not os.path.exists(teacher_path):
+        print(f"Teacher model not found at {teacher_path}.")
+        return
+
+    if pipeline == "packed":
+        train_data, validation_data, class_indices, train_steps, validation_steps = training.packed_inputs(packed_dir)
+    elif pipeline == "tfdata":
+        train_data, validation_data, class_indices, train_steps, validation_steps = training.tfdata_inputs(cache_dir)
+    else:
+        train_data, validation_data, class_indices, train_steps, validation_steps = training.generator_inputs()
+
+    teacher_classes = _teacher_classes(teacher_path)
+    if teacher_classes is None:
+        print("No class_indices.json next to the teacher; assuming it uses the dataset's class order.")
+    elif teacher_classes != class_indices:
+        raise ValueError(f"Teacher classes {teacher_classes} do not match the dataset classes {class_indices}")
+
+    teacher = tf.keras.models.load_model(teacher_path, compile=False)
+    teacher.trainable = False
+    num_classes = len(class_indices)
+    if teacher.output_shape[-1] != num_classes:
+        raise ValueError(f"Teacher has {teacher.output_shape[-1]} outputs, the dataset {num_classes} classes")
+
+    student = build_model(architecture, num_classes, (training.IMG_HEIGHT, training.IMG_WIDTH, 3))
+    student.compile(
+        optimizer='adam',
+        loss=distillation_loss(num_classes, temperature, alpha),
+        metrics=_metrics(num_classes)
+    )
+    student.summary()
+
+    checkpoint_dir = checkpoint_dir or os.path.join(training.CHECKPOINT_ROOT, f"distill-{architecture}")
+    if not resume:
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    run_config = {
+        "architecture": architecture,
+        "classes": sorted(class_indices, key=class_indices.get),
+        "teacher": file_hash(teacher_path),
+        "temperature": temperature,
+        "alpha": alpha,
+    }
+    checkpoints = ResumableTraining(checkpoint_dir, student, run_config=run_config, patience=patience)
+    initial_epoch = checkpoints.restore()
+
+    if checkpoints.stopped or initial_epoch >= epochs:
+        print("Distillation already finished in these checkpoints; exporting the best student.")
+    else:
+        student.fit(
+            with_teacher_targets(train_data, teacher),
+            steps_per_epoch=train_steps,
+            validation_data=with_teacher_targets(validation_data, teacher),
+            validation_steps=validation_steps,
+            epochs=epochs,
+            initial_epoch=initial_epoch,
+            callbacks=[checkpoints]
+        )
+
+    # Best epoch by val_loss, saved without the distillation loss so it loads
+    # anywhere with a plain load_model
+    if os.path.exists(checkpoints.best_model_path):
+        student.load_weights(checkpoints.best_model_path)
+    directory = os.path.dirname(os.path.abspath(save_path))
+    os.makedirs(directory, exist_ok=True)
+    student.save(save_path, include_optimizer=False)
+    with open(os.path.join(directory, "class_indices.json"), "w") as f:
+        json.dump(class_indices, f)
+    print(f"Student saved to {save_path} (best epoch {checkpoints.best_epoch}, val_loss {checkpoints.best:.4f})")
+
+    return distill_report(teacher, student, teacher_path, save_path, architecture)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distill a trained model into a compact student")
+    parser.add_argument("--teacher", default=training.SAVE_PATH, help="Trained .h5 teacher model")
+    parser.add_argument("--architecture", choices=ARCHITECTURES, default=STUDENT_ARCHITECTURE,
+                        help="Student architecture (see architectures.py)")
+    parser.add_argument("--temperature", type=float, default=TEMPERATURE, help="Softmax temperature for soft targets")
+    parser.add_argument("--alpha", type=float, default=ALPHA, help="Weight of the hard-label loss (0-1)")
+    parser.add_argument("--pipeline", choices=training.PIPELINES, default="generator")
+    parser.add_argument("--cache-dir", help="tf.data only: cache resized images here after the first epoch")
+    parser.add_argument("--packed-dir", default=training.PACKED_DIR, help="packed only: output of pack_dataset")
+    parser.add_argument("--output", default=SAVE_PATH, help="Student model path; class_indices.json is written next to it")
+    parser.add_argument("--epochs", type=int, default=training.EPOCHS)
+    parser.add_argument("--patience", type=int, default=training.PATIENCE, help="Early stopping patience in epochs")
+    parser.add_argument("--checkpoint-dir", help=f"Defaults to {training.CHECKPOINT_ROOT}/distill-<architecture>")
+    parser.add_argument("--fresh", action="store_true", help="Discard existing checkpoints instead of resuming")
+    args = parser.parse_args()
+    distill(args.teacher, architecture=args.architecture, temperature=args.temperature, alpha=args.alpha,
+            pipeline=args.pipeline, cache_dir=args.cache_dir, packed_dir=args.packed_dir, save_path=args.output,
+            checkpoint_dir=args.checkpoint_dir, resume=not args.fresh, epochs=args.epochs, patience=args.patience)
@@ -1,10 +1,27 @@
 import os
+import io
+import json
+import re
+import time
+import asyncio
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageOps
 import random
-import tensorflow as tf
+import queue
+import threading
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from . import perceptual_hash, probabilities, registry
+from .autotune import TUNING_FILE, load_tuning
+from .backends import configure_threads, create_backend, default_model_path
+from .batching import MicroBatcher
+from .cache import PredictionCache, content_hash, file_hash
+from .model_pool import ModelPool
+from .model_server import ModelServerClient
 
-# Global variable to hold the model
+# Global variable to hold the model: an inference backend (see backends.py),
+# or a ModelServerClient in remote mode. Both expose predict(batch).
+# `model` and `model_version` mirror _active (below) for status reporting.
 model = None
 
 # FULL CLASS MAPPING (Based on PlantVillage Dataset usually, but here mapped to user requirements)
@@ -116,56 +133,844 @@ CLASS_INFO = [
   }
 ]
 
-def load_model():
-    global model
+IMG_SIZE = 224
+
+# Host-specific defaults measured by `python -m app.ai_engine.autotune` (backend,
+# thread counts, batch size). The environment variables below override them.
+TUNING_PATH = os.getenv("INFERENCE_TUNING_PATH") or os.path.join(os.path.dirname(__file__), TUNING_FILE)
+TUNING = load_tuning(TUNING_PATH)
+
+# Crops covered by CLASS_INFO ("pepper", "potato", "tomato")
+CROPS = sorted({info["name"].split()[0].lower() for info in CLASS_INFO})
+
+# Id of the CLASS_INFO order that stored probability vectors are in
+LABELS = [info["name"] for info in CLASS_INFO]
+LABEL_MAP = probabilities.label_map_id(LABELS)
+_CLASS_INDEX = {name: i for i, name in enumerate(LABELS)}
+
+# Runtime used to execute the model: "keras" (.h5) or "tflite" (.tflite, see
+# convert_tflite.py). When the model registry (registry.py, MODEL_REGISTRY_DIR)
+# has an active bundle it is served; otherwise MODEL_PATH, which defaults to
+# crop_disease_model.<ext> next to this file.
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND") or TUNING.get("backend") or "keras"
+MODEL_PATH = os.getenv("MODEL_PATH") or default_model_path(INFERENCE_BACKEND, os.path.dirname(__file__))
+
+# Compiled inference (keras backend): one traced tf.function per fixed batch-size
+# bucket. Smaller batches are zero-padded up to the nearest bucket so no call retraces.
+COMPILED_ENABLED = os.getenv("INFERENCE_COMPILED", "1") == "1"
+
+# TFLite interpreter threads per batch bucket (defaults to all cores)
+TFLITE_THREADS = int(os.getenv("TFLITE_THREADS") or TUNING.get("tflite_threads") or 0) or None
+
+# TensorFlow thread pools for the keras backend (0 = one thread per core). With
+# several workers per host, the defaults oversubscribe the cores.
+INTRA_OP_THREADS = int(os.getenv("TF_INTRA_OP_THREADS") or TUNING.get("intra_op_threads") or 0)
+INTER_OP_THREADS = int(os.getenv("TF_INTER_OP_THREADS") or TUNING.get("inter_op_threads") or 0)
+
+# "local" loads the model in this process; "remote" sends tensors to the shared
+# model server (python -m app.ai_engine.model_server), so N API workers hold one model
+INFERENCE_MODE = os.getenv("INFERENCE_MODE", "local")
+MODEL_SERVER_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS", "/tmp/plant-disease-model.sock")
+
+# Load + warm the model during application startup instead of on the first upload
+PRELOAD = os.getenv("INFERENCE_PRELOAD", "1") == "1"
+
+# Micro-batching (concurrent uploads share one forward pass).
+# In remote mode the model server does the batching across all workers.
+BATCHING_ENABLED = os.getenv("INFERENCE_BATCHING", "0" if INFERENCE_MODE == "remote" else "1") == "1"
+MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE") or TUNING.get("max_batch_size") or 8)
+MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "10"))
+# Only wait for uploads that are already being preprocessed, rather than the
+# full MAX_WAIT_MS for every batch. The model server turns this off: it cannot
+# see requests from API workers coming.
+BATCH_WAIT_FOR_EXPECTED = os.getenv("INFERENCE_BATCH_WAIT_FOR_EXPECTED", "1") == "1"
+
+# Dedicated pool for preprocessing + inference so it never runs on the event loop.
+# When batching (here or on the model server), it needs at least MAX_BATCH_SIZE
+# threads for batches to fill up.
+INFERENCE_WORKERS = int(os.getenv(
+    "INFERENCE_WORKERS", str(MAX_BATCH_SIZE if BATCHING_ENABLED or INFERENCE_MODE == "remote" else 2)
+))
+
+BATCH_BUCKETS = sorted({b for b in (1, 2, 4, 8, 16, 32) if b < MAX_BATCH_SIZE} | {MAX_BATCH_SIZE})
+
+# Prediction cache keyed by SHA-256 of the uploaded bytes + model version
+CACHE_ENABLED = os.getenv("PREDICTION_CACHE", "1") == "1"
+CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "1024"))
+CACHE_DIR = os.getenv("PREDICTION_CACHE_DIR") or None
+MODEL_CHECK_INTERVAL = float(os.getenv("MODEL_CHECK_INTERVAL", "5"))
+
+# Confidence-gated cascade (local mode): a small, fast model answers first and
+# only images where its top-1 confidence or top-1/top-2 margin is below these
+# thresholds are escalated to the main model. Tune with benchmarks/eval_cascade.py.
+CASCADE_MODEL_PATH = os.getenv("CASCADE_MODEL_PATH") or None
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.9"))
+CASCADE_MIN_MARGIN = float(os.getenv("CASCADE_MIN_MARGIN", "0.2"))
+
+# Shadow evaluation (local mode): a candidate model -- a model file with its
+# class_indices.json, or a registry bundle version -- also scores a random
+# sample of uploads on a background thread, after the live answer is returned.
+# When its queue is full, samples are dropped instead of waited for. Agreement
+# with the live model is reported under "shadow" in /api/detect/stats.
+SHADOW_MODEL = os.getenv("SHADOW_MODEL") or None
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.1"))
+SHADOW_QUEUE_SIZE = int(os.getenv("SHADOW_QUEUE_SIZE", "64"))
+
+# Per-crop specialised models (local mode): CROP_MODEL_DIR/<crop>/crop_disease_model.<ext>
+# plus its class_indices.json, trained with `train_model --crop <crop>`. Uploads
+# whose crop is known (form field, or a user growing a single crop) use that
+# crop's smaller model; everything else uses the general model. Sub-models load
+# on first use and the least recently used ones are unloaded once their total
+# size (estimated from the model files) exceeds CROP_MODEL_MEMORY_MB.
+CROP_MODEL_DIR = os.getenv("CROP_MODEL_DIR") or os.path.join(os.path.dirname(__file__), "crop_models")
+CROP_MODEL_MEMORY_MB = float(os.getenv("CROP_MODEL_MEMORY_MB", "256"))
+
+# Near-duplicate reuse (perceptual_hash.py): with NEAR_DUPLICATE_DISTANCE set,
+# an image whose pHash is within that many bits (of 64) of an image already
+# scored by the same model gets that image's prediction instead of a forward
+# pass. Unset disables reuse; the pHash is still returned and stored. The index
+# of each model version is built from stored predictions on first use (see
+# set_near_duplicate_source) and grows with new results, up to
+# NEAR_DUPLICATE_MAX_ENTRIES images.
+NEAR_DUPLICATE_DISTANCE = int(os.environ["NEAR_DUPLICATE_DISTANCE"]) if os.getenv("NEAR_DUPLICATE_DISTANCE") else None
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", "100000"))
+
+# The model being served, swapped as one object so a reload never pairs one
+# model's outputs with another's labels or version. Requests read it once.
+#   columns: CLASS_INFO index of each model output (None = same order as CLASS_INFO)
+#   source: "registry", "file" or "remote"
+_ActiveModel = namedtuple("_ActiveModel", ["model", "version", "columns", "source"])
+
+_active = None
+_cascade = None
+_cascade_stats = {"images": 0, "escalated": 0, "small_ms": 0.0, "large_ms": 0.0}
+_cascade_lock = threading.Lock()  # cascades run on executor, batcher and model-server threads
+_crop_pool = None
+_shadow = None
+_shadow_queue = None
+_shadow_stats = None
+_shadow_lock = threading.Lock()
+_crop_signatures = {}
+_near_duplicates = OrderedDict()  # _cache_version -> MultiIndexHash of pHash -> entry
+_near_duplicate_source = None
+_near_duplicate_stats = {"lookups": 0, "hits": 0, "lookup_ms": 0.0, "last_build": None}
+_near_duplicate_lock = threading.Lock()
+model_version = None
+_model_signature = None
+_last_model_check = 0.0
+_cache = None
+_batcher = None
+_executor = None
+_load_lock = threading.Lock()
+_reload_lock = threading.Lock()
+
+def _set_active(active, signature=None):
+    global _active, model, model_version, _model_signature
+    _active = active
+    model, model_version, _model_signature = active.model, active.version, signature
+
+def load_model(force=False):
+    # With force=True (hot reload) a failure keeps the current model serving
+    with _load_lock:
+        if model is not None and not force:
+            return
+        try:
+            if INFERENCE_MODE == "remote":
+                client = ModelServerClient(MODEL_SERVER_ADDRESS)
+                version = client.info()["model_version"]
+                _set_active(_ActiveModel(client, version, None, "remote"))
+                print(f"Using model server at {MODEL_SERVER_ADDRESS} (version {version}).")
+                return
+            signature = _current_signature()
+            source = _model_source()
+            if source is None:
+                print("Model not found. Running in MOCK mode.")
+                return
+            path, version, labels, origin = source
+            columns = _label_columns(labels)
+            if INFERENCE_BACKEND == "keras":
+                configure_threads(INTRA_OP_THREADS, INTER_OP_THREADS)
+            # Build (and warm) the new backend before swapping; requests keep
+            # using the previous model until the assignment below
+            loaded = create_backend(
+                INFERENCE_BACKEND, path, BATCH_BUCKETS, img_size=IMG_SIZE,
+                compiled=COMPILED_ENABLED, num_threads=TFLITE_THREADS,
+            )
+            _set_active(_ActiveModel(loaded, version, columns, origin), signature)
+            print(f"AI Model loaded successfully ({INFERENCE_BACKEND} backend, {origin} version {version}).")
+        except Exception as e:
+            print(f"Error loading model: {e}")
+        if CASCADE_MODEL_PATH and INFERENCE_MODE == "local" and model is not None:
+            _load_cascade()
+        if SHADOW_MODEL and INFERENCE_MODE == "local" and model is not None:
+            _load_shadow()
+
+def _load_cascade():
+    # The small first-stage model; without it every image goes to the main model
+    global _cascade
+    try:
+        backend = "tflite" if CASCADE_MODEL_PATH.endswith(".tflite") else "keras"
+        loaded = create_backend(
+            backend, CASCADE_MODEL_PATH, BATCH_BUCKETS, img_size=IMG_SIZE,
+            compiled=COMPILED_ENABLED, num_threads=TFLITE_THREADS,
+        )
+        columns = _label_columns(_sidecar_labels(CASCADE_MODEL_PATH))
+        version = file_hash(CASCADE_MODEL_PATH)[:16]
+        _cascade = _ActiveModel(loaded, version, columns, "cascade")
+        print(f"Cascade model loaded ({backend} backend, version {version}, "
+              f"min confidence {CASCADE_MIN_CONFIDENCE}, min margin {CASCADE_MIN_MARGIN}).")
+    except Exception as e:
+        print(f"Error loading cascade model, running without it: {e}")
+        _cascade = None
+
+def _load_shadow():
+    # The candidate model plus the thread that scores sampled uploads with it
+    global _shadow, _shadow_queue, _shadow_stats
     try:
-        model_path = os.path.join(os.path.dirname(__file__), "crop_disease_model.h5")
-        if os.path.exists(model_path):
-            model = tf.keras.models.load_model(model_path)
-            print("AI Model loaded successfully.")
+        if os.path.exists(SHADOW_MODEL):
+            path, labels, version = SHADOW_MODEL, _sidecar_labels(SHADOW_MODEL), file_hash(SHADOW_MODEL)[:16]
+            backend = "tflite" if path.endswith(".tflite") else "keras"
         else:
-            print("Model not found. Running in MOCK mode.")
+            bundle = registry.load_bundle(SHADOW_MODEL, registry.REGISTRY_DIR)
+            if bundle.preprocessing.get("img_size") != IMG_SIZE:
+                raise ValueError(f"Bundle {bundle.version} expects {bundle.preprocessing.get('img_size')}px inputs")
+            bundle.verify()
+            path, labels, version = bundle.model_path(INFERENCE_BACKEND), bundle.labels, bundle.version
+            backend = INFERENCE_BACKEND
+        loaded = create_backend(
+            backend, path, BATCH_BUCKETS, img_size=IMG_SIZE,
+            compiled=COMPILED_ENABLED, num_threads=TFLITE_THREADS,
+        )
+        shadow = _ActiveModel(loaded, version, _label_columns(labels), "shadow")
     except Exception as e:
-        print(f"Error loading model: {e}")
-        model = None
-
-def preprocess_image(image_path):
-    # Standard Preprocessing for ResNet/VGG models usually 224x224
-    img = Image.open(image_path).convert("RGB").resize((224, 224))
-    img_array = np.array(img)
-    img_array = img_array / 255.0  # Normalize to [0,1]
-    img_array = np.expand_dims(img_array, axis=0) # Batch
-    return img_array
-
-def predict_disease(image_path):
+        print(f"Error loading shadow model, running without it: {e}")
+        _shadow = None
+        return
+    with _shadow_lock:
+        if _shadow is None or _shadow.version != version:
+            _shadow_stats = _new_shadow_stats()
+        _shadow = shadow
+    if _shadow_queue is None:
+        _shadow_queue = queue.Queue(maxsize=SHADOW_QUEUE_SIZE)
+        threading.Thread(target=_shadow_worker, args=(_shadow_queue,), name="shadow-eval", daemon=True).start()
+    print(f"Shadow model loaded ({backend} backend, version {version}, sampling {SHADOW_SAMPLE_RATE:.0%} of uploads).")
+
+def _model_source():
+    # (model path, version, output labels or None, origin) of the model to serve
+    bundle_version = registry.current_version(registry.REGISTRY_DIR)
+    if bundle_version:
+        bundle = registry.load_bundle(bundle_version, registry.REGISTRY_DIR)
+        if bundle.preprocessing.get("img_size") != IMG_SIZE:
+            raise ValueError(f"Bundle {bundle.version} expects {bundle.preprocessing.get('img_size')}px inputs")
+        bundle.verify()
+        return bundle.model_path(INFERENCE_BACKEND), bundle.version, bundle.labels, "registry"
+    if os.path.exists(MODEL_PATH):
+        return MODEL_PATH, file_hash(MODEL_PATH)[:16], _sidecar_labels(MODEL_PATH), "file"
+    return None
+
+def _sidecar_labels(model_path):
+    # class_indices.json written by train_model next to a plain model file
+    path = os.path.join(os.path.dirname(model_path), "class_indices.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        class_indices = json.load(f)
+    return sorted(class_indices, key=class_indices.get)
+
+def _label_columns(labels):
+    # Model output index -> CLASS_INFO index, checked once at load time
+    if labels is None:
+        return None
+    columns = registry.map_labels(labels, [info["name"] for info in CLASS_INFO])
+    if columns == list(range(len(CLASS_INFO))):
+        return None
+    return np.array(columns)
+
+def _current_signature():
+    # Cheap check for "a different model should be served": the active registry
+    # version, or the model file's mtime/size
+    bundle_version = registry.current_version(registry.REGISTRY_DIR)
+    if bundle_version:
+        return ("registry", bundle_version)
+    try:
+        st = os.stat(MODEL_PATH)
+        return ("file", st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+def resolve_crop(hint=None, crops_grown=None):
+    # Crop whose sub-model should answer, or None for the general model. An
+    # explicit hint wins; otherwise the profile's crops_grown (free text, CSV or
+    # JSON list) is used when it names exactly one known crop.
+    text = hint if hint and hint.strip() else crops_grown
+    if not text:
+        return None
+    words = set(re.findall(r"[a-z]+", text.lower()))
+    found = [crop for crop in CROPS if words & {crop, f"{crop}s", f"{crop}es"}]
+    return found[0] if len(found) == 1 else None
+
+def _crop_model_path(crop):
+    return default_model_path(INFERENCE_BACKEND, os.path.join(CROP_MODEL_DIR, crop))
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+def _load_crop_model(crop):
+    # ModelPool loader: (_ActiveModel, estimated bytes) for one crop's sub-model
+    path = _crop_model_path(crop)
+    signature = _file_signature(path)
+    labels = _sidecar_labels(path)
+    if labels is None:
+        raise ValueError(f"{path} has no class_indices.json next to it")
+    columns = registry.map_labels(labels, [info["name"] for info in CLASS_INFO])
+    foreign = [CLASS_INFO[i]["name"] for i in columns if not CLASS_INFO[i]["name"].lower().startswith(crop)]
+    if foreign:
+        raise ValueError(f"{crop} model predicts other crops' classes: {foreign}")
+    loaded = create_backend(
+        INFERENCE_BACKEND, path, BATCH_BUCKETS, img_size=IMG_SIZE,
+        compiled=COMPILED_ENABLED, num_threads=TFLITE_THREADS,
+    )
+    version = f"{crop}-{file_hash(path)[:16]}"
+    _crop_signatures[crop] = signature
+    print(f"Loaded {crop} model ({len(labels)} classes, version {version}).")
+    return _ActiveModel(loaded, version, np.array(columns), f"crop:{crop}"), os.path.getsize(path)
+
+def get_crop_pool():
+    global _crop_pool
+    if _crop_pool is None:
+        with _load_lock:
+            if _crop_pool is None:
+                _crop_pool = ModelPool(_load_crop_model, int(CROP_MODEL_MEMORY_MB * 1024 * 1024))
+    return _crop_pool
+
+def _crop_model(crop):
+    # The crop's sub-model, or None when the general model should answer
+    if crop is None or INFERENCE_MODE != "local" or not os.path.exists(_crop_model_path(crop)):
+        return None
+    try:
+        return get_crop_pool().get(crop)
+    except Exception as e:
+        print(f"Error loading {crop} model, using the general model: {e}")
+        return None
+
+def _check_crop_models():
+    # Unload sub-models whose file changed; the next request loads the new one
+    if _crop_pool is None:
+        return
+    for crop in _crop_pool.keys():
+        if _file_signature(_crop_model_path(crop)) != _crop_signatures.get(crop):
+            print(f"{crop} model changed, it will be reloaded on next use.")
+            replaced = _crop_pool.peek(crop)
+            _crop_pool.discard(crop)
+            if replaced is not None:
+                get_cache().invalidate({replaced.version})
+
+def _invalidate_replaced(active, cascade):
+    # Drop cached results of the (active, cascade) pair a reload replaced.
+    # Crop sub-model entries are keyed by their own versions and stay.
+    replaced = {active.version, _cache_version(active, cascade)}
+    get_cache().invalidate(replaced - {_active.version, _cache_version(_active, _cascade)})
+
+def _reload():
+    try:
+        active, cascade = _active, _cascade
+        load_model(force=True)
+        _invalidate_replaced(active, cascade)
+    finally:
+        _reload_lock.release()
+
+def _check_model_file():
+    # Hot-swap when a new bundle is activated or the model file changes on disk.
+    # The new model loads in a background thread; requests keep being served
+    # by the current one until it is ready.
+    global _last_model_check
+    now = time.monotonic()
+    if now - _last_model_check < MODEL_CHECK_INTERVAL:
+        return
+    _last_model_check = now
+    if model is None:
+        return
+    if INFERENCE_MODE == "remote":
+        # The server reloads on its own; just follow its version
+        try:
+            version = model.info()["model_version"]
+        except Exception as e:
+            print(f"Model server unreachable: {e}")
+            return
+        if version != model_version:
+            active = _active
+            _set_active(active._replace(version=version))
+            _invalidate_replaced(active, _cascade)
+        return
+    _check_crop_models()
+    if _current_signature() == _model_signature:
+        return
+    if _reload_lock.acquire(blocking=False):
+        print("Model changed, loading the new version in the background.")
+        threading.Thread(target=_reload, name="model-reload", daemon=True).start()
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _load_lock:
+            if _cache is None:
+                _cache = PredictionCache(max_entries=CACHE_SIZE, disk_dir=CACHE_DIR)
+    return _cache
+
+def get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _load_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(_run_model, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                                        wait_for_expected=BATCH_WAIT_FOR_EXPECTED)
+    return _batcher
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _load_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+    return _executor
+
+def get_stats():
+    return {
+        "model_loaded": model is not None,
+        "model_version": model_version,
+        "inference_mode": INFERENCE_MODE,
+        "model_source": _active.source if _active is not None else None,
+        "backend": model.info() if model is not None and INFERENCE_MODE == "local" else None,
+        "threads": {
+            "intra_op": INTRA_OP_THREADS or None,
+            "inter_op": INTER_OP_THREADS or None,
+            "tflite": TFLITE_THREADS,
+            "tuning_file": TUNING_PATH if TUNING else None,
+        },
+        "batching_enabled": BATCHING_ENABLED,
+        "inference_workers": INFERENCE_WORKERS,
+        "batcher": _batcher.stats() if _batcher is not None else None,
+        "cascade": _cascade_report() if _cascade is not None else None,
+        "crop_models": _crop_pool.stats() if _crop_pool is not None else None,
+        "shadow": _shadow_report() if _shadow is not None else None,
+        "near_duplicates": _near_duplicate_report() if NEAR_DUPLICATE_DISTANCE is not None else None,
+        "cache": _cache.stats() if _cache is not None else None,
+    }
+
+def load_pixels(image_source, size=IMG_SIZE):
+    # Decoded, upright, resized (size, size, 3) uint8 RGB pixels
+    with Image.open(image_source) as img:
+        if img.format == "JPEG":
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of the full 12 MP
+            img.draft("RGB", (size, size))
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGB").resize((size, size), Image.BILINEAR)
+        return np.asarray(img, dtype=np.uint8)
+
+def preprocess_image(image_source, out=None):
+    # Standard Preprocessing for ResNet/VGG models usually 224x224.
+    # Returns a (1, 224, 224, 3) float32 batch, or fills `out` (a 224x224x3
+    # float32 slot of a preallocated batch buffer) in place.
+    pixels = load_pixels(image_source)
+
+    batch = None
+    if out is None:
+        batch = np.empty((1, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+        out = batch[0]
+    np.multiply(pixels, np.float32(1.0 / 255.0), out=out)  # Normalize to [0,1] without a float64 copy
+    return batch if batch is not None else out
+
+def _run_model(batch, active=None):
+    # One forward pass over a (N, 224, 224, 3) batch. Output columns are always
+    # in CLASS_INFO order, whatever label order the model was trained with.
+    active = active or _active
+    probs = active.model.predict(np.asarray(batch, dtype=np.float32))
+    if active.columns is None:
+        return probs
+    ordered = np.zeros((len(probs), len(CLASS_INFO)), dtype=np.float32)
+    ordered[:, active.columns] = probs
+    return ordered
+
+def _format_prediction(probs):
+    # Assuming Softmax output, get index of highest confidence
+    class_index = int(np.argmax(probs))
+    confidence = float(probs[class_index])
+
+    # Map index to class info
+    # IMPORTANT: The model's training class order MUST match this list order.
+    # If the model has 15 classes, we return the info from CLASS_INFO[class_index]
+    if class_index < len(CLASS_INFO):
+        return _describe(class_index, confidence, probs if len(probs) == len(CLASS_INFO) else None)
+    raise IndexError(f"Class index {class_index} out of bounds")
+
+def _describe(class_index, confidence, probs=None):
+    result = CLASS_INFO[class_index]
+    return {
+        "disease_name": result["name"],
+        "confidence": confidence,
+        "is_healthy": result["healthy"],
+        "description": result["desc"],
+        "treatment": result["treat"],
+        "recommended_fertilizer": result.get("recommended_fertilizer"),
+        # Full softmax vector, stored compactly with the prediction (probabilities.py)
+        "probabilities": np.asarray(probs, dtype=np.float16).tolist() if probs is not None else None,
+        "label_map": LABEL_MAP
+    }
+
+def _cascade_gate(probs, min_confidence=None, min_margin=None):
+    # Rows the small model may answer on its own, plus their confidence and margin
+    min_confidence = CASCADE_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    min_margin = CASCADE_MIN_MARGIN if min_margin is None else min_margin
+    top2 = np.sort(probs, axis=1)[:, -2:]
+    confidence = top2[:, 1]
+    margin = top2[:, 1] - top2[:, 0]
+    return (confidence >= min_confidence) & (margin >= min_margin), confidence, margin
+
+def _predict_rows(batch, active, cascade, run_main):
+    # Result dicts for a preprocessed batch; a sample of general-model traffic
+    # is then handed to the shadow model without waiting for it
+    started = time.perf_counter()
+    results = _score_rows(batch, active, cascade, run_main)
+    if _shadow is not None and not active.source.startswith("crop:"):
+        _submit_shadow(batch, results, (time.perf_counter() - started) * 1000 / len(batch))
+    return results
+
+def _score_rows(batch, active, cascade, run_main):
+    # With a cascade, the small model's decision is recorded on every result
+    # and only doubtful rows reach run_main
+    if cascade is None:
+        return [dict(_format_prediction(row), model_version=active.version) for row in run_main(batch)]
+
+    started = time.perf_counter()
+    first = _run_model(batch, cascade)
+    small_ms = (time.perf_counter() - started) * 1000
+    accepted, confidence, _ = _cascade_gate(first)
+
+    results = [dict(_format_prediction(row), model_version=cascade.version) for row in first]
+    escalate = np.flatnonzero(~accepted)
+    large_ms = 0.0
+    if len(escalate):
+        started = time.perf_counter()
+        for j, row in zip(escalate, run_main(batch[escalate])):
+            results[j] = dict(_format_prediction(row), model_version=active.version)
+        large_ms = (time.perf_counter() - started) * 1000
+
+    for j, result in enumerate(results):
+        result["first_stage_disease"] = CLASS_INFO[int(np.argmax(first[j]))]["name"]
+        result["first_stage_confidence"] = float(confidence[j])
+        result["escalated"] = not bool(accepted[j])
+
+    with _cascade_lock:
+        _cascade_stats["images"] += len(batch)
+        _cascade_stats["escalated"] += len(escalate)
+        _cascade_stats["small_ms"] += small_ms
+        _cascade_stats["large_ms"] += large_ms
+    return results
+
+def _new_shadow_stats():
+    return {
+        "live_version": None,
+        "sampled": 0,
+        "agreed": 0,
+        "dropped": 0,
+        "errors": 0,
+        "live_ms": 0.0,
+        "shadow_ms": 0.0,
+        "confidence_delta": 0.0,
+        "abs_confidence_delta": 0.0,
+        "by_class": {},
+        "disagreements": Counter(),
+    }
+
+def _submit_shadow(batch, results, live_ms):
+    # On the request path: sampling and a non-blocking put, nothing else
+    shadow_queue, shadow = _shadow_queue, _shadow
+    picked = [j for j in range(len(results)) if random.random() < SHADOW_SAMPLE_RATE]
+    if not picked or shadow_queue is None or shadow is None:
+        return
+    live = [(results[j]["disease_name"], results[j]["confidence"], results[j].get("model_version")) for j in picked]
+    try:
+        # Tagged with the shadow it was sampled for: after a shadow reload,
+        # samples still queued for the old one are dropped, not counted
+        shadow_queue.put_nowait((batch[picked], live, live_ms, shadow))
+    except queue.Full:
+        with _shadow_lock:
+            _shadow_stats["dropped"] += len(picked)
+
+def _shadow_worker(shadow_queue):
+    while True:
+        item = shadow_queue.get()
+        if item is None:
+            return
+        rows, live, live_ms, shadow = item
+        if shadow is not _shadow:
+            continue  # queued before the shadow model was reloaded
+        try:
+            started = time.perf_counter()
+            probs = _run_model(rows, shadow)
+            shadow_ms = (time.perf_counter() - started) * 1000 / len(rows)
+        except Exception as e:
+            print(f"Shadow inference error: {e}")
+            with _shadow_lock:
+                if shadow is _shadow:
+                    _shadow_stats["errors"] += len(rows)
+            continue
+        _record_shadow(live, probs, live_ms, shadow_ms, shadow)
+
+def _record_shadow(live, probs, live_ms, shadow_ms, shadow):
+    global _shadow_stats
+    with _shadow_lock:
+        if shadow is not _shadow:
+            return  # the shadow was reloaded while this sample was scored
+        stats = _shadow_stats
+        for (disease, confidence, version), row in zip(live, probs):
+            if version != stats["live_version"]:
+                if stats["sampled"]:
+                    # The live model was swapped: start over rather than mix versions
+                    stats = _shadow_stats = _new_shadow_stats()
+                stats["live_version"] = version
+            shadow_disease = CLASS_INFO[int(np.argmax(row))]["name"]
+            delta = float(np.max(row)) - confidence
+            agreed = shadow_disease == disease
+            stats["sampled"] += 1
+            stats["agreed"] += agreed
+            stats["live_ms"] += live_ms
+            stats["shadow_ms"] += shadow_ms
+            stats["confidence_delta"] += delta
+            stats["abs_confidence_delta"] += abs(delta)
+            per_class = stats["by_class"].setdefault(disease, [0, 0])
+            per_class[0] += 1
+            per_class[1] += agreed
+            if not agreed:
+                stats["disagreements"][(disease, shadow_disease)] += 1
+
+def _shadow_report():
+    with _shadow_lock:
+        stats = _shadow_stats
+        sampled = stats["sampled"] or 1
+        return {
+            "shadow_version": _shadow.version,
+            "live_version": stats["live_version"],
+            "sample_rate": SHADOW_SAMPLE_RATE,
+            "sampled": stats["sampled"],
+            "dropped": stats["dropped"],
+            "errors": stats["errors"],
+            "queue_depth": _shadow_queue.qsize() if _shadow_queue is not None else 0,
+            "agreement_rate": round(stats["agreed"] / sampled, 4),
+            "mean_confidence_delta": round(stats["confidence_delta"] / sampled, 4),
+            "mean_abs_confidence_delta": round(stats["abs_confidence_delta"] / sampled, 4),
+            "avg_live_ms_per_image": round(stats["live_ms"] / sampled, 2),
+            "avg_shadow_ms_per_image": round(stats["shadow_ms"] / sampled, 2),
+            "by_class": {
+                disease: {"sampled": n, "agreement_rate": round(agreed / n, 4)}
+                for disease, (n, agreed) in sorted(stats["by_class"].items())
+            },
+            "top_disagreements": [
+                {"live": live, "shadow": shadow, "count": count}
+                for (live, shadow), count in stats["disagreements"].most_common(10)
+            ],
+        }
+
+def _cascade_report():
+    with _cascade_lock:
+        stats = dict(_cascade_stats)
+    images = stats["images"] or 1
+    return {
+        "min_confidence": CASCADE_MIN_CONFIDENCE,
+        "min_margin": CASCADE_MIN_MARGIN,
+        "images": stats["images"],
+        "escalated": stats["escalated"],
+        "escalation_rate": round(stats["escalated"] / images, 4),
+        "avg_small_ms": round(stats["small_ms"] / images, 2),
+        "avg_large_ms_per_image": round(stats["large_ms"] / images, 2),
+    }
+
+def _cache_version(active, cascade):
+    # Cached results depend on both models and the thresholds when cascading
+    if cascade is None:
+        return active.version
+    return f"{active.version}+{cascade.version}-{CASCADE_MIN_CONFIDENCE:g}-{CASCADE_MIN_MARGIN:g}"
+
+def set_near_duplicate_source(load):
+    # load(model_versions, limit): stored predictions of those versions, newest
+    # first, as mappings with the image's "phash" and the result fields
+    # (crud.load_near_duplicates). Called once at startup by the API.
+    global _near_duplicate_source
+    _near_duplicate_source = load
+
+def _near_duplicate_entry(result):
+    # Compact index value: (class index, confidence, float16 probabilities,
+    # model_version, first_stage_disease, first_stage_confidence, escalated)
+    class_index = _CLASS_INDEX.get(result["disease_name"])
+    if class_index is None:
+        return None
+    probs = result.get("probabilities")
+    if probs is not None and result.get("label_map") != LABEL_MAP:
+        probs = None
+    elif probs is not None and not isinstance(probs, bytes):
+        probs = probabilities.encode(probs)
+    return (class_index, result["confidence"], probs, result.get("model_version"),
+            result.get("first_stage_disease"), result.get("first_stage_confidence"), result.get("escalated"))
+
+def _near_duplicate_result(entry):
+    class_index, confidence, probs, version, first_stage_disease, first_stage_confidence, escalated = entry
+    vector = probabilities.decode([probs], len(CLASS_INFO))[0] if probs is not None else None
+    result = dict(_describe(class_index, confidence, vector), model_version=version)
+    if first_stage_disease is not None:
+        result.update(first_stage_disease=first_stage_disease, first_stage_confidence=first_stage_confidence,
+                      escalated=escalated)
+    return result
+
+def _near_duplicate_index(active, cascade):
+    # Hash index of the (active, cascade) pair, loaded from stored predictions on
+    # first use. Caller holds _near_duplicate_lock.
+    key = _cache_version(active, cascade)
+    index = _near_duplicates.get(key)
+    if index is not None:
+        _near_duplicates.move_to_end(key)
+        return index
+
+    started = time.perf_counter()
+    index = perceptual_hash.MultiIndexHash(NEAR_DUPLICATE_DISTANCE)
+    if _near_duplicate_source is not None:
+        versions = [active.version] + ([cascade.version] if cascade is not None else [])
+        try:
+            rows = _near_duplicate_source(versions, NEAR_DUPLICATE_MAX_ENTRIES)
+            for row in reversed(rows):  # oldest first, so the newest prediction of a hash wins
+                entry = _near_duplicate_entry(row)
+                if entry is not None:
+                    index.add(perceptual_hash.from_hex(row["phash"]), entry)
+        except Exception as e:
+            print(f"Could not load stored predictions for near-duplicate reuse: {e}")
+    build_ms = (time.perf_counter() - started) * 1000
+    _near_duplicate_stats["last_build"] = {"version": key, "images": len(index), "ms": round(build_ms, 1)}
+    print(f"Near-duplicate index for {key}: {len(index)} images in {build_ms:.0f} ms.")
+
+    _near_duplicates[key] = index
+    while len(_near_duplicates) > len(CROPS) + 2:  # general model, cascade pair and crop models
+        _near_duplicates.popitem(last=False)
+    return index
+
+def _reuse_near_duplicate(image_phash, active, cascade):
+    # Stored result of the closest already-scored image within NEAR_DUPLICATE_DISTANCE, or None
+    with _near_duplicate_lock:
+        index = _near_duplicate_index(active, cascade)
+        started = time.perf_counter()
+        match = index.nearest(image_phash, NEAR_DUPLICATE_DISTANCE)
+        _near_duplicate_stats["lookup_ms"] += (time.perf_counter() - started) * 1000
+        _near_duplicate_stats["lookups"] += 1
+        if match is not None:
+            _near_duplicate_stats["hits"] += 1
+    if match is None:
+        return None
+    distance, entry = match
+    return dict(_near_duplicate_result(entry), near_duplicate_distance=distance)
+
+def _remember_near_duplicate(image_phash, active, cascade, result):
+    entry = _near_duplicate_entry(result)
+    if entry is None:
+        return
+    with _near_duplicate_lock:
+        index = _near_duplicates.get(_cache_version(active, cascade))
+        if index is not None and len(index) < NEAR_DUPLICATE_MAX_ENTRIES:
+            index.add(image_phash, entry)
+
+def _near_duplicate_report():
+    stats = _near_duplicate_stats
+    return {
+        "distance": NEAR_DUPLICATE_DISTANCE,
+        "indexed": {key: len(index) for key, index in _near_duplicates.items()},
+        "lookups": stats["lookups"],
+        "hits": stats["hits"],
+        "hit_rate": round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else None,
+        "avg_lookup_ms": round(stats["lookup_ms"] / stats["lookups"], 4) if stats["lookups"] else None,
+        "last_build": stats["last_build"],
+    }
+
+def _reuse_enabled(reuse_near_duplicates):
+    if reuse_near_duplicates is None:
+        return NEAR_DUPLICATE_DISTANCE is not None
+    return reuse_near_duplicates and NEAR_DUPLICATE_DISTANCE is not None
+
+def _predict_bytes(data, active, cascade, batched=BATCHING_ENABLED, reuse=False):
+    # While batching, the batcher is told this image is coming before it is
+    # decoded, so a batch being formed waits for it. Rows are keyed by the
+    # `active` snapshot: a batch flushed after a hot swap still scores this
+    # image with the model whose version the result (and cache key) carries.
+    batcher = get_batcher() if batched else None
+    submitted = False
+    if batcher is not None:
+        batcher.expect()
+
+    def run_batched(batch):
+        nonlocal submitted
+        future = batcher.submit(batch[0], key=active, expected=True)
+        submitted = True
+        return future.result()[np.newaxis]
+
+    try:
+        processed_img = preprocess_image(io.BytesIO(data))
+        image_phash = perceptual_hash.phash(processed_img[0])
+        if reuse:
+            reused = _reuse_near_duplicate(image_phash, active, cascade)
+            if reused is not None:
+                return dict(reused, phash=perceptual_hash.to_hex(image_phash))
+
+        run_main = run_batched if batcher is not None else lambda batch: _run_model(batch, active)
+        result = _predict_rows(processed_img, active, cascade, run_main)[0]
+    finally:
+        if batcher is not None and not submitted:
+            batcher.cancel()
+    result["phash"] = perceptual_hash.to_hex(image_phash)
+    if reuse:
+        _remember_near_duplicate(image_phash, active, cascade, result)
+    return result
+
+def _models_for(crop):
+    # (model, cascade, use the micro-batcher) for a request. A crop sub-model
+    # replaces both the general model and the cascade; the batcher only serves
+    # the general model.
+    active, cascade = _active, _cascade
+    specialised = _crop_model(crop) if active else None
+    if specialised is not None:
+        return specialised, None, False
+    return active, cascade, BATCHING_ENABLED
+
+def serving_versions(crop=None):
+    # model_version values a prediction for `crop` can carry if made now: the
+    # crop sub-model's, or the general model's and the cascade's first stage
+    active, cascade, _ = _models_for(crop)
+    if not active:
+        return set()
+    return {active.version} | ({cascade.version} if cascade is not None else set())
+
+def predict_disease(image_path, crop=None, reuse_near_duplicates=None):
+    # crop: one of CROPS (see resolve_crop) to use that crop's sub-model if there is one.
+    # reuse_near_duplicates: False always runs the model (None: NEAR_DUPLICATE_DISTANCE decides)
+    _check_model_file()
     if model is None:
         load_model()
 
-    if model:
+    active, cascade, batched = _models_for(crop)
+    reuse = _reuse_enabled(reuse_near_duplicates)
+    if active:
         try:
             # REAL MODEL INFERENCE
-            processed_img = preprocess_image(image_path)
-            predictions = model.predict(processed_img)
-            
-            # Assuming Softmax output, get index of highest confidence
-            class_index = np.argmax(predictions[0])
-            confidence = float(np.max(predictions[0]))
-
-            # Map index to class info
-            # IMPORTANT: The model's training class order MUST match this list order.
-            # If the model has 15 classes, we return the info from CLASS_INFO[class_index]
-            if class_index < len(CLASS_INFO):
-                result = CLASS_INFO[class_index]
-                return {
-                    "disease_name": result["name"],
-                    "confidence": confidence,
-                    "is_healthy": result["healthy"],
-                    "description": result["desc"],
-                "treatment": result["treat"],
-                "recommended_fertilizer": result.get("recommended_fertilizer")
-                }
-            else:
-                return _get_mock_prediction(reason="Index out of bounds")
+            with open(image_path, "rb") as f:
+                data = f.read()
+            if CACHE_ENABLED:
+                result = get_cache().get_or_compute(
+                    content_hash(data), _cache_version(active, cascade),
+                    lambda: _predict_bytes(data, active, cascade, batched, reuse)
+                )
+                # Without reuse, an answer borrowed from a near-duplicate does not count
+                if reuse or "near_duplicate_distance" not in result:
+                    return result
+            return _predict_bytes(data, active, cascade, batched, reuse)
 
         except Exception as e:
             print(f"Inference Logic Error: {e}")
@@ -174,6 +979,121 @@ def predict_disease(image_path):
         # FALLBACK / MOCK INFERENCE
         return _get_mock_prediction()
 
+def predict_batch(image_paths, crop=None, reuse_near_duplicates=None):
+    # Batched counterpart of predict_disease for multi-image uploads.
+    # Returns one entry per path: a result dict, or the exception raised while
+    # decoding that image. Cache hits and near-duplicates skip inference;
+    # other images share forward passes.
+    _check_model_file()
+    if model is None:
+        load_model()
+    active, cascade, _ = _models_for(crop)
+    if not active:
+        return [_get_mock_prediction() for _ in image_paths]
+    reuse = _reuse_enabled(reuse_near_duplicates)
+
+    version = _cache_version(active, cascade)
+    results = [None] * len(image_paths)
+    pending = []
+    for i, path in enumerate(image_paths):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            results[i] = e
+            continue
+        image_hash = content_hash(data)
+        cached = get_cache().get(image_hash, version) if CACHE_ENABLED else None
+        if cached is not None and (reuse or "near_duplicate_distance" not in cached):
+            results[i] = cached
+        else:
+            pending.append((i, image_hash, data))
+
+    chunk_size = BATCH_BUCKETS[-1]
+    buffer = np.empty((chunk_size, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32)
+    for start in range(0, len(pending), chunk_size):
+        decoded = []
+        for i, image_hash, data in pending[start:start + chunk_size]:
+            slot = buffer[len(decoded)]
+            try:
+                preprocess_image(io.BytesIO(data), out=slot)
+            except Exception as e:
+                results[i] = e
+                continue
+            image_phash = perceptual_hash.phash(slot)
+            reused = _reuse_near_duplicate(image_phash, active, cascade) if reuse else None
+            if reused is None:
+                decoded.append((i, image_hash, image_phash))
+                continue
+            results[i] = dict(reused, phash=perceptual_hash.to_hex(image_phash))
+            if CACHE_ENABLED:
+                get_cache().put(image_hash, version, dict(results[i]))
+        if not decoded:
+            continue
+
+        try:
+            rows = _predict_rows(buffer[:len(decoded)], active, cascade, lambda batch: _run_model(batch, active))
+        except Exception as e:
+            print(f"Inference Logic Error: {e}")
+            for i, _, _ in decoded:
+                results[i] = _get_mock_prediction()
+            continue
+
+        for (i, image_hash, image_phash), result in zip(decoded, rows):
+            result["phash"] = perceptual_hash.to_hex(image_phash)
+            if reuse:
+                _remember_near_duplicate(image_phash, active, cascade, result)
+            results[i] = result
+            if CACHE_ENABLED:
+                get_cache().put(image_hash, version, dict(result))
+    return results
+
+def warm_up():
+    # Load the model and push one dummy batch through it so the first farmer's
+    # upload doesn't pay for loading, tracing or connecting to the model server
+    load_model()
+    if model is None:
+        return False
+    started = time.perf_counter()
+    _run_model(np.zeros((1, IMG_SIZE, IMG_SIZE, 3), dtype=np.float32))
+    print(f"Model warm-up done in {(time.perf_counter() - started) * 1000:.0f} ms.")
+    if NEAR_DUPLICATE_DISTANCE is not None and _active is not None:
+        with _near_duplicate_lock:
+            _near_duplicate_index(_active, _cascade)
+    return True
+
+def model_expected():
+    # False when no model is configured, i.e. MOCK mode is intended
+    return (
+        INFERENCE_MODE == "remote"
+        or registry.current_version(registry.REGISTRY_DIR) is not None
+        or os.path.exists(MODEL_PATH)
+    )
+
+def shutdown(timeout=30.0):
+    # Finish in-flight inference work, then stop the pool and the batcher
+    global _executor, _batcher, _shadow_queue
+    executor, batcher, shadow_queue = _executor, _batcher, _shadow_queue
+    _executor = _batcher = _shadow_queue = None
+    if executor is not None:
+        executor.shutdown(wait=True)
+    if batcher is not None:
+        batcher.close(timeout)
+    if shadow_queue is not None:
+        try:
+            shadow_queue.put_nowait(None)  # pending shadow samples are dropped
+        except queue.Full:
+            pass
+
+async def predict_disease_async(image_path, crop=None):
+    # Runs predict_disease on the bounded inference pool and awaits the result
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), predict_disease, image_path, crop)
+
+async def predict_batch_async(image_paths, crop=None):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), predict_batch, image_paths, crop)
+
 def _get_mock_prediction(reason=None):
     # Randomly select a disease for demonstration if model fails or is missing
     result = random.choice(CLASS_INFO)
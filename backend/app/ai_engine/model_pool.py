@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class ModelPool:
+    """
+    Lazily loaded models keyed by name (e.g. crop), kept under a memory budget.
+
+    `load(key)` returns (model, size_bytes). When the sizes of the loaded models
+    add up to more than `budget_bytes`, the least recently used ones are
+    evicted; a request still running on an evicted model keeps its reference
+    and finishes normally. Concurrent requests for a key that is not loaded yet
+    wait for a single load. A model bigger than the whole budget is still
+    served, on its own.
+    """
+
+    def __init__(self, load, budget_bytes):
+        self._load = load
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()  # key -> (model, size_bytes), oldest first
+        self._loading = {}
+        self._lock = threading.Lock()
+
+        # Stats
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            future = self._loading.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._loading[key] = future
+
+        if not leader:
+            return future.result()
+        try:
+            model, size = self._load(key)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._loading[key]
+            self._entries[key] = (model, size)
+            self.loads += 1
+            self._evict()
+        future.set_result(model)
+        return model
+
+    def peek(self, key):
+        # The loaded model for key, or None; does not load or touch LRU order
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def _evict(self):
+        used = sum(size for _, size in self._entries.values())
+        while used > self.budget_bytes and len(self._entries) > 1:
+            _, (_, size) = self._entries.popitem(last=False)
+            used -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded": {key: size for key, (_, size) in self._entries.items()},
+                "used_bytes": sum(size for _, size in self._entries.values()),
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
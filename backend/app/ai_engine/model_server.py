@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import struct
+import threading
+
+import numpy as np
+
+# Local model server: one process owns TensorFlow and the model, API workers
+# send it preprocessed tensors over a Unix socket (or localhost TCP).
+#
+#     python -m app.ai_engine.model_server --address /tmp/plant-disease-model.sock
+#
+# API workers use it with INFERENCE_MODE=remote and MODEL_SERVER_ADDRESS set to
+# the same address. Requests from all workers share the server's micro-batcher.
+#
+# Wire format (both directions): !II header_len payload_len, JSON header, raw payload.
+
+DEFAULT_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS", "/tmp/plant-disease-model.sock")
+_FRAME = struct.Struct("!II")
+
+
+def _parse_address(address):
+    # "tcp://host:port" -> (AF_INET, (host, port)); anything else is a Unix socket path
+    if address.startswith("tcp://"):
+        host, port = address[len("tcp://"):].rsplit(":", 1)
+        return socket.AF_INET, (host, int(port))
+    if address.startswith("unix://"):
+        address = address[len("unix://"):]
+    return socket.AF_UNIX, address
+
+
+def _recv_exact(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError("Connection closed")
+        received += n
+    return buf
+
+
+def send_frame(sock, header, payload=b""):
+    head = json.dumps(header).encode()
+    sock.sendall(_FRAME.pack(len(head), len(payload)) + head)
+    if payload:
+        sock.sendall(payload)
+
+
+def recv_frame(sock):
+    head_len, payload_len = _FRAME.unpack(_recv_exact(sock, _FRAME.size))
+    header = json.loads(bytes(_recv_exact(sock, head_len)))
+    payload = _recv_exact(sock, payload_len) if payload_len else b""
+    return header, payload
+
+
+def _tensor_header(array, **extra):
+    return {"shape": list(array.shape), "dtype": str(array.dtype), **extra}
+
+
+def _tensor_from(header, payload):
+    return np.frombuffer(payload, dtype=np.dtype(header["dtype"])).reshape(header["shape"])
+
+
+class ModelServerClient:
+    """Thin client used by API workers; one connection per calling thread."""
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=30.0):
+        self.address = address
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        family, addr = _parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(addr)
+        self._local.sock = sock
+        return sock
+
+    def _request(self, header, payload=b""):
+        # One retry on a broken connection (e.g. the server was restarted)
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None) or self._connect()
+            try:
+                send_frame(sock, header, payload)
+                response, data = recv_frame(sock)
+                break
+            except (ConnectionError, OSError):
+                sock.close()
+                self._local.sock = None
+                if attempt:
+                    raise
+        if not response.get("ok"):
+            raise RuntimeError(f"Model server error: {response.get('error')}")
+        return response, data
+
+    def predict(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        response, data = self._request(_tensor_header(batch, op="predict"), batch.tobytes())
+        return _tensor_from(response, data)
+
+    def info(self):
+        response, _ = self._request({"op": "info"})
+        return response
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        sock = self.request
+        while True:
+            try:
+                header, payload = recv_frame(sock)
+            except (ConnectionError, OSError):
+                return
+            try:
+                op = header.get("op")
+                if op == "predict":
+                    outputs = self.server.predict(_tensor_from(header, payload))
+                    send_frame(sock, _tensor_header(outputs, ok=True), outputs.tobytes())
+                elif op == "info":
+                    send_frame(sock, {"ok": True, **self.server.info()})
+                else:
+                    send_frame(sock, {"ok": False, "error": f"Unknown op {op!r}"})
+            except (ConnectionError, OSError):
+                return
+            except Exception as e:
+                send_frame(sock, {"ok": False, "error": str(e)})
+
+
+class _ServerMixin:
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def setup_model(self):
+        # The server always runs the model in-process, whatever the API workers use
+        os.environ["INFERENCE_MODE"] = "local"
+        # Requests from API workers arrive unannounced: always wait up to INFERENCE_MAX_WAIT_MS
+        os.environ["INFERENCE_BATCH_WAIT_FOR_EXPECTED"] = "0"
+        from . import inference
+
+        self.inference = inference
+        inference.load_model()
+        if inference.model is None:
+            raise RuntimeError(f"No model at {inference.MODEL_PATH}")
+
+    def predict(self, batch):
+        inference = self.inference
+        inference._check_model_file()
+        active = inference._active  # one model for the whole request, even across a hot swap
+        if inference.BATCHING_ENABLED and len(batch) < inference.MAX_BATCH_SIZE:
+            # Rows from every connected API worker are merged by the micro-batcher
+            futures = [inference.get_batcher().submit(row, key=active) for row in batch]
+            return np.stack([f.result() for f in futures]).astype(np.float32, copy=False)
+        return np.asarray(inference._run_model(batch, active), dtype=np.float32)
+
+    def info(self):
+        stats = self.inference.get_stats()
+        return {"model_version": self.inference.model_version, "pid": os.getpid(), "stats": stats}
+
+
+class UnixModelServer(_ServerMixin, socketserver.ThreadingUnixStreamServer):
+    pass
+
+
+class TCPModelServer(_ServerMixin, socketserver.ThreadingTCPServer):
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the disease model to API workers over a local socket")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="Unix socket path or tcp://host:port")
+    args = parser.parse_args()
+
+    family, addr = _parse_address(args.address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(addr):
+            os.remove(addr)  # stale socket from a previous run
+        server = UnixModelServer(addr, _Handler)
+    else:
+        server = TCPModelServer(addr, _Handler)
+
+    server.setup_model()
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    print(f"Model server listening on {args.address} (model version {server.inference.model_version}).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if server.inference._batcher is not None:
+            server.inference._batcher.close()
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.remove(addr)
+
+
+if __name__ == "__main__":
+    main()
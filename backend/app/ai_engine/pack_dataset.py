@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .dataset_files import list_split
+
+# Pack the PlantVillage folder once into memory-mapped uint8 shards, so repeat
+# training runs (`train_model --pipeline packed`) skip JPEG decoding entirely.
+# Run from the backend directory:
+#
+#     python -m app.ai_engine.pack_dataset --dataset dataset/PlantVillage --output dataset/packed
+#
+# Layout of the output directory:
+#     manifest.json        classes, image size, shard list, train/validation counts
+#     labels.npy           int16 class index per image (-1 = image failed to decode)
+#     images-00000.npy     (n, 224, 224, 3) uint8, readable with np.load(mmap_mode="r")
+#
+# Images use the same 80/20 split and class order as flow_from_directory. The
+# training images are stored first, in a seeded shuffled order, so contiguous
+# slices are already well mixed; the validation images follow in sorted order.
+
+MANIFEST_VERSION = 1
+DEFAULT_SHARD_SIZE = 4096  # ~600 MB per shard at 224x224x3
+
+
+def _load(args):
+    path, img_size = args
+    from .inference import load_pixels
+
+    try:
+        return load_pixels(path, size=img_size)
+    except Exception:
+        return None
+
+
+def pack(dataset_dir, output_dir, img_size=224, validation_split=0.2, shard_size=DEFAULT_SHARD_SIZE,
+         workers=None, seed=0):
+    (train_paths, train_labels), (val_paths, val_labels), class_indices = list_split(dataset_dir, validation_split)
+    order = np.random.default_rng(seed).permutation(len(train_paths))
+    paths = [train_paths[i] for i in order] + val_paths
+    labels = np.array([train_labels[i] for i in order] + val_labels, dtype=np.int16)
+
+    # Build in a temporary directory and swap it in, so a reader never sees a
+    # half-written pack
+    tmp_dir = f"{output_dir.rstrip(os.sep)}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    shards, failed = [], []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        decoded = pool.map(_load, ((path, img_size) for path in paths), chunksize=32)
+        for shard_start in range(0, len(paths), shard_size):
+            count = min(shard_size, len(paths) - shard_start)
+            name = f"images-{len(shards):05d}.npy"
+            shard = np.lib.format.open_memmap(
+                os.path.join(tmp_dir, name), mode="w+", dtype=np.uint8, shape=(count, img_size, img_size, 3)
+            )
+            for offset in range(count):
+                pixels = next(decoded)
+                index = shard_start + offset
+                if pixels is None:
+                    shard[offset] = 0
+                    labels[index] = -1
+                    failed.append(paths[index])
+                else:
+                    shard[offset] = pixels
+            shard.flush()
+            del shard
+            shards.append({"file": name, "count": count})
+            print(f"Packed {shard_start + count}/{len(paths)} images "
+                  f"({(shard_start + count) / (time.perf_counter() - started):.0f} img/s)")
+
+    np.save(os.path.join(tmp_dir, "labels.npy"), labels)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "img_size": img_size,
+        "class_indices": class_indices,
+        "validation_split": validation_split,
+        "train_count": len(train_paths),
+        "val_count": len(val_paths),
+        "shards": shards,
+        "failed": failed,
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+    return manifest
+
+
+class PackedDataset:
+    """
+    Read-only view of a packed dataset. Shards are memory-mapped, so batches
+    are slices of the page cache: nothing is decoded or copied on read, and
+    several training processes on one host share the same memory.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported packed dataset version {self.manifest.get('version')}")
+        self.class_indices = self.manifest["class_indices"]
+        self.img_size = self.manifest["img_size"]
+        self.labels = np.load(os.path.join(directory, "labels.npy"), mmap_mode="r")
+        self.shards = [np.load(os.path.join(directory, s["file"]), mmap_mode="r") for s in self.manifest["shards"]]
+        self._starts = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    def subset_range(self, subset):
+        train_count = self.manifest["train_count"]
+        if subset == "training":
+            return 0, train_count
+        if subset == "validation":
+            return train_count, train_count + self.manifest["val_count"]
+        raise ValueError(f"Unknown subset {subset!r}")
+
+    def count(self, subset):
+        start, stop = self.subset_range(subset)
+        return stop - start
+
+    def _blocks(self, start, stop, batch_size):
+        # (shard index, local start, local stop, global start) blocks that never
+        # straddle a shard boundary, so every block is a plain slice
+        blocks = []
+        for index, shard in enumerate(self.shards):
+            lo = max(start, self._starts[index])
+            hi = min(stop, self._starts[index + 1])
+            for block_start in range(lo, hi, batch_size):
+                block_stop = min(block_start + batch_size, hi)
+                base = self._starts[index]
+                blocks.append((index, block_start - base, block_stop - base, block_start))
+        return blocks
+
+    def batches(self, subset="training", batch_size=32, shuffle=False, seed=None):
+        # Yields (images, labels): images is a read-only (n, size, size, 3) uint8
+        # view into the memmap. Shuffling reorders whole blocks; images within
+        # the training range were already shuffled when packing.
+        start, stop = self.subset_range(subset)
+        blocks = self._blocks(start, stop, batch_size)
+        if shuffle:
+            order = np.random.default_rng(seed).permutation(len(blocks))
+            blocks = [blocks[i] for i in order]
+        for index, lo, hi, global_start in blocks:
+            images = self.shards[index][lo:hi]
+            labels = self.labels[global_start:global_start + (hi - lo)]
+            if (labels < 0).any():
+                keep = labels >= 0  # skip images that failed to decode (copies this block only)
+                images, labels = images[keep], labels[keep]
+            if len(labels):
+                yield images, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack an image folder dataset into memory-mapped shards")
+    parser.add_argument("--dataset", default="dataset/PlantVillage")
+    parser.add_argument("--output", default="dataset/packed")
+    parser.add_argument("--img-size", type=int, default=224)
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE, help="Images per shard file")
+    parser.add_argument("--workers", type=int, default=None, help="Decode processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the stored training order")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.dataset):
+        raise SystemExit(f"Dataset not found at {args.dataset}")
+
+    started = time.perf_counter()
+    manifest = pack(args.dataset, args.output, img_size=args.img_size, shard_size=args.shard_size,
+                    workers=args.workers, seed=args.seed)
+    total = manifest["train_count"] + manifest["val_count"]
+    size = sum(os.path.getsize(os.path.join(args.output, s["file"])) for s in manifest["shards"])
+    print(f"Packed {total} images ({manifest['train_count']} training, {manifest['val_count']} validation, "
+          f"{len(manifest['class_indices'])} classes) into {len(manifest['shards'])} shards, "
+          f"{size / 1e9:.2f} GB in {time.perf_counter() - started:.0f}s.")
+    if manifest["failed"]:
+        print(f"{len(manifest['failed'])} images could not be decoded and are skipped by the loader.")
+
+
+if __name__ == "__main__":
+    main()
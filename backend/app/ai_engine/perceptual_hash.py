@@ -0,0 +1,149 @@
+import numpy as np
+
+# Perceptual hashing for near-duplicate uploads: burst shots of the same leaf
+# and recompressed forwards get different bytes (so the content-hash cache
+# misses them) but nearly the same 64-bit pHash. The pHash is computed from the
+# preprocessed 224x224 model input:
+#   grayscale -> 32x32 block means -> 2D DCT -> the 8x8 lowest frequencies,
+#   each bit set when the coefficient is above their median.
+# Similar images differ in a few bits. Two indexes find stored hashes within a
+# Hamming radius without comparing against every one of them. MultiIndexHash
+# serves a fixed radius; it is what inference uses, and at radius 6 it is much
+# faster than BKTree. BKTree answers any radius. It only prunes well when
+# hashes cluster. benchmarks/bench_near_duplicates.py compares both with a
+# linear scan.
+
+HASH_SIZE = 8
+DCT_SIZE = 32
+
+
+def _dct_matrix(n):
+    # Orthonormal DCT-II: coefficients = D @ x @ D.T
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(DCT_SIZE)
+
+
+def phash(image):
+    # 64-bit pHash of an (H, W, 3) image (uint8 or float, any scale), H, W >= 32
+    image = np.asarray(image, dtype=np.float32)
+    gray = image[..., 0] * 0.299 + image[..., 1] * 0.587 + image[..., 2] * 0.114
+    h, w = gray.shape
+    bh, bw = h // DCT_SIZE, w // DCT_SIZE
+    small = gray[:bh * DCT_SIZE, :bw * DCT_SIZE].reshape(DCT_SIZE, bh, DCT_SIZE, bw).mean(axis=(1, 3))
+    low = (_DCT @ small @ _DCT.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    bits = low > np.median(low[1:])  # DC term excluded from the median: it only tracks brightness
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def to_hex(value):
+    return f"{value:016x}"
+
+
+def from_hex(text):
+    return int(text, 16)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes with the Hamming distance. Each
+    node keeps its children by their distance to it, so a radius-r query only
+    descends into children at distance d - r .. d + r of the query. Adding a
+    hash that is already in the tree replaces its value.
+    """
+
+    def __init__(self):
+        self._root = None  # [hash, value, {distance: child}]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, key, value):
+        if self._root is None:
+            self._root = [key, value, {}]
+            self._size = 1
+            return
+        node = self._root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1] = value
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, value, {}]
+                self._size += 1
+                return
+            node = child
+
+    def nearest(self, key, radius):
+        # (distance, value) of the closest hash within `radius`, or None
+        best = None
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(key, node[0])
+            if distance <= radius:
+                best = (distance, node[1])
+                if distance == 0:
+                    break
+                radius = distance - 1  # from now on only a closer match helps
+            for d, child in node[2].items():
+                if distance - radius <= d <= distance + radius:
+                    stack.append(child)
+        return best
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing for a fixed radius r: the 64 bits are split into r + 1
+    chunks, and by the pigeonhole principle any hash within r bits of a query
+    matches it exactly on at least one chunk. A lookup only measures the
+    hashes sharing a chunk value with the query (one dict lookup per chunk)
+    instead of walking a tree. Same interface as BKTree; `radius` may not
+    exceed the one it was built for.
+    """
+
+    def __init__(self, radius):
+        self.radius = radius
+        chunks = radius + 1
+        bounds = [round(i * 64 / chunks) for i in range(chunks + 1)]
+        self._chunks = [(low, (1 << (high - low)) - 1) for low, high in zip(bounds, bounds[1:])]
+        self._tables = [{} for _ in self._chunks]
+        self._values = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, key, value):
+        if key not in self._values:
+            for table, (shift, mask) in zip(self._tables, self._chunks):
+                table.setdefault((key >> shift) & mask, []).append(key)
+        self._values[key] = value
+
+    def nearest(self, key, radius):
+        if radius > self.radius:
+            raise ValueError(f"Index built for radius {self.radius}, asked for {radius}")
+        best = None
+        seen = set()
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            for candidate in table.get((key >> shift) & mask, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                distance = hamming(key, candidate)
+                if distance <= radius and (best is None or distance < best[0]):
+                    best = (distance, candidate)
+                    if distance == 0:
+                        return 0, self._values[candidate]
+        return (best[0], self._values[best[1]]) if best else None
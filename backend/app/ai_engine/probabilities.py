@@ -0,0 +1,123 @@
+import hashlib
+
+import numpy as np
+
+# Full class-probability vectors stored with each Prediction. A vector is the
+# model's softmax output in CLASS_INFO order, as little-endian float16 (15
+# classes -> a 30-byte blob). The label_map_id of that class list is stored
+# next to it, so vectors stay interpretable if CLASS_INFO ever changes.
+#
+# Everything below works on whole (n, classes) matrices. Bulk analysis is
+# then a table scan plus a few NumPy operations, with no per-row Python.
+
+DTYPE = np.dtype("<f2")
+CALIBRATION_BINS = 15
+CONFIDENCE_THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95)
+TEMPERATURES = np.round(np.arange(0.5, 5.01, 0.05), 2)
+EPSILON = 1e-7
+
+
+def label_map_id(labels):
+    # Short, stable id of an ordered class list
+    return hashlib.sha256("\n".join(labels).encode()).hexdigest()[:16]
+
+
+def encode(probs):
+    return np.asarray(probs, dtype=DTYPE).tobytes()
+
+
+def decode(blobs, num_classes):
+    # One float32 (n, num_classes) matrix from n blobs, parsed in a single call
+    if not blobs:
+        return np.zeros((0, num_classes), dtype=np.float32)
+    return np.frombuffer(b"".join(blobs), dtype=DTYPE).reshape(-1, num_classes).astype(np.float32)
+
+
+def top_k(probs, k):
+    # Indices and probabilities of the k most likely classes per row, highest first
+    k = max(1, min(k, probs.shape[1]))
+    indices = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+    values = np.take_along_axis(probs, indices, axis=1)
+    order = np.argsort(-values, axis=1, kind="stable")
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+def with_temperature(probs, temperature):
+    # softmax(log(p) / T): the stored probabilities stand in for logits
+    logits = np.log(probs + EPSILON) / temperature
+    logits -= logits.max(axis=1, keepdims=True)
+    scaled = np.exp(logits)
+    return scaled / scaled.sum(axis=1, keepdims=True)
+
+
+def confidence_summary(probs, thresholds=CONFIDENCE_THRESHOLDS):
+    # Label-free view: how confident and how decisive the model is, and the
+    # share of predictions each confidence threshold would let through
+    if not len(probs):
+        return {"count": 0}
+    ranked = np.sort(probs, axis=1)
+    confidence = ranked[:, -1]
+    margin = confidence - ranked[:, -2] if probs.shape[1] > 1 else confidence
+    entropy = -np.sum(probs * np.log(probs + EPSILON), axis=1)
+    return {
+        "count": int(len(probs)),
+        "mean_confidence": round(float(confidence.mean()), 4),
+        "median_confidence": round(float(np.median(confidence)), 4),
+        "mean_margin": round(float(margin.mean()), 4),
+        "mean_entropy": round(float(entropy.mean()), 4),
+        "coverage": {f"{t:g}": round(float(np.mean(confidence >= t)), 4) for t in thresholds},
+    }
+
+
+def calibration(probs, labels, bins=CALIBRATION_BINS):
+    # Accuracy, expected/maximum calibration error (equal-width confidence
+    # bins), Brier score and NLL of `probs` against integer `labels`
+    if not len(probs):
+        return {"count": 0}
+    n, num_classes = probs.shape
+    predicted = probs.argmax(axis=1)
+    confidence = probs[np.arange(n), predicted]
+    correct = predicted == labels
+
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    which = np.clip(np.digitize(confidence, edges[1:-1]), 0, bins - 1)
+    counts = np.bincount(which, minlength=bins)
+    bin_confidence = np.bincount(which, weights=confidence, minlength=bins)
+    bin_correct = np.bincount(which, weights=correct, minlength=bins)
+    filled = counts > 0
+    gaps = np.abs(bin_correct[filled] - bin_confidence[filled]) / counts[filled]
+
+    one_hot = np.eye(num_classes, dtype=np.float32)[labels]
+    return {
+        "count": int(n),
+        "accuracy": round(float(correct.mean()), 4),
+        "mean_confidence": round(float(confidence.mean()), 4),
+        "ece": round(float(np.sum(gaps * counts[filled]) / n), 4),
+        "mce": round(float(gaps.max()), 4),
+        "brier": round(float(np.mean(np.sum((probs - one_hot) ** 2, axis=1))), 4),
+        "nll": round(float(-np.mean(np.log(probs[np.arange(n), labels] + EPSILON))), 4),
+        "reliability": [
+            {
+                "lower": round(float(edges[b]), 4),
+                "upper": round(float(edges[b + 1]), 4),
+                "count": int(counts[b]),
+                "confidence": round(float(bin_confidence[b] / counts[b]), 4),
+                "accuracy": round(float(bin_correct[b] / counts[b]), 4),
+            }
+            for b in np.flatnonzero(filled)
+        ],
+    }
+
+
+def fit_temperature(probs, labels, temperatures=TEMPERATURES):
+    # Temperature minimising NLL on (probs, labels), by grid search
+    rows = np.arange(len(probs))
+    log_probs = np.log(probs + EPSILON)
+    best, best_nll = 1.0, np.inf
+    for temperature in temperatures:
+        logits = log_probs / temperature
+        logits -= logits.max(axis=1, keepdims=True)
+        nll = float(np.mean(np.log(np.exp(logits).sum(axis=1)) - logits[rows, labels]))
+        if nll < best_nll:
+            best, best_nll = float(temperature), nll
+    return best
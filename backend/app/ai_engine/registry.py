@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime
+
+from .cache import file_hash
+
+# Versioned model bundles. A registry is a directory of immutable bundles plus a
+# CURRENT file naming the active one:
+#
+#     models/
+#         CURRENT                          "20240501120000-1a2b3c4d"
+#         20240501120000-1a2b3c4d/
+#             bundle.json                  version, labels, preprocessing, sha256, metrics
+#             model.h5                     keras backend
+#             model.tflite                 tflite backend (optional)
+#
+# Publishing writes a new bundle directory; activating rewrites CURRENT
+# atomically. Running API workers notice the change within MODEL_CHECK_INTERVAL,
+# load and warm the new bundle in the background, then swap it in; requests
+# already running finish on the old model.
+#
+#     python -m app.ai_engine.registry publish --model plant_disease_model.h5 --activate
+#     python -m app.ai_engine.registry activate 20240501120000-1a2b3c4d
+#     python -m app.ai_engine.registry list
+
+REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR") or os.path.join(os.path.dirname(__file__), "models")
+CURRENT_FILE = "CURRENT"
+BUNDLE_FILE = "bundle.json"
+BUNDLE_FORMAT = 1
+MODEL_FILES = {"keras": "model.h5", "tflite": "model.tflite"}
+
+# What inference.preprocess_image does; a bundle trained differently is refused
+PREPROCESSING = {
+    "img_size": 224,
+    "color": "RGB",
+    "exif_transpose": True,
+    "resize": "bilinear",
+    "scale": 1.0 / 255.0,
+}
+
+
+def _tokens(label):
+    # "Tomato__Tomato_YellowLeaf__Curl_Virus" -> ["tomato", "yellow", "leaf", "curl", "virus"]
+    words = re.sub(r"([a-z])([A-Z])", r"\1 \2", label)
+    tokens = []
+    for token in re.split(r"[^0-9a-zA-Z]+", words.lower()):
+        if token and token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+def map_labels(labels, class_names):
+    # Index into class_names for every model output label. A class name matches
+    # when its tokens are a prefix of the label's tokens (PlantVillage folder
+    # names carry extra words, e.g. "Tomato_Spider_mites_Two_spotted_spider_mite");
+    # the longest match wins.
+    class_tokens = [_tokens(name) for name in class_names]
+    mapping = []
+    for label in labels:
+        tokens = _tokens(label)
+        matches = [
+            (len(candidate), index) for index, candidate in enumerate(class_tokens)
+            if candidate and tokens[:len(candidate)] == candidate
+        ]
+        if not matches:
+            raise ValueError(f"Model label {label!r} does not match any known class")
+        mapping.append(max(matches)[1])
+    if len(set(mapping)) != len(mapping):
+        raise ValueError(f"Several model labels map to the same class: {labels}")
+    return mapping
+
+
+class ModelBundle:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, BUNDLE_FILE)) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != BUNDLE_FORMAT:
+            raise ValueError(f"Unsupported bundle format {self.manifest.get('format')} in {directory}")
+        self.version = self.manifest["version"]
+        self.labels = self.manifest["labels"]
+        self.preprocessing = self.manifest["preprocessing"]
+        self.metrics = self.manifest.get("metrics") or {}
+
+    def model_path(self, backend):
+        name = self.manifest["files"].get(backend)
+        if name is None:
+            raise ValueError(f"Bundle {self.version} has no {backend} model")
+        return os.path.join(self.directory, name)
+
+    def verify(self):
+        # Refuse a bundle whose files were modified or truncated after publishing
+        for name, digest in self.manifest["sha256"].items():
+            if file_hash(os.path.join(self.directory, name)) != digest:
+                raise ValueError(f"Bundle {self.version}: {name} does not match its recorded hash")
+
+    def info(self):
+        return {
+            "version": self.version,
+            "created_at": self.manifest.get("created_at"),
+            "backends": sorted(self.manifest["files"]),
+            "classes": len(self.labels),
+            "metrics": self.metrics,
+        }
+
+
+def current_version(registry_dir=REGISTRY_DIR):
+    try:
+        with open(os.path.join(registry_dir, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def load_bundle(version=None, registry_dir=REGISTRY_DIR):
+    version = version or current_version(registry_dir)
+    if version is None:
+        raise ValueError(f"No active model in {registry_dir}")
+    return ModelBundle(os.path.join(registry_dir, version))
+
+
+def list_versions(registry_dir=REGISTRY_DIR):
+    if not os.path.isdir(registry_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(registry_dir)
+        if os.path.exists(os.path.join(registry_dir, name, BUNDLE_FILE))
+    )
+
+
+def activate(version, registry_dir=REGISTRY_DIR):
+    bundle = load_bundle(version, registry_dir)
+    bundle.verify()
+    path = os.path.join(registry_dir, CURRENT_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        f.write(version + "\n")
+    os.replace(f"{path}.tmp", path)
+    return bundle
+
+
+def publish(model_path, class_indices_path=None, tflite_path=None, metrics_path=None,
+            registry_dir=REGISTRY_DIR, class_names=None, activate_now=False):
+    # class_indices.json defaults to the one train_model writes next to the model
+    class_indices_path = class_indices_path or os.path.join(os.path.dirname(os.path.abspath(model_path)),
+                                                            "class_indices.json")
+    with open(class_indices_path) as f:
+        class_indices = json.load(f)
+    labels = sorted(class_indices, key=class_indices.get)
+    if class_names is not None:
+        map_labels(labels, class_names)  # fail now rather than on every server
+
+    sources = {"keras": model_path}
+    if tflite_path:
+        sources["tflite"] = tflite_path
+    digest = file_hash(model_path)
+    version = f"{datetime.utcnow():%Y%m%d%H%M%S}-{digest[:8]}"
+
+    os.makedirs(registry_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".publish-", dir=registry_dir)
+    try:
+        files, hashes = {}, {}
+        for backend, source in sources.items():
+            name = MODEL_FILES[backend]
+            shutil.copyfile(source, os.path.join(staging, name))
+            files[backend] = name
+            hashes[name] = file_hash(os.path.join(staging, name))
+
+        metrics = None
+        if metrics_path:
+            with open(metrics_path) as f:
+                metrics = json.load(f)
+        manifest = {
+            "format": BUNDLE_FORMAT,
+            "version": version,
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "labels": labels,
+            "preprocessing": PREPROCESSING,
+            "files": files,
+            "sha256": hashes,
+            "metrics": metrics,
+        }
+        with open(os.path.join(staging, BUNDLE_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(staging, os.path.join(registry_dir, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    if activate_now:
+        activate(version, registry_dir)
+    return version
+
+
+def main():
+    from .inference import CLASS_INFO
+
+    parser = argparse.ArgumentParser(description="Manage versioned model bundles")
+    parser.add_argument("--registry", default=REGISTRY_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    publish_cmd = commands.add_parser("publish", help="Create a bundle from a trained model")
+    publish_cmd.add_argument("--model", required=True, help="Keras .h5 model")
+    publish_cmd.add_argument("--class-indices", help="Defaults to class_indices.json next to the model")
+    publish_cmd.add_argument("--tflite", help="Optional .tflite conversion of the same model")
+    publish_cmd.add_argument("--metrics", help="Optional metrics JSON (e.g. the train_model report)")
+    publish_cmd.add_argument("--activate", action="store_true", help="Make it the active version")
+
+    activate_cmd = commands.add_parser("activate", help="Switch the active version")
+    activate_cmd.add_argument("version")
+
+    commands.add_parser("list", help="List bundles")
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        version = publish(args.model, args.class_indices, args.tflite, args.metrics, args.registry,
+                          class_names=[c["name"] for c in CLASS_INFO], activate_now=args.activate)
+        print(f"Published {version}{' (active)' if args.activate else ''}")
+    elif args.command == "activate":
+        bundle = activate(args.version, args.registry)
+        print(f"Active version is now {bundle.version}")
+    else:
+        current = current_version(args.registry)
+        for version in list_versions(args.registry):
+            info = load_bundle(version, args.registry).info()
+            marker = "*" if version == current else " "
+            print(f"{marker} {version}  backends={','.join(info['backends'])}  classes={info['classes']}")
+
+
+if __name__ == "__main__":
+    main()
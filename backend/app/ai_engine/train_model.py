@@ -1,8 +1,17 @@
 import tensorflow as tf
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout
+import argparse
+import json
 import os
+import shutil
+import time
+import numpy as np
+from .architectures import ARCHITECTURES, DEFAULT_ARCHITECTURE, build_model
+from .backends import TFLiteBackend
+from .checkpointing import ResumableTraining
+from .dataset_files import crop_classes
+from . import registry
+from .convert_tflite import convert
 
 # Configuration
 IMG_HEIGHT = 224
@@ -10,12 +19,28 @@ IMG_WIDTH = 224
 BATCH_SIZE = 32
 EPOCHS = 20
 DATASET_DIR = "dataset/PlantVillage" # User needs to place dataset here
+SAVE_PATH = "plant_disease_model.h5"
 
-def train_model():
-    if not os.path.exists(DATASET_DIR):
-        print(f"Dataset not found at {DATASET_DIR}. Please download PlantVillage dataset.")
-        return
+# Checkpointing / early stopping (see checkpointing.py). Checkpoints default to
+# checkpoints/<architecture>; an interrupted run resumes from the last epoch.
+CHECKPOINT_ROOT = "checkpoints"
+PATIENCE = 3  # epochs without a val_loss improvement before stopping
+
+# Input pipeline: "generator" (ImageDataGenerator), "tfdata" (data_pipeline.py)
+# or "packed" (memory-mapped shards written by pack_dataset.py)
+PIPELINES = ("generator", "tfdata", "packed")
+PACKED_DIR = "dataset/packed"
+
+# Per-crop sub-models (--crop): trained on that crop's class folders only and
+# saved where inference looks for them (inference.CROP_MODEL_DIR)
+CROP_MODEL_ROOT = "app/ai_engine/crop_models"
 
+# Post-training quantization export
+QUANTIZATION_VARIANTS = ("dynamic", "int8")
+REPRESENTATIVE_SAMPLES = 200  # training images used to calibrate full-integer quantization
+LATENCY_ITERATIONS = 50
+
+def generator_inputs(classes=None):
     # Data Augmentation & Preprocessing
     train_datagen = ImageDataGenerator(
         rescale=1./255,
@@ -33,6 +58,7 @@ def train_model():
         target_size=(IMG_HEIGHT, IMG_WIDTH),
         batch_size=BATCH_SIZE,
         class_mode='categorical',
+        classes=classes,
         subset='training'
     )
 
@@ -41,25 +67,62 @@ def train_model():
         target_size=(IMG_HEIGHT, IMG_WIDTH),
         batch_size=BATCH_SIZE,
         class_mode='categorical',
+        classes=classes,
         subset='validation'
     )
+    return (
+        train_generator, validation_generator, train_generator.class_indices,
+        train_generator.samples // BATCH_SIZE, validation_generator.samples // BATCH_SIZE
+    )
+
+def tfdata_inputs(cache_dir=None, classes=None):
+    from .data_pipeline import load_datasets
+
+    train_ds, val_ds, class_indices, _, _ = load_datasets(
+        DATASET_DIR, img_size=IMG_HEIGHT, batch_size=BATCH_SIZE, validation_split=0.2, cache_dir=cache_dir,
+        classes=classes
+    )
+    # Finite datasets: each epoch is one full pass, so no step counts
+    return train_ds, val_ds, class_indices, None, None
 
-    # Build CNN Model
-    model = Sequential([
-        Conv2D(32, (3, 3), activation='relu', input_shape=(IMG_HEIGHT, IMG_WIDTH, 3)),
-        MaxPooling2D(2, 2),
-        
-        Conv2D(64, (3, 3), activation='relu'),
-        MaxPooling2D(2, 2),
-        
-        Conv2D(128, (3, 3), activation='relu'),
-        MaxPooling2D(2, 2),
-        
-        Flatten(),
-        Dense(512, activation='relu'),
-        Dropout(0.5),
-        Dense(train_generator.num_classes, activation='softmax')
-    ])
+def packed_inputs(packed_dir=PACKED_DIR):
+    from .data_pipeline import load_packed_datasets
+
+    train_ds, val_ds, class_indices, _, _ = load_packed_datasets(packed_dir, batch_size=BATCH_SIZE)
+    return train_ds, val_ds, class_indices, None, None
+
+def train_model(architecture=DEFAULT_ARCHITECTURE, quantize=QUANTIZATION_VARIANTS, pipeline="generator",
+                cache_dir=None, packed_dir=PACKED_DIR, save_path=SAVE_PATH, checkpoint_dir=None,
+                resume=True, epochs=EPOCHS, patience=PATIENCE, publish=False, crop=None):
+    if not os.path.exists(DATASET_DIR):
+        print(f"Dataset not found at {DATASET_DIR}. Please download PlantVillage dataset.")
+        return
+
+    classes = None
+    if crop:
+        classes = crop_classes(DATASET_DIR, crop)
+        if not classes:
+            print(f"No {crop} class folders found in {DATASET_DIR}.")
+            return
+        if pipeline == "packed" or publish:
+            print("--crop works with the generator and tfdata pipelines, without --publish.")
+            return
+        if cache_dir:
+            cache_dir = os.path.join(cache_dir, crop)
+        print(f"Training the {crop} model on {len(classes)} classes: {', '.join(classes)}")
+
+    if pipeline == "packed":
+        if not os.path.exists(os.path.join(packed_dir, "manifest.json")):
+            print(f"Packed dataset not found at {packed_dir}. Run python -m app.ai_engine.pack_dataset first.")
+            return
+        train_data, validation_data, class_indices, train_steps, validation_steps = packed_inputs(packed_dir)
+    elif pipeline == "tfdata":
+        train_data, validation_data, class_indices, train_steps, validation_steps = tfdata_inputs(cache_dir, classes)
+    else:
+        train_data, validation_data, class_indices, train_steps, validation_steps = generator_inputs(classes)
+
+    # Build CNN Model (see architectures.py)
+    model = build_model(architecture, len(class_indices), (IMG_HEIGHT, IMG_WIDTH, 3))
 
     model.compile(
         optimizer='adam',
@@ -69,24 +132,169 @@ def train_model():
 
     model.summary()
 
+    checkpoint_dir = checkpoint_dir or os.path.join(CHECKPOINT_ROOT, f"{architecture}-{crop}" if crop else architecture)
+    if not resume:
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    # Checkpoints are only resumed by a run with the same model and classes
+    run_config = {"architecture": architecture, "classes": sorted(class_indices, key=class_indices.get)}
+    checkpoints = ResumableTraining(checkpoint_dir, model, run_config=run_config, patience=patience)
+    initial_epoch = checkpoints.restore()
+
     # Train
-    history = model.fit(
-        train_generator,
-        steps_per_epoch=train_generator.samples // BATCH_SIZE,
-        validation_data=validation_generator,
-        validation_steps=validation_generator.samples // BATCH_SIZE,
-        epochs=EPOCHS
+    if checkpoints.stopped or initial_epoch >= epochs:
+        print("Training already finished in these checkpoints; exporting the best model.")
+    else:
+        history = model.fit(
+            train_data,
+            steps_per_epoch=train_steps,
+            validation_data=validation_data,
+            validation_steps=validation_steps,
+            epochs=epochs,
+            initial_epoch=initial_epoch,
+            callbacks=[checkpoints]
+        )
+
+    # Save Model (best epoch by val_loss) + Class Indices for inference mapping, side by side
+    checkpoints.export_best(save_path, class_indices)
+    model.load_weights(save_path)
+    print(f"Model saved to {save_path} (best epoch {checkpoints.best_epoch}, val_loss {checkpoints.best:.4f})")
+
+    export_report(model, save_path, train_data, architecture, quantize, classes)
+
+    if publish:
+        # Versioned bundle in the model registry; activate it with
+        # python -m app.ai_engine.registry activate <version>
+        from .inference import CLASS_INFO
+
+        base, _ = os.path.splitext(save_path)
+        version = registry.publish(
+            save_path, metrics_path=f"{base}_report.json", class_names=[c["name"] for c in CLASS_INFO]
+        )
+        print(f"Published model bundle {version}")
+
+def _representative_data(train_data, samples=REPRESENTATIVE_SAMPLES):
+    # Single images drawn from the training input (same rescaling as training)
+    def generate():
+        seen = 0
+        for images, _ in train_data:
+            for image in np.asarray(images, dtype=np.float32):
+                yield image[np.newaxis]
+                seen += 1
+                if seen >= samples:
+                    return
+    return generate
+
+def _validation_batches(classes=None):
+    # Same 80/20 split as training, but without augmentation or shuffling so
+    # every variant is scored on identical images
+    datagen = ImageDataGenerator(rescale=1./255, validation_split=0.2)
+    return datagen.flow_from_directory(
+        DATASET_DIR,
+        target_size=(IMG_HEIGHT, IMG_WIDTH),
+        batch_size=BATCH_SIZE,
+        class_mode='categorical',
+        classes=classes,
+        subset='validation',
+        shuffle=False
     )
 
-    # Save Model
-    save_path = "plant_disease_model.h5"
-    model.save(save_path)
-    print(f"Model saved to {save_path}")
-    
-    # Save Class Indices for inference mapping
-    import json
-    with open("class_indices.json", "w") as f:
-        json.dump(train_generator.class_indices, f)
+def _latency_ms(predict, iterations=LATENCY_ITERATIONS):
+    image = np.random.default_rng(0).random((1, IMG_HEIGHT, IMG_WIDTH, 3), dtype=np.float32)
+    for _ in range(5):
+        predict(image)
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        predict(image)
+        timings.append((time.perf_counter() - started) * 1000)
+    return float(np.median(timings))
+
+def export_report(model, save_path, train_data, architecture, variants=QUANTIZATION_VARIANTS, classes=None):
+    # Score the float model (params, size, latency, validation accuracy), export
+    # quantized TFLite variants next to the .h5 and report what each one costs
+    # in accuracy and buys in size/latency versus the float model
+    base, _ = os.path.splitext(save_path)
+    validation = _validation_batches(classes)
+    steps = len(validation)
+
+    float_preds, labels = [], []
+    for step in range(steps):
+        images, batch_labels = validation[step]
+        float_preds.append(model.predict(images, verbose=0).argmax(axis=1))
+        labels.append(batch_labels.argmax(axis=1))
+    float_preds = np.concatenate(float_preds)
+    labels = np.concatenate(labels)
+
+    report = [{
+        "architecture": architecture,
+        "variant": "float32",
+        "params": int(model.count_params()),
+        "path": save_path,
+        "size_mb": round(os.path.getsize(save_path) / 1e6, 2),
+        "val_accuracy": round(float(np.mean(float_preds == labels)), 4),
+        "top1_agreement": 1.0,
+        "latency_ms": round(_latency_ms(lambda x: model(x, training=False)), 2),
+    }]
+
+    for variant in variants:
+        path = f"{base}_{variant}.tflite"
+        representative = _representative_data(train_data) if variant == "int8" else None
+        convert(model, path, quantization=variant, representative_data=representative)
+
+        backend = TFLiteBackend(path, [BATCH_SIZE], img_size=IMG_HEIGHT)
+        preds = []
+        for step in range(steps):
+            images, _ = validation[step]
+            preds.append(backend.predict(images).argmax(axis=1))
+        preds = np.concatenate(preds)
+
+        single = TFLiteBackend(path, [1], img_size=IMG_HEIGHT)
+        report.append({
+            "architecture": architecture,
+            "variant": variant,
+            "params": int(model.count_params()),
+            "path": path,
+            "size_mb": round(os.path.getsize(path) / 1e6, 2),
+            "val_accuracy": round(float(np.mean(preds == labels)), 4),
+            "top1_agreement": round(float(np.mean(preds == float_preds)), 4),
+            "latency_ms": round(_latency_ms(single.predict), 2),
+        })
+
+    print(f"\n{architecture}: {model.count_params():,} parameters")
+    print(f"{'variant':<10} {'size MB':>8} {'val acc':>8} {'agree':>7} {'CPU ms/img':>11}")
+    for row in report:
+        print(f"{row['variant']:<10} {row['size_mb']:8.2f} {row['val_accuracy']:8.2%} "
+              f"{row['top1_agreement']:7.2%} {row['latency_ms']:11.2f}")
+
+    report_path = f"{base}_report.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Model report saved to {report_path}")
+    return report
 
 if __name__ == "__main__":
-    train_model()
+    parser = argparse.ArgumentParser(description="Train the crop disease model")
+    parser.add_argument("--architecture", choices=ARCHITECTURES, default=DEFAULT_ARCHITECTURE,
+                        help="Model architecture (see architectures.py)")
+    parser.add_argument("--pipeline", choices=PIPELINES, default="generator",
+                        help="Training input: ImageDataGenerator or the parallel tf.data pipeline")
+    parser.add_argument("--cache-dir", help="tf.data only: cache resized images here after the first epoch")
+    parser.add_argument("--packed-dir", default=PACKED_DIR, help="packed only: output of pack_dataset")
+    parser.add_argument("--output", help=f"Final model path, default {SAVE_PATH} (or {CROP_MODEL_ROOT}/<crop>/ "
+                                          "with --crop); class_indices.json is written next to it")
+    parser.add_argument("--crop", help="Train a per-crop sub-model (e.g. tomato) on that crop's classes only")
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--patience", type=int, default=PATIENCE, help="Early stopping patience in epochs")
+    parser.add_argument("--checkpoint-dir", help=f"Defaults to {CHECKPOINT_ROOT}/<architecture>")
+    parser.add_argument("--fresh", action="store_true", help="Discard existing checkpoints instead of resuming")
+    parser.add_argument("--publish", action="store_true", help="Publish the result to the model registry")
+    parser.add_argument("--quantize", default=",".join(QUANTIZATION_VARIANTS),
+                        help="Comma-separated quantized variants to export (dynamic,int8), or 'none'")
+    args = parser.parse_args()
+    output = args.output or (os.path.join(CROP_MODEL_ROOT, args.crop.lower(), "crop_disease_model.h5")
+                             if args.crop else SAVE_PATH)
+    variants = [] if args.quantize == "none" else [v.strip() for v in args.quantize.split(",") if v.strip()]
+    train_model(architecture=args.architecture, quantize=variants, pipeline=args.pipeline,
+                cache_dir=args.cache_dir, packed_dir=args.packed_dir, save_path=output,
+                checkpoint_dir=args.checkpoint_dir, resume=not args.fresh, epochs=args.epochs, patience=args.patience,
+                publish=args.publish, crop=args.crop.lower() if args.crop else None)
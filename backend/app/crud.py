@@ -1,9 +1,20 @@
 from sqlalchemy.orm import Session
-from . import models, schemas, auth
+from . import models, schemas, auth, database
+from .ai_engine import probabilities
+import os
+import threading
+import time
 
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.user_id == user_id).first()
 
+def get_crops_grown(db: Session, user_ids):
+    # user_id -> crops_grown for several users in one query
+    if not user_ids:
+        return {}
+    rows = db.query(models.User.user_id, models.User.crops_grown).filter(models.User.user_id.in_(list(user_ids))).all()
+    return {user_id: crops_grown for user_id, crops_grown in rows}
+
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
@@ -32,24 +43,144 @@ def create_plant_image(db: Session, image_url: str, user_id: int):
     db.refresh(db_image)
     return db_image
 
-def save_prediction(db: Session, image_id: int, disease_name: str, confidence: float, is_healthy: bool):
+PREDICTION_METADATA = ("model_version", "first_stage_disease", "first_stage_confidence", "escalated")
+
+def prediction_metadata(result: dict):
+    # Model version, cascade decision and probability vector of an inference
+    # result (absent for mock predictions)
+    metadata = {key: result.get(key) for key in PREDICTION_METADATA}
+    if result.get("probabilities") is not None:
+        metadata["probabilities"] = probabilities.encode(result["probabilities"])
+        metadata["label_map"] = result.get("label_map")
+    return metadata
+
+def save_prediction(db: Session, image_id: int, disease_name: str, confidence: float, is_healthy: bool,
+                    phash: str = None, **metadata):
+    set_image_phashes(db, [(image_id, phash)])
     db_pred = models.Prediction(
         image_id=image_id, 
         disease_name=disease_name, 
         confidence=confidence, 
-        is_healthy=is_healthy
+        is_healthy=is_healthy,
+        **metadata
     )
     db.add(db_pred)
     db.commit()
     db.refresh(db_pred)
     return db_pred
 
+def add_detections(db: Session, user_id: int, detections: list):
+    # Bulk-adds a PlantImage + Prediction per (image_url, result) pair and flushes
+    # so IDs are assigned. The caller commits, keeping a whole batch in one transaction.
+    db_images = []
+    for image_url, result in detections:
+        db_image = models.PlantImage(image_url=image_url, user_id=user_id, phash=result.get("phash"))
+        db_image.prediction = models.Prediction(
+            disease_name=result["disease_name"],
+            confidence=result["confidence"],
+            is_healthy=result["is_healthy"],
+            **prediction_metadata(result)
+        )
+        db_images.append(db_image)
+    db.add_all(db_images)
+    db.flush()
+    return db_images
+
+def replace_predictions(db: Session, rescored: list):
+    # Re-scoring: a new current Prediction per (image_id, result) pair, keeping
+    # the previous ones with is_current = False. Returns the previous disease
+    # name per image_id. The caller commits.
+    image_ids = [image_id for image_id, _ in rescored]
+    if not image_ids:
+        return {}
+    current = db.query(models.Prediction).filter(
+        models.Prediction.image_id.in_(image_ids), models.Prediction.is_current == True
+    )
+    previous = {p.image_id: p.disease_name for p in current.all()}
+    set_image_phashes(db, [(image_id, result.get("phash")) for image_id, result in rescored])
+    current.update({models.Prediction.is_current: False}, synchronize_session=False)
+    db.add_all([
+        models.Prediction(
+            image_id=image_id,
+            disease_name=result["disease_name"],
+            confidence=result["confidence"],
+            is_healthy=result["is_healthy"],
+            **prediction_metadata(result)
+        )
+        for image_id, result in rescored
+    ])
+    db.flush()
+    return previous
+
+def set_image_phashes(db: Session, phashes: list):
+    # Perceptual hash (inference result "phash") of each (image_id, phash) pair
+    # whose image has none yet. The caller commits.
+    for image_id, phash in phashes:
+        if phash:
+            db.query(models.PlantImage).filter(
+                models.PlantImage.image_id == image_id, models.PlantImage.phash.is_(None)
+            ).update({models.PlantImage.phash: phash}, synchronize_session=False)
+
+def load_near_duplicates(model_versions: list, limit: int):
+    # Current predictions of the given model versions with their image's pHash,
+    # newest first: the source of the inference near-duplicate index
+    db = database.SessionLocal()
+    try:
+        rows = (
+            db.query(models.PlantImage.phash, models.Prediction.disease_name, models.Prediction.confidence,
+                     models.Prediction.model_version, models.Prediction.first_stage_disease,
+                     models.Prediction.first_stage_confidence, models.Prediction.escalated,
+                     models.Prediction.probabilities, models.Prediction.label_map)
+            .join(models.Prediction, models.Prediction.image_id == models.PlantImage.image_id)
+            .filter(models.Prediction.model_version.in_(model_versions),
+                    models.Prediction.is_current == True,
+                    models.PlantImage.phash.isnot(None))
+            .order_by(models.Prediction.prediction_id.desc())
+            .limit(limit)
+            .all()
+        )
+        return [row._mapping for row in rows]
+    finally:
+        db.close()
+
+def get_probability_vectors(db: Session, model_version: str, label_map: str, chunk_size: int = 20000):
+    # (image_ids, blobs) of the stored probability vectors of one model
+    # version, read in prediction_id (keyset) pages. An image re-scored twice
+    # by the same version keeps only its newest vector.
+    image_ids, blobs, last_id = [], [], 0
+    while True:
+        rows = (
+            db.query(models.Prediction.prediction_id, models.Prediction.image_id, models.Prediction.probabilities)
+            .filter(models.Prediction.model_version == model_version,
+                    models.Prediction.label_map == label_map,
+                    models.Prediction.probabilities.isnot(None),
+                    models.Prediction.prediction_id > last_id)
+            .order_by(models.Prediction.prediction_id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not rows:
+            break
+        image_ids.extend(row.image_id for row in rows)
+        blobs.extend(row.probabilities for row in rows)
+        last_id = rows[-1].prediction_id
+    newest = {image_id: i for i, image_id in enumerate(image_ids)}
+    keep = sorted(newest.values())
+    return [image_ids[i] for i in keep], [blobs[i] for i in keep]
+
 def get_user_history(db: Session, user_id: int):
     return db.query(models.PlantImage).filter(models.PlantImage.user_id == user_id).order_by(models.PlantImage.upload_date.desc()).all()
 
 def get_disease_info(db: Session, disease_name: str):
     return db.query(models.DiseaseInfo).filter(models.DiseaseInfo.name == disease_name).first()
 
+def get_disease_infos(db: Session, disease_names):
+    # name -> DiseaseInfo for several diseases in one query
+    if not disease_names:
+        return {}
+    rows = db.query(models.DiseaseInfo).filter(models.DiseaseInfo.name.in_(list(disease_names))).all()
+    return {row.name: row for row in rows}
+
 def create_disease_info(db: Session, name: str, desc: str, treat: str):
     # Check if exists
     existing = db.query(models.DiseaseInfo).filter(models.DiseaseInfo.name == name).first()
@@ -58,6 +189,7 @@ def create_disease_info(db: Session, name: str, desc: str, treat: str):
     db_info = models.DiseaseInfo(name=name, description=desc, treatment=treat)
     db.add(db_info)
     db.commit()
+    invalidate_reference_cache()
     return db_info
     
 def get_all_images(db: Session):
@@ -66,8 +198,9 @@ def get_all_images(db: Session):
 def get_stats(db: Session):
     total_users = db.query(models.User).count()
     total_images = db.query(models.PlantImage).count()
-    diseased = db.query(models.Prediction).filter(models.Prediction.is_healthy == False).count()
-    healthy = db.query(models.Prediction).filter(models.Prediction.is_healthy == True).count()
+    current = db.query(models.Prediction).filter(models.Prediction.is_current == True)
+    diseased = current.filter(models.Prediction.is_healthy == False).count()
+    healthy = current.filter(models.Prediction.is_healthy == True).count()
     return {
         "total_users": total_users,
         "total_images": total_images,
@@ -84,8 +217,48 @@ def create_fertilizer(db: Session, fertilizer: schemas.FertilizerCreate):
     db.add(db_fert)
     db.commit()
     db.refresh(db_fert)
+    invalidate_reference_cache()
     return db_fert
 
+# --- Reference Data Cache ---
+# Fertilizers and disease info are read on every detection but rarely change.
+# Rows are loaded with their own session, so the cached (detached) objects are
+# never expired by a commit in the caller's session.
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "60"))
+_reference_cache = {}
+_reference_lock = threading.Lock()
+
+def _cached_reference(key, loader):
+    entry = _reference_cache.get(key)
+    if entry and time.monotonic() - entry[0] < REFERENCE_CACHE_TTL:
+        return entry[1]
+    with _reference_lock:
+        entry = _reference_cache.get(key)
+        if entry and time.monotonic() - entry[0] < REFERENCE_CACHE_TTL:
+            return entry[1]
+        ref_db = database.SessionLocal()
+        try:
+            value = loader(ref_db)
+        finally:
+            ref_db.close()
+        _reference_cache[key] = (time.monotonic(), value)
+        return value
+
+def get_fertilizers_cached():
+    return _cached_reference("fertilizers", get_fertilizers)
+
+def get_disease_infos_cached():
+    # name -> DiseaseInfo for every known disease
+    return _cached_reference("disease_info", lambda ref_db: {d.name: d for d in ref_db.query(models.DiseaseInfo).all()})
+
+def prime_reference_cache():
+    invalidate_reference_cache()
+    return {"fertilizers": len(get_fertilizers_cached()), "diseases": len(get_disease_infos_cached())}
+
+def invalidate_reference_cache():
+    with _reference_lock:
+        _reference_cache.clear()
+
 # --- Inventory CRUD ---
 def get_shop_inventory(db: Session, user_id: int):
     return db.query(models.ShopInventory).filter(models.ShopInventory.user_id == user_id).all()
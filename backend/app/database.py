@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -33,3 +33,22 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def warm_pool(size=None):
+    # Open pooled connections up front so the first requests don't pay for the
+    # TCP/auth handshake; they go back to the pool when closed
+    if size is None:
+        size = int(os.getenv("DB_POOL_WARM", "5"))
+        pool_size = getattr(engine.pool, "size", None)
+        if callable(pool_size):
+            size = min(size, pool_size())
+    connections = []
+    try:
+        for _ in range(size):
+            conn = engine.connect()
+            connections.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in connections:
+            conn.close()
+    return len(connections)
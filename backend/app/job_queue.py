@@ -0,0 +1,252 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import crud, models
+
+# Detection job queue backed by the detection_jobs / detection_job_items tables.
+# Works on any SQLAlchemy backend (SQLite, MySQL, PostgreSQL): items are claimed
+# with a conditional UPDATE + claim token, and leases that outlive a crashed
+# worker are put back on the queue, so restarting workers never loses a job.
+
+LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+
+def submit_job(db: Session, user_id: int, entries: list):
+    # entries: dicts with filename, path and image_url (already saved to disk)
+    job = models.DetectionJob(user_id=user_id, status="Queued", total_images=len(entries))
+    db.add(job)
+    db.flush()
+    for entry in entries:
+        db_image = models.PlantImage(image_url=entry["image_url"], user_id=user_id)
+        db.add(models.DetectionJobItem(
+            job=job,
+            image=db_image,
+            filename=entry["filename"],
+            file_path=entry["path"],
+            status="Queued"
+        ))
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def get_job(db: Session, job_id: int, user_id: int = None):
+    query = db.query(models.DetectionJob).filter(models.DetectionJob.job_id == job_id)
+    if user_id is not None:
+        query = query.filter(models.DetectionJob.user_id == user_id)
+    return query.first()
+
+
+def claim_items(db: Session, limit: int):
+    # Atomically take up to `limit` queued items for this worker. Returns
+    # (claim token, items); the token proves ownership when completing them.
+    candidate_ids = [
+        row.item_id for row in db.query(models.DetectionJobItem.item_id)
+        .filter(models.DetectionJobItem.status == "Queued")
+        .order_by(models.DetectionJobItem.item_id)
+        .limit(limit)
+        .all()
+    ]
+    if not candidate_ids:
+        return None, []
+
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+    db.query(models.DetectionJobItem).filter(
+        models.DetectionJobItem.item_id.in_(candidate_ids),
+        models.DetectionJobItem.status == "Queued"
+    ).update({
+        models.DetectionJobItem.status: "Running",
+        models.DetectionJobItem.claim_token: token,
+        models.DetectionJobItem.locked_at: now,
+        models.DetectionJobItem.attempts: models.DetectionJobItem.attempts + 1,
+    }, synchronize_session=False)
+
+    items = db.query(models.DetectionJobItem).filter(models.DetectionJobItem.claim_token == token).all()
+
+    # Mark the owning jobs as started
+    job_ids = {item.job_id for item in items}
+    if job_ids:
+        db.query(models.DetectionJob).filter(
+            models.DetectionJob.job_id.in_(job_ids),
+            models.DetectionJob.status == "Queued"
+        ).update({
+            models.DetectionJob.status: "Running",
+            models.DetectionJob.started_at: now,
+        }, synchronize_session=False)
+    db.commit()
+    return token, items
+
+
+def _update_claimed(db: Session, item_id: int, claim_token, values: dict):
+    # Conditional UPDATE of one item that is still Running under `claim_token`
+    # (None: released by requeue_stale). False when the lease was lost, i.e.
+    # the item was requeued and another worker owns it now.
+    owned = (models.DetectionJobItem.claim_token.is_(None) if claim_token is None
+             else models.DetectionJobItem.claim_token == claim_token)
+    return db.query(models.DetectionJobItem).filter(
+        models.DetectionJobItem.item_id == item_id,
+        models.DetectionJobItem.status == "Running",
+        owned
+    ).update(values, synchronize_session=False) == 1
+
+
+def complete_items(db: Session, outcomes: list, claim_token):
+    # outcomes: (item, result dict or None, error message or None) per item
+    # claimed with `claim_token`. Writes the Prediction rows and job progress in
+    # one transaction, skipping items whose lease was lost meanwhile, so a slow
+    # worker and the one its items were requeued to never both record them.
+    now = datetime.utcnow()
+    progress = {}
+    scored = []
+    for item, result, error in outcomes:
+        values = {
+            models.DetectionJobItem.status: "Done" if error is None else "Failed",
+            models.DetectionJobItem.finished_at: now,
+            models.DetectionJobItem.claim_token: None,
+        }
+        if error is not None:
+            values[models.DetectionJobItem.error] = error
+        if not _update_claimed(db, item.item_id, claim_token, values):
+            continue
+
+        done, failed = progress.get(item.job_id, (0, 0))
+        if error is None:
+            scored.append((item.image_id, result))
+            progress[item.job_id] = (done + 1, failed)
+        else:
+            progress[item.job_id] = (done + 1, failed + 1)
+
+    # Through replace_predictions, so an image never ends up with two current
+    # predictions (e.g. if it was re-scored while the job was pending)
+    crud.replace_predictions(db, scored)
+    for job_id, (done, failed) in progress.items():
+        db.query(models.DetectionJob).filter(models.DetectionJob.job_id == job_id).update({
+            models.DetectionJob.processed_images: models.DetectionJob.processed_images + done,
+            models.DetectionJob.failed_images: models.DetectionJob.failed_images + failed,
+        }, synchronize_session=False)
+    db.flush()
+    _finish_jobs(db, progress.keys(), now)
+    db.commit()
+
+
+def release_items(db: Session, items: list, claim_token):
+    # Hand claimed items back to the queue without using up an attempt: a
+    # worker stopping before it got to them (worker._process_claim). Failures
+    # go through retry_items.
+    for item in items:
+        _update_claimed(db, item.item_id, claim_token, {
+            models.DetectionJobItem.status: "Queued",
+            models.DetectionJobItem.claim_token: None,
+            models.DetectionJobItem.locked_at: None,
+            models.DetectionJobItem.attempts: models.DetectionJobItem.attempts - 1,
+        })
+    db.commit()
+
+
+def retry_items(db: Session, items: list, claim_token, error: str):
+    # Items whose processing raised: back on the queue with the attempt
+    # counted, or Failed once MAX_ATTEMPTS is used up, like requeue_stale.
+    # Without the limit an image that always fails would be retried forever.
+    exhausted = []
+    for item in items:
+        if (item.attempts or 0) >= MAX_ATTEMPTS:
+            exhausted.append((item, None, error))
+        else:
+            _update_claimed(db, item.item_id, claim_token, {
+                models.DetectionJobItem.status: "Queued",
+                models.DetectionJobItem.claim_token: None,
+                models.DetectionJobItem.locked_at: None,
+            })
+    db.commit()
+    if exhausted:
+        complete_items(db, exhausted, claim_token)
+
+
+def requeue_stale(db: Session):
+    # Items whose worker died mid-batch: retry, or fail after MAX_ATTEMPTS
+    cutoff = datetime.utcnow() - timedelta(seconds=LEASE_SECONDS)
+    stale = db.query(models.DetectionJobItem).filter(
+        models.DetectionJobItem.status == "Running",
+        models.DetectionJobItem.locked_at < cutoff
+    ).all()
+    if not stale:
+        return 0
+
+    # Conditional on the claim token seen here, so an item its worker finishes
+    # in the meantime is left alone
+    exhausted = {}
+    requeued = 0
+    for item in stale:
+        if (item.attempts or 0) >= MAX_ATTEMPTS:
+            exhausted.setdefault(item.claim_token, []).append((item, None, "Worker did not finish this image"))
+        elif _update_claimed(db, item.item_id, item.claim_token, {
+            models.DetectionJobItem.status: "Queued",
+            models.DetectionJobItem.claim_token: None,
+            models.DetectionJobItem.locked_at: None,
+        }):
+            requeued += 1
+    db.commit()
+    for claim_token, outcomes in exhausted.items():
+        complete_items(db, outcomes, claim_token)
+        requeued += len(outcomes)
+    return requeued
+
+
+def _finish_jobs(db: Session, job_ids, now):
+    for job_id in job_ids:
+        remaining = db.query(func.count(models.DetectionJobItem.item_id)).filter(
+            models.DetectionJobItem.job_id == job_id,
+            models.DetectionJobItem.status.in_(["Queued", "Running"])
+        ).scalar()
+        if remaining == 0:
+            db.query(models.DetectionJob).filter(
+                models.DetectionJob.job_id == job_id,
+                models.DetectionJob.status != "Completed"
+            ).update({
+                models.DetectionJob.status: "Completed",
+                models.DetectionJob.finished_at: now,
+            }, synchronize_session=False)
+
+
+def get_metrics(db: Session, windows=(60, 300)):
+    item_counts = dict(
+        db.query(models.DetectionJobItem.status, func.count(models.DetectionJobItem.item_id))
+        .group_by(models.DetectionJobItem.status).all()
+    )
+    job_counts = dict(
+        db.query(models.DetectionJob.status, func.count(models.DetectionJob.job_id))
+        .group_by(models.DetectionJob.status).all()
+    )
+    now = datetime.utcnow()
+    throughput = {}
+    for seconds in windows:
+        finished = db.query(func.count(models.DetectionJobItem.item_id)).filter(
+            models.DetectionJobItem.finished_at >= now - timedelta(seconds=seconds)
+        ).scalar()
+        throughput[f"images_per_sec_{seconds}s"] = round(finished / seconds, 3)
+
+    oldest = db.query(func.min(models.DetectionJobItem.item_id)).filter(
+        models.DetectionJobItem.status == "Queued"
+    ).scalar()
+    oldest_age = None
+    if oldest is not None:
+        created = db.query(models.DetectionJob.created_at).join(
+            models.DetectionJobItem, models.DetectionJobItem.job_id == models.DetectionJob.job_id
+        ).filter(models.DetectionJobItem.item_id == oldest).scalar()
+        if created:
+            oldest_age = round((now - created).total_seconds(), 1)
+
+    return {
+        "queue_depth": item_counts.get("Queued", 0),
+        "in_progress": item_counts.get("Running", 0),
+        "items": item_counts,
+        "jobs": job_counts,
+        "oldest_queued_age_sec": oldest_age,
+        **throughput,
+    }
@@ -1,18 +1,59 @@
+from . import startup
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
-from .database import engine, Base
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from .database import engine, Base, warm_pool
 from .routers import users, detection, admin, shop, chatbot, fertilizers, orders
+from .ai_engine import inference
+from . import crud
+import asyncio
 import os
 
-# Create Database Tables (for SQLite/Dev)
-# In production, use Alembic for migrations
-Base.metadata.create_all(bind=engine)
+startup.mark("imports")
+
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create Database Tables (for SQLite/Dev)
+    # In production, use Alembic for migrations
+    await run_in_threadpool(Base.metadata.create_all, bind=engine)
+    startup.mark("tables")
+
+    opened = await run_in_threadpool(warm_pool)
+    startup.mark("db_pool")
+
+    primed = await run_in_threadpool(crud.prime_reference_cache)
+    startup.mark("reference_cache")
+
+    inference.set_near_duplicate_source(crud.load_near_duplicates)
+    if inference.PRELOAD:
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(inference.get_executor(), inference.warm_up)
+        except Exception as e:
+            print(f"Model warm-up failed: {e}")
+        startup.mark("model")
+
+    startup.set_ready()
+    phases = startup.mark("ready")
+    print(f"Startup: ready {phases:.2f}s after process start ({opened} DB connections, {primed['fertilizers']} fertilizers, {primed['diseases']} diseases cached).")
+    yield
+
+    # Shutdown: fail readiness first so the load balancer stops routing here,
+    # then let queued inference work finish
+    startup.set_draining()
+    await run_in_threadpool(inference.shutdown, SHUTDOWN_DRAIN_TIMEOUT)
+    print("Shutdown: inference drained.")
 
 app = FastAPI(
     title="Plant Disease Detection System",
     description="Cloud-Based Intelligent Plant Disease Detection System API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS Configuration
@@ -45,6 +86,24 @@ app.include_router(orders.router, prefix="/api/orders", tags=["Orders"])
 app.include_router(chatbot.router, prefix="/api/chatbot", tags=["Chatbot"])
 app.include_router(fertilizers.router, prefix="/api/fertilizers", tags=["Fertilizers"])
 
+@app.get("/healthz")
+def healthz():
+    # Liveness: the process is up and serving requests
+    return {"status": "ok", **startup.report()}
+
+@app.get("/readyz")
+def readyz():
+    # Readiness: startup finished, not draining, and the model is usable (unless MOCK mode is intended)
+    model_ready = inference.model is not None or not inference.model_expected()
+    ready = startup.is_ready() and model_ready
+    body = {
+        "status": "ready" if ready else "not ready",
+        "model_loaded": inference.model is not None,
+        "model_version": inference.model_version,
+        **startup.report()
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Intelligent Plant Disease Detection System API"}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Table, Enum, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Table, Enum, Text, LargeBinary
 from sqlalchemy.orm import relationship
 from .database import Base
 import enum
@@ -32,9 +32,14 @@ class PlantImage(Base):
     user_id = Column(Integer, ForeignKey("users.user_id"))
     image_url = Column(String(500))
     upload_date = Column(DateTime, default=datetime.utcnow)
+    phash = Column(String(16), nullable=True) # 64-bit perceptual hash, hex (ai_engine/perceptual_hash.py)
     
     owner = relationship("User", back_populates="images")
-    prediction = relationship("Prediction", back_populates="image", uselist=False)
+    # The current prediction; re-scoring (app/rescore.py) keeps older ones with is_current = False
+    prediction = relationship(
+        "Prediction", back_populates="image", uselist=False,
+        primaryjoin="and_(PlantImage.image_id == Prediction.image_id, Prediction.is_current == True)"
+    )
 
 class Prediction(Base):
     __tablename__ = "predictions"
@@ -44,9 +49,66 @@ class Prediction(Base):
     confidence = Column(Float)
     is_healthy = Column(Boolean)
     severity = Column(String(50), default="Low") # Low, Medium, High
+    model_version = Column(String(64), nullable=True) # None for mock predictions
+    # Cascade (small model first): its answer, and whether the main model decided
+    first_stage_disease = Column(String(255), nullable=True)
+    first_stage_confidence = Column(Float, nullable=True)
+    escalated = Column(Boolean, nullable=True)
+    is_current = Column(Boolean, default=True, nullable=False, index=True) # False once re-scored by a newer model
+    # Full softmax vector as float16 bytes, in the class order identified by label_map (ai_engine/probabilities.py)
+    probabilities = Column(LargeBinary, nullable=True)
+    label_map = Column(String(16), nullable=True)
     
     image = relationship("PlantImage", back_populates="prediction")
 
+class RescoreRun(Base):
+    # Progress of re-scoring stored images with one model version (python -m app.rescore)
+    __tablename__ = "rescore_runs"
+    run_id = Column(Integer, primary_key=True, index=True)
+    model_version = Column(String(64), unique=True, index=True)
+    status = Column(String(50), default="Running") # Running, Completed
+    last_image_id = Column(Integer, default=0) # keyset checkpoint: everything up to here is done
+    max_image_id = Column(Integer, default=0) # newest image when the run started
+    rescored = Column(Integer, default=0)
+    changed = Column(Integer, default=0) # new disease differs from the previous prediction
+    missing = Column(Integer, default=0) # image file no longer in the uploads store
+    failed = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+class DetectionJob(Base):
+    __tablename__ = "detection_jobs"
+    job_id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.user_id"), index=True)
+    status = Column(String(50), default="Queued", index=True) # Queued, Running, Completed
+    total_images = Column(Integer, default=0)
+    processed_images = Column(Integer, default=0)
+    failed_images = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    items = relationship("DetectionJobItem", back_populates="job", order_by="DetectionJobItem.item_id")
+
+class DetectionJobItem(Base):
+    # One image of a job; this is the unit workers claim from the queue
+    __tablename__ = "detection_job_items"
+    item_id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("detection_jobs.job_id"), index=True)
+    image_id = Column(Integer, ForeignKey("plant_images.image_id"), nullable=True)
+    filename = Column(String(255))
+    file_path = Column(String(500))
+    status = Column(String(50), default="Queued", index=True) # Queued, Running, Done, Failed
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    claim_token = Column(String(64), nullable=True, index=True)
+    locked_at = Column(DateTime, nullable=True) # Lease start; stale leases are requeued
+    finished_at = Column(DateTime, nullable=True, index=True)
+
+    job = relationship("DetectionJob", back_populates="items")
+    image = relationship("PlantImage")
+
 class DiseaseInfo(Base):
     __tablename__ = "disease_info"
     disease_id = Column(Integer, primary_key=True, index=True)
@@ -0,0 +1,231 @@
+import argparse
+import os
+import signal
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import and_
+
+from . import crud, models
+from .database import SessionLocal
+
+# Re-scores stored images with the model currently being served. Run from the
+# backend directory (same cwd as the API, so /uploads paths resolve):
+#     python -m app.rescore
+#
+# Images are walked in image_id (keyset) order. Progress is checkpointed in the
+# rescore_runs table after every batch, one run per model version, so the
+# process can be stopped at any time and continues where it left off when
+# started again. Every re-scored image gets a new Prediction tagged with the
+# model version; the previous one is kept with is_current = False. Images
+# uploaded before perceptual hashes were stored get theirs. A run only
+# visits images that existed when it started: later uploads were already
+# scored by the same model. Images whose current prediction already came from
+# the model that would score them now (this model version, or the crop
+# sub-model / cascade first stage serving the owner's crop; e.g. detection
+# jobs after the swap, or a --restart) are skipped, and so are images of detection jobs still queued or
+# running: their worker writes the prediction.
+#
+# Live uploads come first. The process runs at low priority with few
+# TensorFlow threads, and it uses at most RESCORE_CPU_SHARE of its wall time
+# for inference. Before each batch it times a one-image forward pass. While
+# that pass is more than RESCORE_LATENCY_BUDGET_MS slower than at start, the
+# host is busy serving, so it backs off.
+
+UPLOAD_DIR = "uploads"
+BATCH_SIZE = int(os.getenv("RESCORE_BATCH_SIZE", "16"))
+CPU_SHARE = float(os.getenv("RESCORE_CPU_SHARE", "0.25"))
+LATENCY_BUDGET_MS = float(os.getenv("RESCORE_LATENCY_BUDGET_MS", "50"))
+MAX_BACKOFF_SECONDS = float(os.getenv("RESCORE_MAX_BACKOFF_SECONDS", "60"))
+THREADS = int(os.getenv("RESCORE_THREADS", "1"))
+NICE = int(os.getenv("RESCORE_NICE", "10"))
+
+
+class Throttle:
+    """
+    Limits the re-scorer to `cpu_share` of wall time (sleeping after each batch
+    in proportion to how long it took) and waits, with exponential backoff,
+    while `probe()` -- the latency of one small forward pass, in ms -- is more
+    than `budget_ms` above the baseline taken by calibrate().
+    """
+
+    def __init__(self, probe, cpu_share=CPU_SHARE, budget_ms=LATENCY_BUDGET_MS, max_backoff=MAX_BACKOFF_SECONDS):
+        self.probe = probe
+        self.cpu_share = min(max(cpu_share, 0.01), 1.0)
+        self.budget_ms = budget_ms
+        self.max_backoff = max_backoff
+        self.baseline_ms = None
+        self.waited = 0.0
+
+    def calibrate(self, samples=5):
+        self.probe()
+        self.baseline_ms = float(np.median([self.probe() for _ in range(samples)]))
+        return self.baseline_ms
+
+    def wait_for_headroom(self, stopping=lambda: False):
+        backoff = 1.0
+        while not stopping():
+            latency = self.probe()
+            if latency <= self.baseline_ms + self.budget_ms:
+                return
+            print(f"Probe {latency:.0f} ms (baseline {self.baseline_ms:.0f} ms): host busy, pausing {backoff:.0f}s.")
+            time.sleep(backoff)
+            self.waited += backoff
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def after_batch(self, seconds):
+        pause = seconds * (1 - self.cpu_share) / self.cpu_share
+        time.sleep(pause)
+        self.waited += pause
+
+
+def get_or_create_run(db, model_version, restart=False):
+    run = db.query(models.RescoreRun).filter(models.RescoreRun.model_version == model_version).first()
+    if run is not None and restart:
+        db.delete(run)
+        db.flush()
+        run = None
+    if run is None:
+        newest = db.query(models.PlantImage.image_id).order_by(models.PlantImage.image_id.desc()).first()
+        run = models.RescoreRun(model_version=model_version, max_image_id=newest[0] if newest else 0,
+                                last_image_id=0, rescored=0, changed=0, missing=0, failed=0)
+        db.add(run)
+        db.commit()
+    return run
+
+
+def next_images(db, run, limit):
+    # Keyset page: the next `limit` images after the checkpoint, with the
+    # model_version of their current prediction, leaving out the ones a job
+    # worker is about to score
+    pending = db.query(models.DetectionJobItem.item_id).filter(
+        models.DetectionJobItem.image_id == models.PlantImage.image_id,
+        models.DetectionJobItem.status.in_(("Queued", "Running"))
+    ).exists()
+    return (
+        db.query(models.PlantImage.image_id, models.PlantImage.image_url, models.PlantImage.user_id,
+                 models.Prediction.model_version)
+        .outerjoin(models.Prediction, and_(models.Prediction.image_id == models.PlantImage.image_id,
+                                           models.Prediction.is_current == True))
+        .filter(models.PlantImage.image_id > run.last_image_id, models.PlantImage.image_id <= run.max_image_id)
+        .filter(~pending)
+        .order_by(models.PlantImage.image_id)
+        .limit(limit)
+        .all()
+    )
+
+
+def upload_path(image_url):
+    # "/uploads/<name>" -> uploads/<name>
+    return os.path.join(UPLOAD_DIR, os.path.basename(image_url or ""))
+
+
+def rescore_batch(db, run, images, inference):
+    # Scores one page (grouped by crop like detection jobs), writes the new
+    # predictions and moves the checkpoint, all in one transaction
+    crops_grown = crud.get_crops_grown(db, {image.user_id for image in images})
+    groups = {}
+    for image in images:
+        crop = inference.resolve_crop(crops_grown=crops_grown.get(image.user_id))
+        if image.model_version is not None and image.model_version in inference.serving_versions(crop):
+            continue  # already scored by the model that would score it now
+        path = upload_path(image.image_url)
+        if not os.path.exists(path):
+            run.missing += 1
+            continue
+        groups.setdefault(crop, []).append((image.image_id, path))
+
+    rescored = []
+    for crop, group in groups.items():
+        results = inference.predict_batch([path for _, path in group], crop=crop, reuse_near_duplicates=False)
+        for (image_id, _), result in zip(group, results):
+            if isinstance(result, Exception) or not result.get("model_version"):
+                run.failed += 1
+            else:
+                rescored.append((image_id, result))
+
+    previous = crud.replace_predictions(db, rescored)
+    run.rescored += len(rescored)
+    run.changed += sum(1 for image_id, result in rescored if previous.get(image_id) != result["disease_name"])
+    run.last_image_id = images[-1].image_id
+    run.updated_at = datetime.utcnow()
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score stored images with the current model")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="Start this model version's run over from the first image")
+    args = parser.parse_args()
+
+    # Before inference is imported: it reads its thread settings at import time
+    os.environ.setdefault("TF_INTRA_OP_THREADS", str(THREADS))
+    os.environ.setdefault("TF_INTER_OP_THREADS", "1")
+    os.environ["INFERENCE_BATCHING"] = "0"
+    if NICE and hasattr(os, "nice"):
+        os.nice(NICE)
+    from .ai_engine import inference
+
+    stopping = False
+
+    def handle_stop(signum, frame):
+        # Finish the current batch (its checkpoint included), then exit
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    inference.load_model()
+    if inference.model is None or inference.INFERENCE_MODE != "local":
+        raise SystemExit("Re-scoring needs a real model loaded in this process (INFERENCE_MODE=local).")
+    version = inference.model_version
+
+    def probe():
+        started = time.perf_counter()
+        inference._run_model(np.zeros((1, inference.IMG_SIZE, inference.IMG_SIZE, 3), dtype=np.float32))
+        return (time.perf_counter() - started) * 1000
+
+    throttle = Throttle(probe)
+    print(f"Probe baseline {throttle.calibrate():.1f} ms, budget +{throttle.budget_ms:g} ms, "
+          f"CPU share {throttle.cpu_share:.0%}.")
+
+    db = SessionLocal()
+    try:
+        run = get_or_create_run(db, version, restart=args.restart)
+        if run.status == "Completed":
+            print(f"Model {version} has already re-scored all images (use --restart to redo).")
+            return
+        print(f"Re-scoring images {run.last_image_id + 1}..{run.max_image_id} with model {version}.")
+
+        started = time.perf_counter()
+        while not stopping:
+            images = next_images(db, run, args.batch_size)
+            if not images:
+                run.status = "Completed"
+                run.finished_at = datetime.utcnow()
+                db.commit()
+                break
+            throttle.wait_for_headroom(lambda: stopping)
+            if stopping:
+                break
+
+            batch_started = time.perf_counter()
+            rescore_batch(db, run, images, inference)
+            throttle.after_batch(time.perf_counter() - batch_started)
+            if inference.model_version != version:
+                print(f"Model changed to {inference.model_version}; stopping. Start again to re-score with it.")
+                break
+            print(f"Re-scored up to image {run.last_image_id}/{run.max_image_id}: {run.rescored} done, "
+                  f"{run.changed} changed, {run.missing} missing, {run.failed} failed.")
+
+        elapsed = time.perf_counter() - started
+        print(f"{'Finished' if run.status == 'Completed' else 'Stopped'} after {elapsed:.0f}s "
+              f"({throttle.waited:.0f}s throttled).")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
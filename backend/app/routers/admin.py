@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from ..database import get_db
 from ..models import User, DiseaseInfo, Prediction, Order
 from ..auth import get_current_user
+from ..crud import invalidate_reference_cache
 from ..schemas import UserResponse, DiseaseInfoResponse
 from pydantic import BaseModel
 from typing import List, Optional
@@ -52,7 +53,7 @@ def get_system_analytics(db: Session = Depends(get_db), current_user: User = Dep
         raise HTTPException(status_code=403, detail="Not authorized")
     
     total_users = db.query(User).count()
-    total_scans = db.query(Prediction).count()
+    total_scans = db.query(Prediction).filter(Prediction.is_current == True).count()
     diseases_custom = db.query(DiseaseInfo).count()
     
     # Mock data for charts
@@ -80,6 +81,7 @@ def add_disease(disease: DiseaseCreate, db: Session = Depends(get_db), current_u
     db.add(new_disease)
     db.commit()
     db.refresh(new_disease)
+    invalidate_reference_cache()
     return new_disease
 
 
@@ -98,4 +100,5 @@ def update_disease(disease_id: int, disease: DiseaseUpdate, db: Session = Depend
 
     db.commit()
     db.refresh(db_disease)
+    invalidate_reference_cache()
     return db_disease
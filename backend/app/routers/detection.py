@@ -1,14 +1,29 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from .. import crud, models, schemas, auth, database
-from ..ai_engine import inference
-import shutil
+from typing import List, Optional
+from .. import crud, models, schemas, auth, database, job_queue
+from ..ai_engine import inference, probabilities
+from starlette.concurrency import run_in_threadpool
+import aiofiles
+import json
+import numpy as np
 import os
+import shutil
 import uuid
+import zipfile
 
 router = APIRouter()
 
 UPLOAD_DIR = "uploads"
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Batch detection limits
+BATCH_MAX_IMAGES = int(os.getenv("DETECT_BATCH_MAX_IMAGES", "200"))
+BATCH_MAX_IMAGE_BYTES = int(os.getenv("DETECT_BATCH_MAX_IMAGE_MB", "25")) * 1024 * 1024
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "bmp", "webp"}
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
 
 # --- Cloud Storage (GCP Example) ---
 # def upload_to_gcp(file_path, destination_blob_name):
@@ -19,65 +34,11 @@ UPLOAD_DIR = "uploads"
 #     blob.upload_from_filename(file_path)
 #     return blob.public_url
 
-@router.post("/upload", response_model=schemas.PredictionResponse)
-async def upload_image(
-    file: UploadFile = File(...), 
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
-):
-    # Validate file
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image")
-    
-    # Save locally
-    file_extension = file.filename.split(".")[-1]
-    unique_filename = f"{uuid.uuid4()}.{file_extension}"
-    file_path = os.path.join(UPLOAD_DIR, unique_filename)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
-    # In a real cloud deployment, you would upload to S3/GCS here
-    # public_url = upload_to_gcp(file_path, unique_filename)
-    # For now, we use the local static URL
-    image_url = f"/uploads/{unique_filename}"
-    
-    # Save Image to DB
-    db_image = crud.create_plant_image(db, image_url=image_url, user_id=current_user.user_id)
-    
-    # AI Inference
-    result = inference.predict_disease(file_path)
-    
-    # Save Prediction to DB
-    db_prediction = crud.save_prediction(
-        db, 
-        image_id=db_image.image_id, 
-        disease_name=result["disease_name"],
-        confidence=result["confidence"],
-        is_healthy=result["is_healthy"]
-    )
-    
-    # Fetch Disease Info (Description, Remedies)
-    # Note: In a real system, you might pre-populate the DB with this info.
-    # For this demo, we check if info exists, otherwise return generic or mock data.
-    disease_info = crud.get_disease_info(db, result["disease_name"])
-    
-    description = "No description available."
-    treatment = "Consult an expert."
-    
-    if disease_info:
-        description = disease_info.description
-        treatment = disease_info.treatment
-    else:
-        # Fallback/Mock Data used if DB is empty for this disease
-        description = result.get("description", "A fungal infection common in this plant.")
-        treatment = result.get("treatment", "Apply fungicide and ensure proper drainage.")
-    
+def _recommend_fertilizers(all_ferts, disease_name):
     # --- Fertilizer Recommendation Logic ---
-    all_ferts = crud.get_fertilizers(db)
     recommendations = []
-    
-    disease_lower = result["disease_name"].lower()
+
+    disease_lower = disease_name.lower()
     target_type = ""
     if "bacterial" in disease_lower:
         target_type = "Bactericide"
@@ -103,22 +64,434 @@ async def upload_image(
             key = target_type.lower()
             if key in f_type or key in f_category or key in f_name:
                 recommendations.append(f)
-            
+
     if not recommendations:
         # Fallback to organic fertilizers if available
         recommendations = [f for f in all_ferts if "organic" in (f.type or "").lower() or "organic" in (f.category or "").lower()]
-    
+    return recommendations
+
+def _detection_details(result: dict, disease_info, all_ferts):
+    # Fetch Disease Info (Description, Remedies)
+    # Note: In a real system, you might pre-populate the DB with this info.
+    # For this demo, we check if info exists, otherwise return generic or mock data.
+    description = "No description available."
+    treatment = "Consult an expert."
+
+    if disease_info:
+        description = disease_info.description
+        treatment = disease_info.treatment
+    else:
+        # Fallback/Mock Data used if DB is empty for this disease
+        description = result.get("description", "A fungal infection common in this plant.")
+        treatment = result.get("treatment", "Apply fungicide and ensure proper drainage.")
+
+    return {
+        "description": description,
+        "treatment": treatment,
+        "recommended_fertilizers": _recommend_fertilizers(all_ferts, result["disease_name"]),
+        "recommended_fertilizer": result.get("recommended_fertilizer")
+    }
+
+def _save_detection_result(db: Session, image_id: int, result: dict):
+    # Blocking DB work for one detection; called from the threadpool
+    db_prediction = crud.save_prediction(
+        db,
+        image_id=image_id,
+        disease_name=result["disease_name"],
+        confidence=result["confidence"],
+        is_healthy=result["is_healthy"],
+        phash=result.get("phash"),
+        **crud.prediction_metadata(result)
+    )
+    disease_info = crud.get_disease_infos_cached().get(result["disease_name"])
+
     return {
         "prediction_id": db_prediction.prediction_id,
         "disease_name": db_prediction.disease_name,
         "confidence": db_prediction.confidence,
         "is_healthy": db_prediction.is_healthy,
-        "description": description,
-        "treatment": treatment,
-        "recommended_fertilizers": recommendations,
-        "recommended_fertilizer": result.get("recommended_fertilizer")
+        "model_version": db_prediction.model_version,
+        **_detection_details(result, disease_info, crud.get_fertilizers_cached())
     }
 
+async def _save_upload(file: UploadFile, file_extension: str):
+    # Save locally (async file I/O, streamed in chunks)
+    unique_filename = f"{uuid.uuid4()}.{file_extension}"
+    file_path = os.path.join(UPLOAD_DIR, unique_filename)
+
+    async with aiofiles.open(file_path, "wb") as buffer:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await buffer.write(chunk)
+
+    # In a real cloud deployment, you would upload to S3/GCS here
+    # public_url = upload_to_gcp(file_path, unique_filename)
+    # For now, we use the local static URL
+    return file_path, f"/uploads/{unique_filename}"
+
+@router.post("/upload", response_model=schemas.PredictionResponse)
+async def upload_image(
+    file: UploadFile = File(...), 
+    crop: Optional[str] = Form(None),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    # Validate file
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    
+    file_extension = file.filename.split(".")[-1]
+    file_path, image_url = await _save_upload(file, file_extension)
+    
+    # Save Image to DB
+    db_image = await run_in_threadpool(crud.create_plant_image, db, image_url=image_url, user_id=current_user.user_id)
+    
+    # AI Inference (dedicated bounded executor, off the event loop). A crop
+    # hint, or a profile with a single crop, selects that crop's sub-model.
+    crop = inference.resolve_crop(crop, current_user.crops_grown)
+    result = await inference.predict_disease_async(file_path, crop)
+    
+    # Save Prediction + build response in the threadpool
+    return await run_in_threadpool(_save_detection_result, db, db_image.image_id, result)
+
+# --- Batch Detection ---
+
+def _is_zip(file: UploadFile):
+    return file.content_type in ZIP_CONTENT_TYPES or (file.filename or "").lower().endswith(".zip")
+
+def _zip_image_members(archive):
+    # (member, lowercased extension) of each image in the archive
+    for info in archive.infolist():
+        name = info.filename
+        if info.is_dir() or name.startswith("__MACOSX/"):
+            continue
+        file_extension = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+        if file_extension in IMAGE_EXTENSIONS:
+            yield info, file_extension
+
+def _extract_zip_images(fileobj, limit: int):
+    # Blocking; runs in the threadpool. Saves every image member to UPLOAD_DIR.
+    # The members are counted first, so an archive over the limit writes nothing.
+    entries = []
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid ZIP archive")
+
+    with archive:
+        members = list(_zip_image_members(archive))
+        if len(members) > limit:
+            raise HTTPException(status_code=413, detail=f"Too many images (max {BATCH_MAX_IMAGES})")
+        try:
+            for info, file_extension in members:
+                filename = os.path.basename(info.filename)
+                if info.file_size > BATCH_MAX_IMAGE_BYTES:
+                    entries.append({"filename": filename, "error": "Image is too large"})
+                    continue
+
+                unique_filename = f"{uuid.uuid4()}.{file_extension}"
+                file_path = os.path.join(UPLOAD_DIR, unique_filename)
+                entries.append({"filename": filename, "path": file_path, "image_url": f"/uploads/{unique_filename}"})
+                with archive.open(info) as src, open(file_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, UPLOAD_CHUNK_SIZE)
+        except Exception:
+            _remove_saved(entries)  # e.g. a corrupt member: drop what this archive already wrote
+            raise
+    return entries
+
+def _remove_saved(entries: list):
+    for entry in entries:
+        if entry.get("path") and os.path.exists(entry["path"]):
+            os.remove(entry["path"])
+
+def _persist_batch_chunk(db: Session, user_id: int, chunk: list, all_ferts: list):
+    # Blocking DB work for one inference chunk; rows are flushed, not committed
+    done = [e for e in chunk if "result" in e]
+    db_images = crud.add_detections(db, user_id, [(e["image_url"], e["result"]) for e in done])
+    infos = crud.get_disease_infos_cached()
+
+    items = []
+    images = iter(db_images)
+    for entry in chunk:
+        if "result" not in entry:
+            _remove_saved([entry])
+            items.append({"filename": entry["filename"], "error": entry["error"]})
+            continue
+
+        db_image = next(images)
+        result = entry["result"]
+        details = _detection_details(result, infos.get(result["disease_name"]), all_ferts)
+        details["recommended_fertilizers"] = [
+            schemas.FertilizerResponse.model_validate(f).model_dump() for f in details["recommended_fertilizers"]
+        ]
+        items.append({
+            "filename": entry["filename"],
+            "image_id": db_image.image_id,
+            "image_url": db_image.image_url,
+            "prediction_id": db_image.prediction.prediction_id,
+            "disease_name": result["disease_name"],
+            "confidence": result["confidence"],
+            "is_healthy": result["is_healthy"],
+            **details
+        })
+    return items
+
+async def _run_batch(db: Session, user_id: int, entries: list, crop: Optional[str] = None):
+    # Yields per-image results chunk by chunk as inference completes.
+    # All rows go into one transaction, committed after the last chunk.
+    all_ferts = await run_in_threadpool(crud.get_fertilizers_cached)
+    chunk_size = inference.BATCH_BUCKETS[-1]
+    try:
+        for start in range(0, len(entries), chunk_size):
+            chunk = entries[start:start + chunk_size]
+            todo = [e for e in chunk if "error" not in e]
+            results = await inference.predict_batch_async([e["path"] for e in todo], crop) if todo else []
+            for entry, result in zip(todo, results):
+                if isinstance(result, Exception):
+                    entry["error"] = "Could not read image file"
+                else:
+                    entry["result"] = result
+            for item in await run_in_threadpool(_persist_batch_chunk, db, user_id, chunk, all_ferts):
+                yield item
+        await run_in_threadpool(db.commit)
+    except BaseException:
+        await run_in_threadpool(db.rollback)
+        raise
+
+async def _collect_upload_entries(files: List[UploadFile]):
+    # Saves every image (including ZIP members) to UPLOAD_DIR.
+    # Returns dicts with filename + path + image_url, or filename + error.
+    # Nothing stays on disk when the upload is rejected (e.g. over the image
+    # limit part way through): files saved so far are removed.
+    entries = []
+    try:
+        for file in files:
+            remaining = BATCH_MAX_IMAGES - len(entries)
+            if _is_zip(file):
+                entries.extend(await run_in_threadpool(_extract_zip_images, file.file, remaining))
+            elif (file.content_type or "").startswith("image/"):
+                if remaining <= 0:
+                    raise HTTPException(status_code=413, detail=f"Too many images (max {BATCH_MAX_IMAGES})")
+                file_extension = file.filename.split(".")[-1]
+                file_path, image_url = await _save_upload(file, file_extension)
+                entries.append({"filename": file.filename, "path": file_path, "image_url": image_url})
+            else:
+                entries.append({"filename": file.filename, "error": "File must be an image or a ZIP archive"})
+    except Exception:
+        _remove_saved(entries)
+        raise
+    return entries
+
+@router.post("/batch", response_model=schemas.BatchDetectionResponse)
+async def batch_upload(
+    files: List[UploadFile] = File(...),
+    stream: bool = False,
+    crop: Optional[str] = Form(None),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    # Accepts many images and/or ZIP archives of images. With ?stream=true the
+    # results are returned as NDJSON, one line per image as each chunk completes.
+    entries = await _collect_upload_entries(files)
+    if not entries:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+
+    user_id = current_user.user_id
+    crop = inference.resolve_crop(crop, current_user.crops_grown)
+
+    if stream:
+        async def ndjson():
+            # Own session: the request-scoped one may be closed before streaming ends
+            stream_db = database.SessionLocal()
+            succeeded = failed = 0
+            try:
+                async for item in _run_batch(stream_db, user_id, entries, crop):
+                    if item.get("error"):
+                        failed += 1
+                    else:
+                        succeeded += 1
+                    yield json.dumps(jsonable_encoder(item)) + "\n"
+            finally:
+                stream_db.close()
+            yield json.dumps({"done": True, "total": len(entries), "succeeded": succeeded, "failed": failed}) + "\n"
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    results = [item async for item in _run_batch(db, user_id, entries, crop)]
+    failed = sum(1 for item in results if item.get("error"))
+    return {
+        "total": len(results),
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "results": results
+    }
+
+# --- Detection Jobs (processed by `python -m app.worker`) ---
+
+def _job_response(job: models.DetectionJob):
+    results = []
+    for item in job.items:
+        entry = {"filename": item.filename, "image_id": item.image_id, "error": item.error}
+        if item.image is not None:
+            entry["image_url"] = item.image.image_url
+            prediction = item.image.prediction
+            if item.status == "Done" and prediction is not None:
+                entry.update({
+                    "prediction_id": prediction.prediction_id,
+                    "disease_name": prediction.disease_name,
+                    "confidence": prediction.confidence,
+                    "is_healthy": prediction.is_healthy
+                })
+        if item.status in ("Done", "Failed"):
+            results.append(entry)
+
+    total = job.total_images or 0
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "total_images": total,
+        "processed_images": job.processed_images or 0,
+        "failed_images": job.failed_images or 0,
+        "progress": round((job.processed_images or 0) / total, 4) if total else 1.0,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "results": results
+    }
+
+@router.post("/jobs", response_model=schemas.DetectionJobSubmitResponse)
+async def submit_detection_job(
+    files: List[UploadFile] = File(...),
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    entries = await _collect_upload_entries(files)
+    accepted = [e for e in entries if "error" not in e]
+    rejected = [{"filename": e["filename"], "error": e["error"]} for e in entries if "error" in e]
+    if not accepted:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+
+    job = await run_in_threadpool(job_queue.submit_job, db, current_user.user_id, accepted)
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "total_images": job.total_images,
+        "rejected": rejected
+    }
+
+@router.get("/jobs/metrics")
+def get_job_metrics(
+    current_user: models.User = Depends(auth.get_current_admin),
+    db: Session = Depends(database.get_db)
+):
+    # Queue depth, in-flight items and recent throughput
+    return job_queue.get_metrics(db)
+
+@router.get("/jobs/{job_id}", response_model=schemas.DetectionJobResponse)
+def get_detection_job(
+    job_id: int,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    job = job_queue.get_job(db, job_id, user_id=current_user.user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
+
+@router.get("/stats")
+def get_inference_stats(current_user: models.User = Depends(auth.get_current_admin)):
+    # Model status plus micro-batcher queue depth / batch size stats
+    return inference.get_stats()
+
+@router.get("/rescore")
+def get_rescore_runs(
+    current_user: models.User = Depends(auth.get_current_admin),
+    db: Session = Depends(database.get_db)
+):
+    # Progress of `python -m app.rescore`, newest model version first
+    runs = db.query(models.RescoreRun).order_by(models.RescoreRun.run_id.desc()).all()
+    return [{
+        "model_version": run.model_version,
+        "status": run.status,
+        "last_image_id": run.last_image_id,
+        "max_image_id": run.max_image_id,
+        "rescored": run.rescored,
+        "changed": run.changed,
+        "missing": run.missing,
+        "failed": run.failed,
+        "created_at": run.created_at,
+        "updated_at": run.updated_at,
+        "finished_at": run.finished_at
+    } for run in runs]
+
+@router.get("/predictions/{prediction_id}/alternatives", response_model=schemas.PredictionAlternativesResponse)
+def get_prediction_alternatives(
+    prediction_id: int,
+    k: int = 3,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    # The k most likely diseases of a stored prediction, from its probability vector
+    prediction = db.query(models.Prediction).filter(models.Prediction.prediction_id == prediction_id).first()
+    is_admin = current_user.is_admin or current_user.role == "admin"
+    if not prediction or (not is_admin and prediction.image.user_id != current_user.user_id):
+        raise HTTPException(status_code=404, detail="Prediction not found")
+    if prediction.probabilities is None:
+        raise HTTPException(status_code=404, detail="No probabilities stored for this prediction")
+    if prediction.label_map != inference.LABEL_MAP:
+        raise HTTPException(status_code=409, detail="Prediction was stored with a different class list")
+
+    vector = probabilities.decode([prediction.probabilities], len(inference.LABELS))
+    indices, values = probabilities.top_k(vector, min(max(k, 1), len(inference.LABELS)))
+    return {
+        "prediction_id": prediction.prediction_id,
+        "model_version": prediction.model_version,
+        "alternatives": [{
+            "disease_name": inference.CLASS_INFO[i]["name"],
+            "probability": round(float(p), 4),
+            "is_healthy": inference.CLASS_INFO[i]["healthy"]
+        } for i, p in zip(indices[0], values[0])]
+    }
+
+@router.get("/calibration")
+def get_calibration(
+    model_version: Optional[str] = None,
+    reference_version: Optional[str] = None,
+    bins: int = probabilities.CALIBRATION_BINS,
+    current_user: models.User = Depends(auth.get_current_admin),
+    db: Session = Depends(database.get_db)
+):
+    # Bulk confidence/calibration metrics over the stored probability vectors of
+    # one model version (default: the one being served). Without labels only
+    # the confidence summary is available; with reference_version, the
+    # reference model's predictions on the same images serve as labels (e.g. a
+    # larger model after `python -m app.rescore`) and ECE, Brier score, a
+    # reliability table and the best-fitting temperature are added.
+    model_version = model_version or inference.model_version
+    if not model_version:
+        raise HTTPException(status_code=400, detail="No model loaded; pass model_version")
+    num_classes = len(inference.LABELS)
+    image_ids, blobs = crud.get_probability_vectors(db, model_version, inference.LABEL_MAP)
+    probs = probabilities.decode(blobs, num_classes)
+    report = {"model_version": model_version, **probabilities.confidence_summary(probs)}
+    if not reference_version:
+        return report
+
+    ref_ids, ref_blobs = crud.get_probability_vectors(db, reference_version, inference.LABEL_MAP)
+    labels = probabilities.decode(ref_blobs, num_classes).argmax(axis=1)
+    _, mine, theirs = np.intersect1d(image_ids, ref_ids, assume_unique=True, return_indices=True)
+    probs, labels = probs[mine], labels[theirs]
+    report["reference_version"] = reference_version
+    report["calibration"] = probabilities.calibration(probs, labels, max(bins, 1))
+    if len(probs):
+        temperature = probabilities.fit_temperature(probs, labels)
+        report["temperature"] = temperature
+        report["calibration_at_temperature"] = {
+            key: value for key, value in probabilities.calibration(
+                probabilities.with_temperature(probs, temperature), labels, max(bins, 1)
+            ).items() if key != "reliability"
+        }
+    return report
+
 @router.get("/history", response_model=list[schemas.PlantImageResponse])
 def get_history(
     current_user: models.User = Depends(auth.get_current_user), 
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from ..database import get_db
 from ..models import User, ShopInventory, Order, ShopQuery, Fertilizer, OrderItem
 from ..auth import get_current_user
+from ..crud import invalidate_reference_cache
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
@@ -50,6 +51,7 @@ def add_to_inventory(item: ProductCreate, db: Session = Depends(get_db), current
         db.add(fert)
         db.commit()
         db.refresh(fert)
+        invalidate_reference_cache()
 
     # Check if item already in inventory
     inventory = db.query(ShopInventory).filter(ShopInventory.user_id == current_user.user_id, ShopInventory.fertilizer_id == fert.fertilizer_id).first()
@@ -90,9 +90,58 @@ class PredictionResponse(PredictionBase):
     description: Optional[str] = None
     treatment: Optional[str] = None
     recommended_products: List[FertilizerResponse] = []
+    model_version: Optional[str] = None
     class Config:
         from_attributes = True
 
+class AlternativePrediction(BaseModel):
+    disease_name: str
+    probability: float
+    is_healthy: bool
+
+class PredictionAlternativesResponse(BaseModel):
+    prediction_id: int
+    model_version: Optional[str] = None
+    alternatives: List[AlternativePrediction] = []
+
+class BatchDetectionItem(BaseModel):
+    filename: str
+    image_id: Optional[int] = None
+    image_url: Optional[str] = None
+    prediction_id: Optional[int] = None
+    disease_name: Optional[str] = None
+    confidence: Optional[float] = None
+    is_healthy: Optional[bool] = None
+    description: Optional[str] = None
+    treatment: Optional[str] = None
+    recommended_fertilizers: List[FertilizerResponse] = []
+    recommended_fertilizer: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchDetectionResponse(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    results: List[BatchDetectionItem] = []
+
+class DetectionJobSubmitResponse(BaseModel):
+    job_id: int
+    status: str
+    total_images: int
+    rejected: List[BatchDetectionItem] = []
+
+class DetectionJobResponse(BaseModel):
+    job_id: int
+    status: str
+    total_images: int
+    processed_images: int
+    failed_images: int
+    progress: float
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    results: List[BatchDetectionItem] = []
+
 class PlantImageBase(BaseModel):
     image_url: str
 
@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+
+# Startup timing: seconds from process start to each named phase ("imports",
+# "ready", ...). Helps spot slow cold starts before they block autoscaling.
+
+_phases = {}
+_state = {"ready": False, "draining": False}
+
+
+def _process_start():
+    # Wall-clock process start time from /proc (Linux); falls back to this import
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.time()
+
+
+PROCESS_STARTED_AT = _process_start()
+
+
+def mark(phase):
+    _phases[phase] = round(time.time() - PROCESS_STARTED_AT, 3)
+    return _phases[phase]
+
+
+def set_ready(ready=True):
+    _state["ready"] = ready
+
+
+def set_draining():
+    _state["draining"] = True
+    _state["ready"] = False
+
+
+def is_ready():
+    return _state["ready"] and not _state["draining"]
+
+
+def report():
+    return {
+        "ready": is_ready(),
+        "draining": _state["draining"],
+        "uptime_sec": round(time.time() - PROCESS_STARTED_AT, 1),
+        "phases_sec": dict(_phases),
+        "tensorflow_imported": "tensorflow" in sys.modules,
+    }
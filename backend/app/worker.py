@@ -0,0 +1,149 @@
+import argparse
+import multiprocessing
+import os
+import signal
+import time
+
+from . import crud, job_queue
+from .database import SessionLocal
+from .ai_engine import inference
+
+# Detection job workers. Run from the backend directory (same cwd as the API so
+# upload paths resolve):
+#     python -m app.worker --processes 4
+
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+REQUEUE_INTERVAL = float(os.getenv("JOB_REQUEUE_INTERVAL", "30"))
+WORKER_PROCESSES = int(os.getenv("DETECTION_WORKERS", "2"))
+
+
+def _process_items(db, items, claim_token):
+    # Items of users who grow a single crop go to that crop's sub-model, if any
+    crops_grown = crud.get_crops_grown(db, {item.job.user_id for item in items})
+    groups = {}
+    for item in items:
+        crop = inference.resolve_crop(crops_grown=crops_grown.get(item.job.user_id))
+        groups.setdefault(crop, []).append(item)
+
+    outcomes = []
+    for crop, group in groups.items():
+        results = inference.predict_batch([item.file_path for item in group], crop=crop)
+        for item, result in zip(group, results):
+            if isinstance(result, Exception):
+                outcomes.append((item, None, "Could not read image file"))
+            else:
+                outcomes.append((item, result, None))
+    job_queue.complete_items(db, outcomes, claim_token)
+
+
+def _process_claim(db, items, claim_token, worker_index, stopping=lambda: False):
+    # On shutdown, items not started yet go back to the queue without using
+    # up an attempt instead of waiting for their lease to expire
+    if stopping():
+        job_queue.release_items(db, items, claim_token)
+        return
+    try:
+        _process_items(db, items, claim_token)
+        return
+    except Exception as e:
+        print(f"Worker {worker_index}: batch failed: {e}")
+        db.rollback()
+    if len(items) == 1:
+        job_queue.retry_items(db, items, claim_token, "Detection failed")
+        return
+
+    # Retry one image at a time, so one bad image only fails itself
+    for i, item in enumerate(items):
+        if stopping():
+            job_queue.release_items(db, items[i:], claim_token)
+            return
+        try:
+            _process_items(db, [item], claim_token)
+        except Exception as e:
+            print(f"Worker {worker_index}: item {item.item_id} failed: {e}")
+            db.rollback()
+            job_queue.retry_items(db, [item], claim_token, "Detection failed")
+
+
+def run_worker(worker_index=0):
+    stopping = False
+
+    def handle_stop(signum, frame):
+        # Finish the current batch (or release what is left of it), then exit
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    inference.load_model()
+    batch_size = inference.BATCH_BUCKETS[-1]
+    last_requeue = 0.0
+    print(f"Detection worker {worker_index} (pid {os.getpid()}) started.")
+
+    while not stopping:
+        db = SessionLocal()
+        try:
+            if time.monotonic() - last_requeue > REQUEUE_INTERVAL:
+                requeued = job_queue.requeue_stale(db)
+                if requeued:
+                    print(f"Worker {worker_index}: requeued {requeued} stale item(s).")
+                last_requeue = time.monotonic()
+
+            claim_token, items = job_queue.claim_items(db, batch_size)
+            if not items:
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            _process_claim(db, items, claim_token, worker_index, lambda: stopping)
+        except Exception as e:
+            print(f"Worker {worker_index}: queue error: {e}")
+            time.sleep(POLL_INTERVAL)
+        finally:
+            db.close()
+
+    print(f"Detection worker {worker_index} stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run detection job workers")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES)
+    args = parser.parse_args()
+
+    # Spawn (not fork) so each worker initialises TensorFlow cleanly
+    ctx = multiprocessing.get_context("spawn")
+    workers = {}
+    stopping = False
+
+    def start(index):
+        proc = ctx.Process(target=run_worker, args=(index,), name=f"detection-worker-{index}")
+        proc.start()
+        workers[index] = proc
+
+    def handle_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for proc in workers.values():
+            if proc.is_alive():
+                proc.terminate()
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    for index in range(args.processes):
+        start(index)
+
+    # Restart crashed workers; their claimed items are requeued once the lease expires
+    while not stopping:
+        time.sleep(1)
+        for index, proc in list(workers.items()):
+            if not proc.is_alive() and not stopping:
+                print(f"Worker {index} exited with code {proc.exitcode}, restarting.")
+                start(index)
+
+    for proc in workers.values():
+        proc.join()
+
+
+if __name__ == "__main__":
+    main()
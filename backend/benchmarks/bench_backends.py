@@ -0,0 +1,128 @@
+"""
+CPU latency, throughput and memory per inference backend (keras vs tflite).
+
+    python -m app.ai_engine.convert_tflite   # once, to produce the .tflite model
+    python benchmarks/bench_backends.py --threads 1,4
+
+Each backend runs in its own subprocess so RSS and load time are measured cleanly.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")  # CPU numbers only
+
+
+def _proc_status_mb(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def run_backend(name, model_path, threads, iterations, batch_size):
+    from app.ai_engine import inference
+    from app.ai_engine.backends import create_backend, import_tf
+
+    if name == "keras" or not _has_tflite_runtime():
+        import_tf()  # so load_s measures the model, not the TensorFlow import
+    baseline = _proc_status_mb("VmRSS")
+    buckets = sorted({1, batch_size})
+
+    started = time.perf_counter()
+    backend = create_backend(name, model_path, buckets, img_size=inference.IMG_SIZE, num_threads=threads)
+    load_s = time.perf_counter() - started
+    rss_after_load = _proc_status_mb("VmRSS")
+
+    rng = np.random.default_rng(0)
+    single = rng.random((1, inference.IMG_SIZE, inference.IMG_SIZE, 3), dtype=np.float32)
+    batch = rng.random((batch_size, inference.IMG_SIZE, inference.IMG_SIZE, 3), dtype=np.float32)
+    for _ in range(5):
+        backend.predict(single)
+        backend.predict(batch)
+
+    latencies = []
+    for _ in range(iterations):
+        t = time.perf_counter()
+        backend.predict(single)
+        latencies.append((time.perf_counter() - t) * 1000)
+
+    rounds = max(1, iterations // batch_size)
+    t = time.perf_counter()
+    for _ in range(rounds):
+        backend.predict(batch)
+    throughput = rounds * batch_size / (time.perf_counter() - t)
+
+    return {
+        "backend": name,
+        "threads": threads,
+        "load_s": load_s,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "img_per_s": throughput,
+        "model_rss_mb": rss_after_load - baseline,
+        "peak_rss_mb": _proc_status_mb("VmHWM"),
+    }
+
+
+def _has_tflite_runtime():
+    try:
+        import tflite_runtime  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keras-model", default=os.path.join(BACKEND_DIR, "app", "ai_engine", "crop_disease_model.h5"))
+    parser.add_argument("--tflite-model", default=os.path.join(BACKEND_DIR, "app", "ai_engine", "crop_disease_model.tflite"))
+    parser.add_argument("--threads", default=str(os.cpu_count() or 1), help="Comma-separated TFLite thread counts")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        name, model_path, threads = json.loads(args.child)
+        print(json.dumps(run_backend(name, model_path, threads, args.iterations, args.batch_size)))
+        return
+
+    runs = [("keras", args.keras_model, None)]
+    runs += [("tflite", args.tflite_model, int(t)) for t in args.threads.split(",")]
+
+    print(f"{'backend':<8} {'threads':>7} {'load s':>7} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{f'img/s @{args.batch_size}':>10} {'model MB':>9} {'peak MB':>8}")
+    for name, model_path, threads in runs:
+        if not os.path.exists(model_path):
+            print(f"{name:<8} skipped: {model_path} not found")
+            continue
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", json.dumps([name, model_path, threads]),
+             "--iterations", str(args.iterations), "--batch-size", str(args.batch_size)],
+            capture_output=True, text=True, cwd=BACKEND_DIR,
+        )
+        if out.returncode != 0:
+            print(f"{name:<8} failed: {out.stderr.strip().splitlines()[-1] if out.stderr.strip() else out.returncode}")
+            continue
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(
+            f"{r['backend']:<8} {str(r['threads'] or '-'):>7} {r['load_s']:7.2f} {r['p50_ms']:8.2f} {r['p99_ms']:8.2f} "
+            f"{r['img_per_s']:10.1f} {r['model_rss_mb']:9.1f} {r['peak_rss_mb']:8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
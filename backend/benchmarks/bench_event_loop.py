@@ -0,0 +1,95 @@
+"""
+Measures /api/shop/marketplace latency while /api/detect/upload is saturated.
+
+Run against a live server:
+    python benchmarks/bench_event_loop.py --url http://127.0.0.1:8000 \
+        --email farmer@example.com --password secret --image leaf.jpg
+"""
+import argparse
+import statistics
+import threading
+import time
+
+import requests
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def login(base_url, email, password):
+    resp = requests.post(f"{base_url}/api/users/login", json={"email": email, "password": password})
+    resp.raise_for_status()
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+def probe_marketplace(base_url, headers, duration):
+    latencies = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        requests.get(f"{base_url}/api/shop/marketplace", headers=headers)
+        latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.05)
+    return latencies
+
+
+def upload_loop(base_url, headers, image_path, stop, counter):
+    with open(image_path, "rb") as f:
+        data = f.read()
+    session = requests.Session()
+    while not stop.is_set():
+        session.post(
+            f"{base_url}/api/detect/upload",
+            headers=headers,
+            files={"file": ("leaf.jpg", data, "image/jpeg")},
+        )
+        counter.append(1)
+
+
+def report(label, latencies):
+    print(
+        f"{label:<22} n={len(latencies):<5} "
+        f"p50={percentile(latencies, 50):7.1f} ms  "
+        f"p99={percentile(latencies, 99):7.1f} ms  "
+        f"mean={statistics.mean(latencies) if latencies else 0:7.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--image", required=True)
+    parser.add_argument("--uploaders", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0)
+    args = parser.parse_args()
+
+    headers = login(args.url, args.email, args.password)
+
+    report("marketplace (idle)", probe_marketplace(args.url, headers, args.duration / 2))
+
+    stop = threading.Event()
+    uploads = []
+    threads = [
+        threading.Thread(target=upload_loop, args=(args.url, headers, args.image, stop, uploads), daemon=True)
+        for _ in range(args.uploaders)
+    ]
+    for t in threads:
+        t.start()
+    try:
+        report("marketplace (loaded)", probe_marketplace(args.url, headers, args.duration))
+    finally:
+        stop.set()
+        for t in threads:
+            t.join(timeout=30)
+    print(f"uploads completed: {len(uploads)} ({len(uploads) / args.duration:.1f}/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Single-image CPU latency: Keras `model.predict` vs the compiled bucket path.
+
+    python benchmarks/bench_inference.py --model app/ai_engine/crop_disease_model.h5
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")  # CPU numbers only
+
+
+def percentile(values, pct):
+    return float(np.percentile(np.asarray(values), pct))
+
+
+def time_calls(fn, batch, warmup, iterations):
+    for _ in range(warmup):
+        fn(batch)
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn(batch)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=None, help="Path to the .h5 model (defaults to inference.MODEL_PATH)")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--batch-sizes", default="1,4,8")
+    args = parser.parse_args()
+
+    from app.ai_engine import inference
+    from app.ai_engine.backends import KerasBackend
+
+    model_path = args.model or inference.MODEL_PATH
+    backend = KerasBackend(model_path, inference.BATCH_BUCKETS, img_size=inference.IMG_SIZE, compiled=False)
+    model = backend.model
+
+    started = time.perf_counter()
+    backend.compiled = backend.compile(backend.buckets)
+    print(f"Traced + warmed buckets {sorted(backend.compiled)} in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    print(f"{'batch':>5}  {'path':<14} {'p50 ms':>8} {'p99 ms':>8} {'img/s':>8}")
+    for size in [int(b) for b in args.batch_sizes.split(",")]:
+        batch = np.random.rand(size, inference.IMG_SIZE, inference.IMG_SIZE, 3).astype(np.float32)
+        paths = {
+            "model.predict": lambda x: model.predict(x, verbose=0),
+            "compiled": backend.predict,
+        }
+        for name, fn in paths.items():
+            latencies = time_calls(fn, batch, args.warmup, args.iterations)
+            p50 = percentile(latencies, 50)
+            print(f"{size:>5}  {name:<14} {p50:8.2f} {percentile(latencies, 99):8.2f} {size * 1000 / p50:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
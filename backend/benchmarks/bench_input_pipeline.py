@@ -0,0 +1,72 @@
+"""
+Training input throughput (images/sec): ImageDataGenerator vs the tf.data pipeline,
+on the same dataset and machine, without a model in the loop.
+
+    python benchmarks/bench_input_pipeline.py --dataset dataset/PlantVillage --batches 100
+    python benchmarks/bench_input_pipeline.py --cache-dir /tmp/pv-cache   # also time the cached epoch
+    python benchmarks/bench_input_pipeline.py --packed-dir dataset/packed # also time pack_dataset shards
+
+All pipelines produce augmented (32, 224, 224, 3) float32 training batches.
+"""
+import argparse
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+
+def images_per_sec(batches, count, warmup=5):
+    iterator = iter(batches)
+    for _ in range(warmup):
+        next(iterator)
+    seen = 0
+    started = time.perf_counter()
+    for _ in range(count):
+        images, _ = next(iterator)
+        seen += len(images)
+    return seen / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", default=None, help="Defaults to train_model.DATASET_DIR")
+    parser.add_argument("--batches", type=int, default=100)
+    parser.add_argument("--cache-dir", help="Also measure tf.data reading from its on-disk cache")
+    parser.add_argument("--packed-dir", help="Also measure the memory-mapped packed dataset")
+    args = parser.parse_args()
+
+    from app.ai_engine import train_model
+
+    if args.dataset:
+        train_model.DATASET_DIR = args.dataset
+    if not os.path.exists(train_model.DATASET_DIR):
+        raise SystemExit(f"Dataset not found at {train_model.DATASET_DIR}")
+
+    results = []
+    train_data = train_model.generator_inputs()[0]
+    results.append(("generator", images_per_sec(train_data, args.batches)))
+
+    train_data = train_model.tfdata_inputs()[0]
+    results.append(("tfdata", images_per_sec(train_data.repeat(), args.batches)))
+
+    if args.cache_dir:
+        train_data = train_model.tfdata_inputs(args.cache_dir)[0]
+        for _ in train_data:  # first epoch fills the cache
+            pass
+        results.append(("tfdata+cache", images_per_sec(train_data.repeat(), args.batches)))
+
+    if args.packed_dir:
+        train_data = train_model.packed_inputs(args.packed_dir)[0]
+        results.append(("packed", images_per_sec(train_data.repeat(), args.batches)))
+
+    print(f"\n{'pipeline':<14} {'img/s':>9} {'speedup':>8}  ({os.cpu_count()} CPUs, {args.batches} batches)")
+    for name, rate in results:
+        print(f"{name:<14} {rate:9.1f} {rate / results[0][1]:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
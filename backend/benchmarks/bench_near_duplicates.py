@@ -0,0 +1,153 @@
+"""
+Near-duplicate reuse: pHash cost, hit rate per Hamming radius, and the build
+time / lookup latency of the multi-index hash (what inference uses) and the
+BK-tree against a NumPy linear scan.
+
+    python benchmarks/bench_near_duplicates.py
+    python benchmarks/bench_near_duplicates.py --images 200 --index-sizes 10000,100000,500000
+
+Hit rate: each synthetic "leaf" photo gets the edits near-identical uploads
+usually have (WhatsApp-style recompression, downscaling, brightness, a small
+crop, a burst-shot shift). A variant is a hit when its pHash is within the
+radius of its original's. False matches are pairs of different photos
+within the radius. Index timings use random 64-bit hashes; real pHashes
+cluster more, so treat them as a rough guide.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from app.ai_engine.inference import load_pixels  # noqa: E402
+from app.ai_engine.perceptual_hash import BKTree, MultiIndexHash, hamming, phash  # noqa: E402
+
+RADII = (2, 4, 6, 8, 10, 12)
+
+
+def make_photo(rng, size=1024):
+    # Smooth random colour field with leaf-like blotches and sensor noise
+    low = rng.uniform(0, 255, size=(6, 6, 3)).astype(np.uint8)
+    img = np.asarray(Image.fromarray(low).resize((size, size), Image.BICUBIC), dtype=np.float32)
+    yy, xx = np.mgrid[0:size, 0:size]
+    for _ in range(rng.integers(3, 8)):
+        cx, cy, r = rng.uniform(0, size), rng.uniform(0, size), rng.uniform(size / 20, size / 6)
+        img[(xx - cx) ** 2 + (yy - cy) ** 2 < r * r] *= rng.uniform(0.4, 0.8)
+    img += rng.normal(0, 6, size=img.shape)
+    return Image.fromarray(np.clip(img, 0, 255).astype(np.uint8))
+
+
+def jpeg(img, quality=90):
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def variants(img):
+    w, h = img.size
+    yield "recompress q40", jpeg(Image.open(io.BytesIO(jpeg(img, 75))), 40)
+    yield "downscale 50%", jpeg(img.resize((w // 2, h // 2), Image.BILINEAR), 70)
+    yield "brightness +8%", jpeg(Image.fromarray(np.clip(np.asarray(img) * 1.08, 0, 255).astype(np.uint8)))
+    yield "crop 3%", jpeg(img.crop((int(w * 0.03), int(h * 0.03), w, h)).resize((w, h)))
+    yield "shift 2%", jpeg(img.transform(img.size, Image.AFFINE, (1, 0, w * 0.02, 0, 1, h * 0.01), Image.BILINEAR))
+
+
+def hash_bytes(data):
+    return phash(load_pixels(io.BytesIO(data)))
+
+
+def hit_rates(count, seed=0):
+    rng = np.random.default_rng(seed)
+    originals, distances, hash_ms = [], {}, []
+    for _ in range(count):
+        img = make_photo(rng)
+        data = jpeg(img)
+        started = time.perf_counter()
+        original = hash_bytes(data)
+        hash_ms.append((time.perf_counter() - started) * 1000)
+        originals.append(original)
+        for name, variant in variants(img):
+            distances.setdefault(name, []).append(hamming(original, hash_bytes(variant)))
+
+    print(f"Decode + preprocess + pHash: {np.median(hash_ms):.2f} ms/image (median of {count}).\n")
+    print(f"{'variant':<16} {'mean bits':>9} " + " ".join(f"{f'r<={r}':>6}" for r in RADII))
+    for name, values in distances.items():
+        values = np.array(values)
+        print(f"{name:<16} {values.mean():9.1f} " + " ".join(f"{np.mean(values <= r):6.0%}" for r in RADII))
+    pairs = np.array([hamming(a, b) for i, a in enumerate(originals) for b in originals[i + 1:]])
+    print(f"{'false match':<16} {pairs.mean():9.1f} " + " ".join(f"{np.mean(pairs <= r):6.1%}" for r in RADII))
+
+
+POPCOUNT16 = np.array([bin(i).count("1") for i in range(1 << 16)], dtype=np.uint8)
+
+
+def linear_nearest(keys, key, radius):
+    # Baseline: XOR against every stored hash, count bits 16 at a time
+    distances = POPCOUNT16[(keys ^ np.uint64(key)).view(np.uint16)].reshape(len(keys), 4).sum(axis=1)
+    best = int(distances.argmin())
+    return (int(distances[best]), best) if distances[best] <= radius else None
+
+
+def index_timings(sizes, radius, queries=1000, seed=0):
+    rnd = random.Random(seed)
+    print(f"\nRadius {radius}, {queries} lookups per size.")
+    print(f"{'images':>8} {'index':>6} {'build s':>8} {'p50 us':>9} {'p99 us':>9} {'scan p50 us':>12} {'hits':>6}")
+    for size in sizes:
+        keys = [rnd.getrandbits(64) for _ in range(size)]
+        array = np.array(keys, dtype=np.uint64)
+
+        # Half the queries are near-duplicates of stored hashes (a few bits flipped), half are new images
+        probes = []
+        for q in range(queries):
+            key = rnd.getrandbits(64)
+            if q % 2 == 0:
+                key = keys[rnd.randrange(size)]
+                for bit in rnd.sample(range(64), rnd.randint(0, radius)):
+                    key ^= 1 << bit
+            probes.append(key)
+
+        scan_us, expected = [], []
+        for key in probes:
+            started = time.perf_counter()
+            baseline = linear_nearest(array, key, radius)
+            scan_us.append((time.perf_counter() - started) * 1e6)
+            expected.append(baseline[0] if baseline else None)
+
+        for name, index in (("mih", MultiIndexHash(radius)), ("bktree", BKTree())):
+            started = time.perf_counter()
+            for i, key in enumerate(keys):
+                index.add(key, i)
+            build_s = time.perf_counter() - started
+
+            lookup_us, hits = [], 0
+            for key, distance in zip(probes, expected):
+                started = time.perf_counter()
+                found = index.nearest(key, radius)
+                lookup_us.append((time.perf_counter() - started) * 1e6)
+                assert (found[0] if found else None) == distance, f"{name} and linear scan disagree"
+                hits += found is not None
+            print(f"{size:8d} {name:>6} {build_s:8.2f} {np.percentile(lookup_us, 50):9.1f} "
+                  f"{np.percentile(lookup_us, 99):9.1f} {np.percentile(scan_us, 50):12.1f} {hits / queries:6.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=100, help="Synthetic photos for the hit-rate table")
+    parser.add_argument("--index-sizes", default="10000,100000")
+    parser.add_argument("--radius", type=int, default=6, help="NEAR_DUPLICATE_DISTANCE for the index timings")
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    hit_rates(args.images)
+    index_timings([int(n) for n in args.index_sizes.split(",")], args.radius, args.queries)
+
+
+if __name__ == "__main__":
+    main()
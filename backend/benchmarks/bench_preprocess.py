@@ -0,0 +1,146 @@
+"""
+Decode + resize time and peak memory per image for `preprocess_image`,
+legacy path vs the draft-mode float32 path, on 4000x3000 JPEGs.
+
+    python benchmarks/bench_preprocess.py --images 20
+    python benchmarks/bench_preprocess.py --dir path/to/phone/photos
+
+Each variant runs in its own subprocess so peak RSS is measured cleanly.
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def legacy_preprocess(image_path):
+    # preprocess_image as it was before the fast path
+    img = Image.open(image_path).convert("RGB").resize((224, 224))
+    img_array = np.array(img)
+    img_array = img_array / 255.0
+    img_array = np.expand_dims(img_array, axis=0)
+    return img_array
+
+
+def make_images(directory, count, size=(4000, 3000)):
+    # Smooth gradients + noise compress roughly like a real leaf photo
+    rng = np.random.default_rng(0)
+    w, h = size
+    x = np.linspace(0, 255, w, dtype=np.float32)
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    paths = []
+    for i in range(count):
+        base = np.empty((h, w, 3), dtype=np.float32)
+        base[..., 0] = (x * 0.3 + y * 0.2 + i * 7) % 256
+        base[..., 1] = (x * 0.6 + 60) % 256
+        base[..., 2] = (y * 0.4 + 20) % 256
+        base += rng.normal(0, 12, size=(h, w, 1))
+        img = Image.fromarray(np.clip(base, 0, 255).astype(np.uint8))
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 CW, as phones commonly write
+        path = os.path.join(directory, f"leaf_{i:03d}.jpg")
+        img.save(path, "JPEG", quality=90, exif=exif)
+        paths.append(path)
+    return paths
+
+
+def _proc_status_mb(field):
+    # VmHWM/VmRSS are per-process (ru_maxrss is inherited from the parent on fork)
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def max_rss_mb():
+    peak = _proc_status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024.0 if sys.platform != "darwin" else rss / (1024.0 * 1024.0)
+
+
+def run_variant(variant, paths):
+    if variant == "legacy":
+        fn = legacy_preprocess
+    else:
+        os.environ.setdefault("INFERENCE_BATCHING", "0")
+        from app.ai_engine.inference import preprocess_image
+
+        if variant == "fast":
+            fn = preprocess_image
+        else:
+            # fast path writing into one preallocated batch slot
+            slot = np.empty((224, 224, 3), dtype=np.float32)
+
+            def fn(path):
+                return preprocess_image(path, out=slot)
+
+    # Baseline after imports, before any decode: the RSS high-water mark then
+    # grows by the peak working set of a single image
+    baseline = max_rss_mb()
+    fn(paths[0])  # warm codecs
+    timings = []
+    for path in paths:
+        started = time.perf_counter()
+        result = fn(path)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "variant": variant,
+        "dtype": str(result.dtype),
+        "mean_ms": float(np.mean(timings)),
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p99_ms": float(np.percentile(timings, 99)),
+        "peak_rss_delta_mb": max_rss_mb() - baseline,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", help="Directory of real JPEGs (otherwise synthetic 4000x3000 images are generated)")
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--variant", help=argparse.SUPPRESS)
+    parser.add_argument("--paths", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, json.loads(args.paths))))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.dir:
+            paths = sorted(glob.glob(os.path.join(args.dir, "*.jp*g")))[: args.images]
+        else:
+            print(f"Generating {args.images} synthetic 4000x3000 JPEGs...")
+            paths = make_images(tmp, args.images)
+
+        print(f"{'variant':<12} {'dtype':<8} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8} {'peak RSS +MB':>13}")
+        for variant in ("legacy", "fast", "fast+buffer"):
+            out = subprocess.run(
+                [sys.executable, __file__, "--variant", variant, "--paths", json.dumps(paths)],
+                capture_output=True, text=True, check=True, cwd=BACKEND_DIR,
+            )
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(
+                f"{r['variant']:<12} {r['dtype']:<8} {r['mean_ms']:8.1f} {r['p50_ms']:8.1f} "
+                f"{r['p99_ms']:8.1f} {r['peak_rss_delta_mb']:13.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
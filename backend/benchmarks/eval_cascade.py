@@ -0,0 +1,103 @@
+"""
+Cascade threshold report: escalation rate, average latency and accuracy of the
+small -> large cascade versus always using the large model, on the validation
+split of a labelled image folder.
+
+    python benchmarks/eval_cascade.py --small small_model.tflite --large app/ai_engine/crop_disease_model.h5 \\
+        --dataset dataset/PlantVillage --limit 2000
+
+Both models run once over every image; each threshold pair is then evaluated
+from the stored outputs, so the sweep itself is instant. Set the chosen values
+as CASCADE_MIN_CONFIDENCE / CASCADE_MIN_MARGIN.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+os.environ.setdefault("INFERENCE_BATCHING", "0")
+
+BATCH_SIZE = 32
+
+
+def load(path):
+    from app.ai_engine import inference
+    from app.ai_engine.backends import create_backend
+
+    backend = "tflite" if path.endswith(".tflite") else "keras"
+    model = create_backend(backend, path, [1, BATCH_SIZE], img_size=inference.IMG_SIZE)
+    columns = inference._label_columns(inference._sidecar_labels(path))
+    return inference._ActiveModel(model, os.path.basename(path), columns, "eval")
+
+
+def latency_ms(active, image, iterations=30):
+    from app.ai_engine import inference
+
+    for _ in range(3):
+        inference._run_model(image, active)
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        inference._run_model(image, active)
+        timings.append((time.perf_counter() - started) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--small", required=True, help="First-stage model (.h5 or .tflite)")
+    parser.add_argument("--large", required=True, help="Main model (.h5 or .tflite)")
+    parser.add_argument("--dataset", default="dataset/PlantVillage")
+    parser.add_argument("--limit", type=int, default=0, help="Evaluate at most this many validation images")
+    parser.add_argument("--confidences", default="0.5,0.6,0.7,0.8,0.85,0.9,0.95,0.98")
+    parser.add_argument("--margins", default="0,0.1,0.2,0.3")
+    args = parser.parse_args()
+
+    from app.ai_engine import inference, registry
+    from app.ai_engine.dataset_files import list_split
+
+    _, (paths, labels), class_indices = list_split(args.dataset)
+    if args.limit:
+        step = max(1, len(paths) // args.limit)  # spread across classes
+        paths, labels = paths[::step][:args.limit], labels[::step][:args.limit]
+    class_names = sorted(class_indices, key=class_indices.get)
+    truth = np.array(registry.map_labels(class_names, [c["name"] for c in inference.CLASS_INFO]))[labels]
+
+    small, large = load(args.small), load(args.large)
+    small_probs, large_probs = [], []
+    buffer = np.empty((BATCH_SIZE, inference.IMG_SIZE, inference.IMG_SIZE, 3), dtype=np.float32)
+    for start in range(0, len(paths), BATCH_SIZE):
+        chunk = paths[start:start + BATCH_SIZE]
+        for j, path in enumerate(chunk):
+            inference.preprocess_image(path, out=buffer[j])
+        small_probs.append(inference._run_model(buffer[:len(chunk)], small))
+        large_probs.append(inference._run_model(buffer[:len(chunk)], large))
+    small_probs, large_probs = np.concatenate(small_probs), np.concatenate(large_probs)
+    small_pred, large_pred = small_probs.argmax(axis=1), large_probs.argmax(axis=1)
+
+    image = buffer[:1]
+    small_ms, large_ms = latency_ms(small, image), latency_ms(large, image)
+    large_acc = float(np.mean(large_pred == truth))
+
+    print(f"{len(paths)} validation images. Single-image CPU latency: small {small_ms:.2f} ms, large {large_ms:.2f} ms")
+    print(f"small only: accuracy {np.mean(small_pred == truth):.2%}   large only: accuracy {large_acc:.2%}\n")
+    print(f"{'min conf':>8} {'margin':>6} {'escalated':>9} {'avg ms':>7} {'vs large':>8} {'accuracy':>8} {'vs large':>8}")
+    for min_confidence in [float(c) for c in args.confidences.split(",")]:
+        for min_margin in [float(m) for m in args.margins.split(",")]:
+            accepted, _, _ = inference._cascade_gate(small_probs, min_confidence, min_margin)
+            predictions = np.where(accepted, small_pred, large_pred)
+            escalation = 1.0 - float(np.mean(accepted))
+            avg_ms = small_ms + escalation * large_ms
+            accuracy = float(np.mean(predictions == truth))
+            print(f"{min_confidence:8.2f} {min_margin:6.2f} {escalation:9.1%} {avg_ms:7.2f} "
+                  f"{avg_ms / large_ms:7.0%} {accuracy:8.2%} {(accuracy - large_acc) * 100:+7.2f}pp")
+
+
+if __name__ == "__main__":
+    main()
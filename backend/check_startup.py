@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+
+# Startup import report.
+# Imports app.main in a fresh interpreter with `-X importtime`, prints the slowest
+# modules, and exits non-zero if TensorFlow was imported (it must only load
+# together with the model, see ai_engine/backends.import_tf). The regression
+# test for the latter, which also works where TensorFlow is not installed, is
+# tests/test_startup.py.
+#
+#     python check_startup.py [--top 20]
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_times(module):
+    env = dict(os.environ)
+    # In-memory SQLite so the check runs without the real database
+    env.setdefault("DATABASE_URL", "sqlite://")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        raise SystemExit(f"Importing {module} failed")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main():
+    top = int(sys.argv[sys.argv.index("--top") + 1]) if "--top" in sys.argv else 20
+    rows = import_times("app.main")
+    names = {name for name, _, _ in rows}
+
+    total_us = max(cumulative for _, _, cumulative in rows)
+    print(f"import app.main: {total_us / 1e6:.2f}s, {len(rows)} modules")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda r: r[2], reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+
+    print("\napp modules:")
+    for name, self_us, cumulative_us in rows:
+        if name.startswith("app"):
+            print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+
+    if "tensorflow" in names:
+        print("\nFAIL: importing app.main imported tensorflow")
+        sys.exit(1)
+    print("\nOK: tensorflow is not imported at startup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import os
+import sys
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+
+# Adds the newer predictions columns (model version, cascade decision, re-scoring,
+# probability vectors) and the plant_images perceptual hash.
+# The rescore_runs table is created by the API on startup.
+# Safe to re-run. From the backend directory: python migrate_predictions.py
+
+NEW_COLUMNS = {"predictions": [
+    # Nullable: existing rows predate these fields
+    ("model_version", "VARCHAR(64) NULL"),
+    ("first_stage_disease", "VARCHAR(255) NULL"),
+    ("first_stage_confidence", "FLOAT NULL"),
+    ("escalated", "TINYINT(1) NULL"),
+    # Existing rows are the current prediction of their image
+    ("is_current", "TINYINT(1) NOT NULL DEFAULT 1"),
+    # Stored probability vectors; NULL for rows scored before they were kept
+    ("probabilities", "BLOB NULL"),
+    ("label_map", "VARCHAR(16) NULL"),
+], "plant_images": [
+    # Filled for new uploads, and for old ones by python -m app.rescore
+    ("phash", "VARCHAR(16) NULL"),
+]}
+
+# Set unbuffered output
+sys.stdout.reconfigure(line_buffering=True)
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+if not DATABASE_URL:
+    print("No DATABASE_URL found")
+    exit(1)
+
+if "localhost" in DATABASE_URL:
+    DATABASE_URL = DATABASE_URL.replace("localhost", "127.0.0.1")
+
+print(f"Connecting to {DATABASE_URL}...")
+engine = create_engine(DATABASE_URL)
+
+with engine.connect() as conn:
+    print("Connected!")
+    try:
+        for table, new_columns in NEW_COLUMNS.items():
+            print(f"Checking '{table}' table...")
+            result = conn.execute(text(f"DESCRIBE {table}"))
+            columns = [row[0] for row in result.fetchall()]
+            print(f"Current columns: {columns}")
+
+            for name, definition in new_columns:
+                if name not in columns:
+                    print(f"Adding '{name}' column...")
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {definition}"))
+                    print(f"Done adding {name}.")
+                else:
+                    print(f"'{name}' exists.")
+
+        conn.commit()
+        print("Migration complete successfully.")
+
+    except Exception as e:
+        print(f"Error during migration: {e}")
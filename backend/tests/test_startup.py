@@ -0,0 +1,58 @@
+import json
+import os
+import subprocess
+import sys
+
+# Regression check: importing the API must not import TensorFlow (it only loads
+# together with the model, see ai_engine/backends.import_tf). Runs in a fresh
+# interpreter with an import hook that records every attempt to import
+# tensorflow and then refuses it, so the check fails whether or not
+# TensorFlow is installed on the host.
+#
+#     python -m pytest tests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = """
+import importlib.abc, json, sys
+
+attempts = []
+
+class TensorFlowSentinel(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path=None, target=None):
+        if name == "tensorflow" or name.startswith("tensorflow."):
+            attempts.append(name)
+            raise ModuleNotFoundError(f"No module named {name!r} (blocked by test_startup)")
+        return None
+
+sys.meta_path.insert(0, TensorFlowSentinel())
+for module in sys.argv[1:]:
+    try:
+        __import__(module)
+    except ImportError:
+        pass
+print(json.dumps({"attempts": attempts, "loaded": sorted(m for m in sys.modules if m.split(".")[0] == "tensorflow")}))
+"""
+
+
+def _tensorflow_imports(*modules):
+    env = dict(os.environ)
+    # In-memory SQLite so the check runs without the real database
+    env.setdefault("DATABASE_URL", "sqlite://")
+    proc = subprocess.run(
+        [sys.executable, "-c", _PROBE, *modules],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def test_app_main_does_not_import_tensorflow():
+    result = _tensorflow_imports("app.main")
+    assert result == {"attempts": [], "loaded": []}, f"importing app.main imported tensorflow: {result}"
+
+
+def test_sentinel_catches_tensorflow_imports():
+    # The hook itself works, so the test above cannot pass vacuously
+    result = _tensorflow_imports("tensorflow")
+    assert result["attempts"] == ["tensorflow"]
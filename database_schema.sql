@@ -15,6 +15,9 @@ DROP TABLE IF EXISTS `shop_inventory`;
 DROP TABLE IF EXISTS `disease_product_link`;
 DROP TABLE IF EXISTS `fertilizers`;
 DROP TABLE IF EXISTS `disease_info`;
+DROP TABLE IF EXISTS `detection_job_items`;
+DROP TABLE IF EXISTS `detection_jobs`;
+DROP TABLE IF EXISTS `rescore_runs`;
 DROP TABLE IF EXISTS `predictions`;
 DROP TABLE IF EXISTS `plant_images`;
 DROP TABLE IF EXISTS `chatbot_logs`;
@@ -49,6 +52,7 @@ CREATE TABLE `plant_images` (
   `user_id` int(11) DEFAULT NULL,
   `image_url` varchar(500) DEFAULT NULL,
   `upload_date` datetime DEFAULT CURRENT_TIMESTAMP,
+  `phash` varchar(16) DEFAULT NULL, -- 64-bit perceptual hash (hex) of the model input, for near-duplicate reuse
   PRIMARY KEY (`image_id`),
   KEY `user_id` (`user_id`),
   CONSTRAINT `plant_images_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`user_id`) ON DELETE CASCADE
@@ -61,11 +65,79 @@ CREATE TABLE `predictions` (
   `confidence` float DEFAULT NULL,
   `is_healthy` tinyint(1) DEFAULT NULL,
   `severity` varchar(50) DEFAULT 'Low', -- Low, Medium, High
+  `model_version` varchar(64) DEFAULT NULL, -- model bundle/file version, NULL for mock predictions
+  `first_stage_disease` varchar(255) DEFAULT NULL, -- cascade: small model's answer
+  `first_stage_confidence` float DEFAULT NULL,
+  `escalated` tinyint(1) DEFAULT NULL, -- cascade: 1 if the main model decided
+  `is_current` tinyint(1) NOT NULL DEFAULT 1, -- 0 once re-scored by a newer model
+  `probabilities` blob DEFAULT NULL, -- full softmax vector, float16 in label_map order
+  `label_map` varchar(16) DEFAULT NULL, -- id of the class order of `probabilities`
   PRIMARY KEY (`prediction_id`),
   KEY `image_id` (`image_id`),
+  KEY `is_current` (`is_current`),
   CONSTRAINT `predictions_ibfk_1` FOREIGN KEY (`image_id`) REFERENCES `plant_images` (`image_id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
+-- --------------------------------------------------------
+-- Re-scoring progress, one run per model version (`python -m app.rescore`)
+-- --------------------------------------------------------
+CREATE TABLE `rescore_runs` (
+  `run_id` int(11) NOT NULL AUTO_INCREMENT,
+  `model_version` varchar(64) DEFAULT NULL,
+  `status` varchar(50) DEFAULT 'Running', -- Running, Completed
+  `last_image_id` int(11) DEFAULT 0, -- keyset checkpoint
+  `max_image_id` int(11) DEFAULT 0,
+  `rescored` int(11) DEFAULT 0,
+  `changed` int(11) DEFAULT 0,
+  `missing` int(11) DEFAULT 0,
+  `failed` int(11) DEFAULT 0,
+  `created_at` datetime DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` datetime DEFAULT CURRENT_TIMESTAMP,
+  `finished_at` datetime DEFAULT NULL,
+  PRIMARY KEY (`run_id`),
+  UNIQUE KEY `model_version` (`model_version`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- --------------------------------------------------------
+-- Detection Jobs (async queue, processed by `python -m app.worker`)
+-- --------------------------------------------------------
+CREATE TABLE `detection_jobs` (
+  `job_id` int(11) NOT NULL AUTO_INCREMENT,
+  `user_id` int(11) DEFAULT NULL,
+  `status` varchar(50) DEFAULT 'Queued', -- Queued, Running, Completed
+  `total_images` int(11) DEFAULT 0,
+  `processed_images` int(11) DEFAULT 0,
+  `failed_images` int(11) DEFAULT 0,
+  `created_at` datetime DEFAULT CURRENT_TIMESTAMP,
+  `started_at` datetime DEFAULT NULL,
+  `finished_at` datetime DEFAULT NULL,
+  PRIMARY KEY (`job_id`),
+  KEY `user_id` (`user_id`),
+  KEY `status` (`status`),
+  FOREIGN KEY (`user_id`) REFERENCES `users` (`user_id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE `detection_job_items` (
+  `item_id` int(11) NOT NULL AUTO_INCREMENT,
+  `job_id` int(11) DEFAULT NULL,
+  `image_id` int(11) DEFAULT NULL,
+  `filename` varchar(255) DEFAULT NULL,
+  `file_path` varchar(500) DEFAULT NULL,
+  `status` varchar(50) DEFAULT 'Queued', -- Queued, Running, Done, Failed
+  `error` text DEFAULT NULL,
+  `attempts` int(11) DEFAULT 0,
+  `claim_token` varchar(64) DEFAULT NULL,
+  `locked_at` datetime DEFAULT NULL,
+  `finished_at` datetime DEFAULT NULL,
+  PRIMARY KEY (`item_id`),
+  KEY `job_id` (`job_id`),
+  KEY `status` (`status`),
+  KEY `claim_token` (`claim_token`),
+  KEY `finished_at` (`finished_at`),
+  FOREIGN KEY (`job_id`) REFERENCES `detection_jobs` (`job_id`) ON DELETE CASCADE,
+  FOREIGN KEY (`image_id`) REFERENCES `plant_images` (`image_id`) ON DELETE SET NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
 -- --------------------------------------------------------
 -- Disease Info
 -- --------------------------------------------------------